@@ -16,6 +16,116 @@ class Settings(BaseSettings):
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
+    # Create missing tables on startup; deployments should run init_db.py instead
+    AUTO_CREATE_TABLES: bool = os.getenv("AUTO_CREATE_TABLES", "true").lower() == "true"
+    HEALTH_CHECK_INTERVAL_SECONDS: float = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "5"))
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # Per-request SQL instrumentation
+    SQL_DEBUG: bool = os.getenv("SQL_DEBUG", "false").lower() == "true"
+    SQL_STRICT: bool = os.getenv("SQL_STRICT", "false").lower() == "true"
+    SQL_QUERY_BUDGET: int = int(os.getenv("SQL_QUERY_BUDGET", "0"))
+    SQL_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+    SQL_SLOW_STATEMENTS: int = int(os.getenv("SQL_SLOW_STATEMENTS", "3"))
+
+    # Edge backends, as a comma separated list of name=url pairs
+    EDGE_ENDPOINTS: str = os.getenv("EDGE_ENDPOINTS", "default=http://192.168.95.187:5001")
+    EDGE_API_KEY: str = os.getenv("EDGE_API_KEY", "5f427c4bc12f35af8648807151aa2742f5a98a929feebc8827162cc6885a9394")
+    EDGE_TIMEOUT_SECONDS: float = float(os.getenv("EDGE_TIMEOUT_SECONDS", "5"))
+    EDGE_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("EDGE_BREAKER_FAILURE_THRESHOLD", "3"))
+    EDGE_BREAKER_RESET_SECONDS: float = float(os.getenv("EDGE_BREAKER_RESET_SECONDS", "30"))
+    EDGE_SYNC_ENABLED: bool = os.getenv("EDGE_SYNC_ENABLED", "true").lower() == "true"
+    EDGE_SYNC_INTERVAL_SECONDS: float = float(os.getenv("EDGE_SYNC_INTERVAL_SECONDS", "30"))
+
+    # Rate limits per route group, as name=rate:burst with rate in requests per second
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMITS: str = os.getenv("RATE_LIMITS", "sms_send=5:20,auth=1:10,export=0.1:3,listing=20:60,default=20:40")
+    # "memory" or a redis:// URL shared by all workers
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+    # How long responses are kept for Idempotency-Key replays
+    IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # "memory" or a redis:// URL shared by all workers
+    IDEMPOTENCY_BACKEND: str = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+
+    # Per-user change counters behind ETags: "memory" or a redis:// URL shared by all workers
+    VERSION_STORE_BACKEND: str = os.getenv("VERSION_STORE_BACKEND", "memory")
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+    # Per-message latency traces of outbound SMS
+    TRACE_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("TRACE_FLUSH_INTERVAL_SECONDS", "1"))
+    TRACE_RETENTION_DAYS: float = float(os.getenv("TRACE_RETENTION_DAYS", "7"))
+    # How long a delivery report waits for its SMS to be committed
+    TRACE_STATUS_RETRY_SECONDS: float = float(os.getenv("TRACE_STATUS_RETRY_SECONDS", "30"))
+
+    # Admin-only sampling profiler at /api/admin/profile
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    PROFILER_MIN_INTERVAL_MS: float = float(os.getenv("PROFILER_MIN_INTERVAL_MS", "5"))
+
+    # Logs go through a queue to a writer thread; LOG_FORMAT is "json" or "text"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Records per second let through for each per-message log line, 0 for all
+    LOG_PER_MESSAGE_RATE: float = float(os.getenv("LOG_PER_MESSAGE_RATE", "10"))
+
+    # Pack SMS for the same edge into one publish on sms/send/batch; edges must support it
+    MQTT_BATCH_ENABLED: bool = os.getenv("MQTT_BATCH_ENABLED", "false").lower() == "true"
+    MQTT_BATCH_MAX_MESSAGES: int = int(os.getenv("MQTT_BATCH_MAX_MESSAGES", "100"))
+    MQTT_BATCH_MAX_BYTES: int = int(os.getenv("MQTT_BATCH_MAX_BYTES", "131072"))
+    # How long a batch waits for more messages before it is published
+    MQTT_BATCH_LINGER_MS: float = float(os.getenv("MQTT_BATCH_LINGER_MS", "20"))
+    # Publishes waiting for their PUBACK at once, batched or not
+    MQTT_BATCH_MAX_IN_FLIGHT: int = int(os.getenv("MQTT_BATCH_MAX_IN_FLIGHT", "4"))
+    # Share of publishes each priority lane gets while several have messages waiting
+    SMS_PRIORITY_WEIGHTS: str = os.getenv("SMS_PRIORITY_WEIGHTS", "transactional=8,normal=3,bulk=1")
+    # Within a lane, users share publishes in proportion to their plan's weight
+    TENANT_PLAN_WEIGHTS: str = os.getenv("TENANT_PLAN_WEIGHTS", "free=1,standard=2,premium=4")
+    # Messages a weight of 1 may publish per round; raised to the batch size when smaller
+    TENANT_QUANTUM: int = int(os.getenv("TENANT_QUANTUM", "1"))
+
+    # Largest list or CSV accepted by POST /api/sims/bulk
+    SIM_IMPORT_MAX_ROWS: int = int(os.getenv("SIM_IMPORT_MAX_ROWS", "1000"))
+    # SIM health: shed outbound traffic from SIMs whose messages aren't delivered, or too slowly
+    SIM_HEALTH_ENABLED: bool = os.getenv("SIM_HEALTH_ENABLED", "true").lower() == "true"
+    SIM_HEALTH_HALF_LIFE_SECONDS: float = float(os.getenv("SIM_HEALTH_HALF_LIFE_SECONDS", "900"))
+    SIM_HEALTH_MIN_SAMPLES: float = float(os.getenv("SIM_HEALTH_MIN_SAMPLES", "10"))
+    SIM_HEALTH_THRESHOLD: float = float(os.getenv("SIM_HEALTH_THRESHOLD", "0.5"))
+    SIM_HEALTH_LATENCY_TARGET_SECONDS: float = float(os.getenv("SIM_HEALTH_LATENCY_TARGET_SECONDS", "60"))
+    SIM_HEALTH_PROBE_SECONDS: float = float(os.getenv("SIM_HEALTH_PROBE_SECONDS", "60"))
+    SIM_HEALTH_PERSIST_SECONDS: float = float(os.getenv("SIM_HEALTH_PERSIST_SECONDS", "30"))
+
+    # Contact lists: largest list accepted, and the country code given to numbers without one (none by default)
+    CONTACT_LIST_MAX_NUMBERS: int = int(os.getenv("CONTACT_LIST_MAX_NUMBERS", "1000000"))
+    CONTACT_DEFAULT_COUNTRY_CODE: str = os.getenv("CONTACT_DEFAULT_COUNTRY_CODE", "")
+
+    # Rows read per page by the CSV/NDJSON exports
+    EXPORT_CHUNK_ROWS: int = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+    # Scheduled SMS: how often the leader looks for due messages, and how fast it releases them
+    SCHEDULE_POLL_SECONDS: float = float(os.getenv("SCHEDULE_POLL_SECONDS", "1"))
+    SCHEDULE_BATCH_SIZE: int = int(os.getenv("SCHEDULE_BATCH_SIZE", "500"))
+    SCHEDULE_MAX_RATE: float = float(os.getenv("SCHEDULE_MAX_RATE", "200"))
+    # Claimed messages without a publish outcome after this long are scheduled again
+    SCHEDULE_CLAIM_TIMEOUT_SECONDS: float = float(os.getenv("SCHEDULE_CLAIM_TIMEOUT_SECONDS", "300"))
+
+    # Worker processes started by serve.py; more than one turns off per-process state
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # Lease that elects the process running singleton background jobs
+    LEADER_LEASE_SECONDS: float = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+    LEADER_RENEW_SECONDS: float = float(os.getenv("LEADER_RENEW_SECONDS", "5"))
+
+    # Event streams: frames a stream may fall behind before it is told to resync, and the keep-alive interval
+    EVENTS_QUEUE_SIZE: int = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+    EVENTS_HEARTBEAT_SECONDS: float = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+    # Streams end after this long and the client reconnects, so shutdowns and new workers aren't held up by old streams
+    EVENTS_STREAM_MAX_SECONDS: float = float(os.getenv("EVENTS_STREAM_MAX_SECONDS", "300"))
+    # Exchange events between workers through the broker; needed with several workers or nodes
+    EVENTS_RELAY_ENABLED: bool = os.getenv("EVENTS_RELAY_ENABLED", str(WEB_CONCURRENCY > 1)).lower() == "true"
+    # Share SIM breaker openings and recoveries between workers; needed with several workers or nodes
+    SIM_HEALTH_RELAY_ENABLED: bool = os.getenv("SIM_HEALTH_RELAY_ENABLED", str(WEB_CONCURRENCY > 1)).lower() == "true"
 
     class Config:
         case_sensitive = True
@@ -28,6 +28,9 @@ def get_db():
     finally:
         db.close()
 
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+
 def recreate_tables():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine) 
\ No newline at end of file
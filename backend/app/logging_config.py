@@ -0,0 +1,139 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from .config import get_settings
+from .services import metrics
+
+settings = get_settings()
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Loggers with one record per SMS; RateLimitFilter keeps them from flooding
+PER_MESSAGE_LOGGERS = ("app.services.mqtt.messages",)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most ``rate`` records per second through for each message
+    template, with bursts of up to ``rate`` records.
+
+    Dropped records are counted and the count is attached to the next record
+    let through as ``suppressed``. Templates are compared before formatting,
+    so a dropped record costs a dictionary lookup.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._buckets: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # Tokens, last refill time, suppressed records
+                bucket = self._buckets[key] = [self.rate, now, 0]
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without formatting them.
+
+    The stock QueueHandler formats every record in the logging thread so that
+    it can be pickled; this queue never leaves the process, so formatting is
+    left to the writer. When the queue is full the record is dropped rather
+    than blocking the caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.log_records_dropped_total.inc()
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging():
+    """
+    Route the app's logs through a queue to a background writer thread.
+
+    Calling code only pays for building the record and a queue put; message
+    formatting, JSON encoding and the write to stderr happen on the writer
+    thread. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+
+    if _queue_handler is None:
+        log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        if settings.LOG_FORMAT == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+        for name in PER_MESSAGE_LOGGERS:
+            logging.getLogger(name).addFilter(RateLimitFilter(settings.LOG_PER_MESSAGE_RATE))
+        metrics.background_queue_depth.set_function(log_queue.qsize, "log")
+
+    if _listener._thread is None:
+        _listener.start()
+
+
+def shutdown_logging():
+    """Write the queued records and stop the writer thread"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
@@ -1,16 +1,32 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from .database import engine, Base
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from .database import create_tables
 from . import models
-from .routers import auth_router, api_keys_router, wallets_router, sims_router, sms_router
+from .routers import (
+    auth_router, api_keys_router, wallets_router, sims_router, sms_router, health_router, metrics_router,
+    traces_router, profiler_router, events_router, contact_lists_router
+)
 from .config import get_settings
+from .logging_config import configure_logging, shutdown_logging
+from .middleware import (
+    RateLimitMiddleware, IdempotencyMiddleware, ResponseCacheMiddleware, MetricsMiddleware, RequestStatsMiddleware
+)
+from .services.versioning import CachedResponse
+from .services.inventory_sync import inventory_synchronizer
+from .services.health import health_monitor
+from .services.mqtt import mqtt_service
+from .services.tracing import message_tracer
+from .services.leader import leader_elector
+from .services.inbound import handle_inbound_message
+from .services.batching import sms_batcher, handle_batch_ack
+from .services.scheduler import scheduled_dispatcher
+from .services.events import event_bus
+from .services.sim_health import sim_health
 
 settings = get_settings()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="Cloud Server API",
     description="Backend API for Cloud Server application",
@@ -21,6 +37,20 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(IdempotencyMiddleware)
+
+# Rate limiting sits inside CORS so that 429 responses carry CORS headers,
+# and outside idempotency so that retries count against the limits
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
+# Outside rate limiting so that rejected requests are measured too
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+# Collects the SQL statements that the metrics above report per route
+app.add_middleware(RequestStatsMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +66,59 @@ app.include_router(api_keys_router, prefix="/api/api-keys", tags=["api-keys"])
 app.include_router(wallets_router, prefix="/api/wallets", tags=["wallets"])
 app.include_router(sims_router, prefix="/api/sims", tags=["sims"])
 app.include_router(sms_router, prefix="/api/sms", tags=["sms"])
+app.include_router(traces_router, prefix="/api/traces", tags=["traces"])
+app.include_router(events_router, prefix="/api/events", tags=["events"])
+app.include_router(contact_lists_router, prefix="/api/contact-lists", tags=["contact-lists"])
+app.include_router(health_router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router)
+if settings.PROFILER_ENABLED:
+    app.include_router(profiler_router, prefix="/api/admin", tags=["admin"])
+
+# Background jobs that must run in a single process across all workers and nodes
+if settings.EDGE_SYNC_ENABLED:
+    leader_elector.add_job(inventory_synchronizer.start, inventory_synchronizer.stop)
+leader_elector.add_job(scheduled_dispatcher.start, scheduled_dispatcher.stop)
+leader_elector.add_job(sim_health.start, sim_health.stop)
+
+# Every worker consumes through shared subscriptions, so the broker spreads
+# delivery reports and inbound SMS across workers and nodes
+mqtt_service.subscribe("sms/status", message_tracer.handle_status_report)
+mqtt_service.subscribe("sms/inbound", handle_inbound_message)
+mqtt_service.subscribe("sms/ack", handle_batch_ack)
+# Retained, and needed by every worker to pick the payload encoding per edge
+mqtt_service.subscribe("edges/+/capabilities", mqtt_service.handle_capabilities, shared=False)
+# Delivery reports and inbound SMS may land on another worker than the user's event stream
+if settings.EVENTS_RELAY_ENABLED:
+    event_bus.enable_relay(mqtt_service)
+# A probe's delivery report may land on another worker than the one that opened the breaker
+if settings.SIM_HEALTH_RELAY_ENABLED:
+    sim_health.enable_relay(mqtt_service)
+
+@app.on_event("startup")
+async def startup_event():
+    """Start background services without waiting on external dependencies"""
+    configure_logging()
+    if settings.AUTO_CREATE_TABLES:
+        await run_in_threadpool(create_tables)
+    await run_in_threadpool(sim_health.load)
+    message_tracer.start()
+    event_bus.start()
+    mqtt_service.start()
+    sms_batcher.start()
+    leader_elector.start()
+    health_monitor.start()
+    health_monitor.mark_started()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background services"""
+    await health_monitor.stop()
+    await leader_elector.stop()
+    await run_in_threadpool(sms_batcher.stop)
+    await run_in_threadpool(mqtt_service.disconnect)
+    await message_tracer.stop()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -45,6 +128,14 @@ async def root():
         "docs_url": "/docs"
     }
 
+@app.exception_handler(CachedResponse)
+async def cached_response_handler(request: Request, exc: CachedResponse):
+    return Response(
+        content=exc.body,
+        media_type="application/json",
+        headers={"ETag": exc.etag}
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
@@ -0,0 +1,13 @@
+from .rate_limit import RateLimitMiddleware
+from .idempotency import IdempotencyMiddleware
+from .response_cache import ResponseCacheMiddleware
+from .metrics import MetricsMiddleware
+from .request_stats import RequestStatsMiddleware
+
+__all__ = [
+    "RateLimitMiddleware",
+    "IdempotencyMiddleware",
+    "ResponseCacheMiddleware",
+    "MetricsMiddleware",
+    "RequestStatsMiddleware"
+]
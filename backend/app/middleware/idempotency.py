@@ -0,0 +1,241 @@
+import asyncio
+import base64
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import List, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Endpoints honouring the Idempotency-Key header
+IDEMPOTENT_ROUTES = {
+    ("POST", "/api/sms/send"),
+    ("POST", "/api/sms/send-list"),
+    ("POST", "/api/wallets/transactions"),
+}
+
+
+@dataclass
+class IdempotencyEntry:
+    fingerprint: str
+    expires_at: float = 0
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    status: Optional[int] = None
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+
+class IdempotencyStore:
+    """
+    In-memory store of responses keyed by idempotency key.
+
+    Entries share one TTL, so insertion order is also expiry order and
+    eviction only ever looks at the oldest entries.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            # Never evict a request that is still running
+            if not entry.done.is_set():
+                break
+            self._entries.popitem(last=False)
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[IdempotencyEntry]:
+        """
+        Claim ``key`` for a new request and return None, or return the
+        response stored for it, waiting while the first request still runs
+        """
+        while True:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = IdempotencyEntry(fingerprint=fingerprint, expires_at=time.monotonic() + self.ttl)
+                return None
+            await entry.done.wait()
+            if entry.status is not None:
+                return entry
+            # The first request failed without a stored response; run again
+
+    async def complete(self, key: str, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        entry = self._entries[key]
+        entry.status, entry.headers, entry.body = status, headers, body
+        entry.done.set()
+
+    async def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            # Waiting duplicates see no stored response and run themselves
+            entry.status = None
+            entry.done.set()
+
+
+class RedisIdempotencyStore:
+    """
+    Responses kept in Redis, shared by every worker.
+
+    A claim is a short-lived marker set with NX; duplicates poll until the
+    marker turns into a stored response or disappears. The marker expires on
+    its own if the worker running the request dies. Requires the optional
+    ``redis`` package.
+    """
+
+    # How long a running request holds its key, and how often duplicates check it
+    CLAIM_SECONDS = 120
+    POLL_SECONDS = 0.1
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// IDEMPOTENCY_BACKEND")
+        self.ttl = ttl
+        self._client = redis.from_url(url)
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[IdempotencyEntry]:
+        key = f"idempotency:{key}"
+        marker = json.dumps({"fingerprint": fingerprint})
+        while True:
+            if await self._client.set(key, marker, nx=True, ex=self.CLAIM_SECONDS):
+                return None
+            value = await self._client.get(key)
+            if value is None:
+                continue
+            stored = json.loads(value)
+            if "status" in stored:
+                return IdempotencyEntry(
+                    fingerprint=stored["fingerprint"],
+                    status=stored["status"],
+                    headers=[(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]],
+                    body=base64.b64decode(stored["body"]),
+                )
+            await asyncio.sleep(self.POLL_SECONDS)
+
+    async def complete(self, key: str, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        stored = {
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers],
+            "body": base64.b64encode(body).decode(),
+        }
+        await self._client.set(f"idempotency:{key}", json.dumps(stored), ex=max(1, int(self.ttl)))
+
+    async def discard(self, key: str):
+        await self._client.delete(f"idempotency:{key}")
+
+
+def create_store(spec: str, ttl: float):
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisIdempotencyStore(spec, ttl)
+    return IdempotencyStore(ttl)
+
+
+def _caller(headers: dict) -> bytes:
+    """
+    The principal a request acts for: the user of a valid bearer token, so
+    that a retry after a token refresh maps to the same key, else the API key
+    """
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:].strip(), settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            payload = {}
+        if payload.get("sub"):
+            return f"user:{payload['sub']}".encode()
+    # Requests without a valid token are rejected by the endpoint anyway
+    return b"credentials:" + headers.get(b"authorization", b"") + b"|" + headers.get(b"x-api-key", b"")
+
+
+def _json_response(status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    return status, [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())], body
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware implementing the ``Idempotency-Key`` header.
+
+    The first request with a key runs normally and its response is stored.
+    Retries with the same key get the stored response without re-running the
+    endpoint; retries that arrive while the first request is still running
+    wait for it. Server errors are not stored so that they can be retried.
+    """
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store or create_store(settings.IDEMPOTENCY_BACKEND, settings.IDEMPOTENCY_TTL_SECONDS)
+
+    async def _send_stored(self, send, status: int, headers, body: bytes, replayed: bool = False):
+        if replayed:
+            headers = headers + [(b"idempotent-replayed", b"true")]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+
+        # Keys are scoped to the caller so clients cannot collide
+        caller = _caller(headers)
+        key = sha256(caller + b"|" + scope["path"].encode() + b"|" + idempotency_key).hexdigest()
+
+        # Read the body up front to fingerprint it, then hand it to the app
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        request_body = b"".join(chunks)
+        fingerprint = sha256(request_body).hexdigest()
+
+        async def replay_receive():
+            return {"type": "http.request", "body": request_body, "more_body": False}
+
+        entry = await self.store.claim(key, fingerprint)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                return await self._send_stored(send, *_json_response(
+                    422, "Idempotency-Key was already used with a different request body"
+                ))
+            return await self._send_stored(send, entry.status, entry.headers, entry.body, replayed=True)
+
+        response = {}
+        body_chunks = []
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                body_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await self.store.discard(key)
+            raise
+        if response.get("status", 500) >= 500:
+            await self.store.discard(key)
+            return
+        await self.store.complete(key, fingerprint, response["status"], response["headers"], b"".join(body_chunks))
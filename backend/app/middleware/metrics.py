@@ -0,0 +1,52 @@
+import time
+
+from ..services import metrics
+from ..services.request_stats import RequestStats, current_request_stats
+
+
+class MetricsMiddleware:
+    """
+    Records latency, in-flight requests and DB work per route.
+
+    Routes are labelled by their path template (``/api/sims/{sim_id}``) so
+    label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def record_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # Normally created by RequestStatsMiddleware further out
+        stats = current_request_stats.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = current_request_stats.set(stats)
+        metrics.http_requests_in_flight.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, record_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            metrics.http_requests_in_flight.dec()
+            if token is not None:
+                current_request_stats.reset(token)
+
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            metrics.http_requests_total.labels(method, route_path, str(status_code)).inc()
+            metrics.http_request_duration_seconds.labels(method, route_path).observe(elapsed)
+            metrics.http_request_db_queries.labels(route_path).observe(stats.queries)
+            metrics.http_request_db_duration_seconds.labels(route_path).observe(stats.db_time)
@@ -0,0 +1,215 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class RateLimit:
+    rate: float   # Tokens added per second
+    burst: int    # Bucket size
+
+
+@dataclass
+class RouteGroup:
+    name: str
+    methods: Tuple[str, ...]
+    prefix: str
+
+
+# First matching group wins; requests outside /api are not limited
+ROUTE_GROUPS = [
+    RouteGroup("sms_send", ("POST",), "/api/sms/send"),
+    RouteGroup("auth", ("POST",), "/api/auth/"),
+    RouteGroup("export", ("GET",), "/api/sms/export"),
+    RouteGroup("export", ("GET",), "/api/wallets/transactions/export"),
+    RouteGroup("listing", ("GET",), "/api/"),
+    RouteGroup("default", ("GET", "POST", "PUT", "PATCH", "DELETE"), "/api/"),
+]
+
+
+def parse_rate_limits(raw: str) -> Dict[str, RateLimit]:
+    """
+    Parse the RATE_LIMITS setting, e.g. ``sms_send=5:20,listing=20:60``.
+    A rate of 0 leaves the group unlimited.
+    """
+    limits = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, spec = entry.split("=", 1)
+        rate, _, burst = spec.partition(":")
+        rate = float(rate)
+        if rate <= 0:
+            continue
+        limits[name.strip()] = RateLimit(rate=rate, burst=int(burst) if burst else max(1, math.ceil(rate)))
+    return limits
+
+
+class MemoryRateLimitBackend:
+    """
+    Token buckets kept in process memory.
+
+    Buckets live in an LRU bounded by ``max_keys`` so idle clients are
+    forgotten without a sweep.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        """Take a token; return 0 if allowed, else the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets kept in Redis, shared by every worker.
+
+    Requires the optional ``redis`` package.
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// RATE_LIMIT_BACKEND")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        return float(await self._script(keys=[f"ratelimit:{key}"], args=[limit.rate, limit.burst]))
+
+
+def create_backend(spec: str):
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisRateLimitBackend(spec)
+    return MemoryRateLimitBackend()
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying per-user and per-API-key token buckets.
+
+    Identities are taken from the bearer token (decoded, not looked up) and
+    the ``X-API-Key`` header, falling back to the client address, so the
+    check is constant time and never touches the database.
+    """
+
+    def __init__(self, app, limits: Optional[Dict[str, RateLimit]] = None, backend=None):
+        self.app = app
+        self.limits = limits if limits is not None else parse_rate_limits(settings.RATE_LIMITS)
+        self.backend = backend or create_backend(settings.RATE_LIMIT_BACKEND)
+        self._subjects: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+    def _match_group(self, method: str, path: str) -> Optional[RouteGroup]:
+        for group in ROUTE_GROUPS:
+            if method in group.methods and path.startswith(group.prefix):
+                return group
+        return None
+
+    def _token_subject(self, token: str) -> Optional[str]:
+        # Cache decoded tokens; a client reuses the same token for many requests
+        if token in self._subjects:
+            return self._subjects[token]
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            subject = payload.get("sub")
+        except JWTError:
+            subject = None
+        self._subjects[token] = subject
+        if len(self._subjects) > 10_000:
+            self._subjects.popitem(last=False)
+        return subject
+
+    def _identities(self, scope) -> List[str]:
+        headers = dict(scope["headers"])
+        identities = []
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.lower().startswith("bearer "):
+            subject = self._token_subject(authorization[7:].strip())
+            if subject:
+                identities.append(f"user:{subject}")
+        api_key = headers.get(b"x-api-key")
+        if api_key:
+            identities.append(f"key:{sha256(api_key).hexdigest()[:32]}")
+        if not identities:
+            client = scope.get("client")
+            identities.append(f"ip:{client[0] if client else 'unknown'}")
+        return identities
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        group = self._match_group(scope["method"], scope["path"])
+        limit = self.limits.get(group.name) if group else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        retry_after = 0.0
+        for identity in self._identities(scope):
+            retry_after = max(retry_after, await self.backend.hit(f"{group.name}:{identity}", limit))
+
+        if retry_after > 0:
+            body = json.dumps({"detail": "Rate limit exceeded"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        await self.app(scope, receive, send)
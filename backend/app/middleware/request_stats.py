@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+
+from ..config import get_settings
+from ..services.request_stats import RequestStats, current_request_stats
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class RequestStatsMiddleware:
+    """
+    Collects the SQL statements run by each request.
+
+    Every request gets a structured DEBUG log record with its query count,
+    DB time and slowest statements. In SQL_DEBUG mode the figures are also
+    returned as ``X-DB-*`` response headers and statements repeated with
+    different parameters (the N+1 signature) are logged as warnings. In
+    SQL_STRICT mode a request that exceeds SQL_QUERY_BUDGET or shows the N+1
+    signature is answered with a 500 so that tests fail.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(track_statements=settings.SQL_DEBUG or settings.SQL_STRICT)
+        token = current_request_stats.set(stats)
+        started_at = time.perf_counter()
+        status_code = 500
+        violation = None
+
+        async def send_with_stats(message):
+            nonlocal status_code, violation
+            if message["type"] == "http.response.start":
+                if settings.SQL_STRICT:
+                    try:
+                        stats.check()
+                    except AssertionError as e:
+                        violation = str(e)
+                        body = json.dumps({"detail": violation}).encode()
+                        status_code = 500
+                        await send({
+                            "type": "http.response.start",
+                            "status": 500,
+                            "headers": [
+                                (b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode()),
+                            ],
+                        })
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                status_code = message["status"]
+                if settings.SQL_DEBUG:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-query-count", str(stats.queries).encode()),
+                        (b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()),
+                        (b"x-db-repeated-statements", str(len(stats.repeated_statements())).encode()),
+                    ]
+            elif violation is not None:
+                # The original response was replaced
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_request_stats.reset(token)
+            self._log(scope, stats, status_code, time.perf_counter() - started_at)
+
+    def _log(self, scope, stats: RequestStats, status_code: int, elapsed: float):
+        repeated = stats.repeated_statements() if stats.track_statements else {}
+        level = logging.WARNING if repeated else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        route = getattr(scope.get("route"), "path", scope["path"])
+        fields = {
+            "method": scope["method"],
+            "route": route,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_queries": stats.queries,
+            "db_time_ms": round(stats.db_time * 1000, 2),
+            "db_slowest": [
+                {"ms": round(duration * 1000, 2), "statement": statement}
+                for duration, statement in stats.slowest
+            ],
+        }
+        if repeated:
+            fields["db_repeated_statements"] = repeated
+            logger.warning(
+                f"Possible N+1 queries in {scope['method']} {route}: {len(repeated)} repeated statements",
+                extra=fields
+            )
+        else:
+            logger.debug(f"{scope['method']} {route} {status_code}", extra=fields)
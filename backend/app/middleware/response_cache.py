@@ -0,0 +1,37 @@
+from ..services.versioning import response_cache
+
+
+class ResponseCacheMiddleware:
+    """
+    Stores rendered bodies of responses marked cacheable by ``conditional_get``.
+
+    The endpoint only sets ``request.state.response_cache_key``; the body is
+    captured here after serialization so the cache holds exactly the bytes
+    that were sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or response_cache is None:
+            return await self.app(scope, receive, send)
+
+        state = scope.setdefault("state", {})
+        cache_key = None
+        body_chunks = []
+
+        async def capture_send(message):
+            nonlocal cache_key
+            if message["type"] == "http.response.start":
+                # The endpoint has run by now; streams such as SSE and exports
+                # never set a key and are passed through without buffering
+                if message["status"] == 200:
+                    cache_key = state.get("response_cache_key")
+            elif message["type"] == "http.response.body" and cache_key:
+                body_chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, capture_send)
+        if cache_key:
+            response_cache.set(cache_key, b"".join(body_chunks))
@@ -2,8 +2,14 @@ from ..database import Base
 from .user import User
 from .wallet import Wallet, Transaction, TransactionType, TransactionStatus
 from .sim import Sim, SimStatus
-from .sms import SMS, SMSStatus, SMSDirection
+from .sms import SMS, SMSStatus, SMSDirection, SMSPriority
 from .api_key import ApiKey
+from .edge_sim import EdgeSim
+from .message_trace import MessageTrace, TRACE_STAGES
+from .lease import Lease
+from .sim_health import SimHealth
+from .contact_list import ContactList
+from .list_send import ListSend, ListSendStatus
 
 # This ensures all models are imported and available when importing from models
 __all__ = [
@@ -18,5 +24,14 @@ __all__ = [
     'SMS',
     'SMSStatus',
     'SMSDirection',
-    'ApiKey'
+    'SMSPriority',
+    'ApiKey',
+    'EdgeSim',
+    'MessageTrace',
+    'TRACE_STAGES',
+    'Lease',
+    'SimHealth',
+    'ContactList',
+    'ListSend',
+    'ListSendStatus'
 ] 
\ No newline at end of file
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func
+from ..database import Base
+
+class ContactList(Base):
+    """Recipients uploaded once and reused by list sends, see app.services.contacts"""
+    __tablename__ = "contact_lists"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    name = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    # Sorted, unique E.164 numbers as little-endian 64-bit integers; only loaded when used
+    numbers = deferred(Column(LargeBinary, nullable=False))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
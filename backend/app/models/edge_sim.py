@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from ..database import Base
+
+class EdgeSim(Base):
+    """Local copy of the SIM cards reported by the edge backends"""
+    __tablename__ = "edge_sims"
+
+    id = Column(Integer, primary_key=True, index=True)
+    edge = Column(String, index=True, nullable=False)
+    edge_sim_id = Column(String, unique=True, index=True, nullable=False)  # Used as the SIM's ICCID
+    phone_number = Column(String, index=True)
+    status = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, DateTime
+from ..database import Base
+
+class Lease(Base):
+    """Time limited ownership of a named singleton job, see LeaderElector"""
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)  # host:pid:nonce of the owning process
+    expires_at = Column(DateTime, nullable=False)
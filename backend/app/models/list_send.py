@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Index
+from sqlalchemy.sql import func
+from ..database import Base
+from .sms import SMSPriority
+import enum
+
+class ListSendStatus(str, enum.Enum):
+    SCHEDULED = "scheduled"  # Numbers left to turn into SMS
+    DONE = "done"            # Every number has its SMS
+
+class ListSend(Base):
+    """
+    A send of one content to every number of a contact list. The scheduled
+    dispatcher turns it into SMS rows a chunk at a time, from ``position``.
+    """
+    __tablename__ = "list_sends"
+    __table_args__ = (
+        # The scheduled dispatcher reads due sends in send_at order
+        Index("ix_list_sends_status_send_at", "status", "send_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    contact_list_id = Column(Integer, ForeignKey("contact_lists.id", ondelete="SET NULL"), index=True, nullable=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"))
+    batch_id = Column(String, unique=True, nullable=False)  # Message ids are batch_id-<position>
+    content = Column(Text, nullable=False)
+    encoding = Column(String, nullable=True)
+    segments = Column(Integer, nullable=True)
+    priority = Column(Enum(SMSPriority), default=SMSPriority.NORMAL)
+    sim_ids = Column(String, nullable=False)  # Comma separated; number i goes through sim_ids[i % len]
+    count = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False, default=0)  # Numbers already turned into SMS
+    status = Column(Enum(ListSendStatus), default=ListSendStatus.SCHEDULED)
+    send_at = Column(DateTime, nullable=False)  # UTC
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from ..database import Base
+
+# Stages of an outbound SMS in the order they happen
+TRACE_STAGES = ("accepted", "enqueued", "published", "acked", "edge_received", "delivered")
+
+class MessageTrace(Base):
+    """Timestamps of an outbound SMS at every stage between the API and the carrier"""
+    __tablename__ = "message_traces"
+
+    message_id = Column(String, primary_key=True)  # Same as SMS.message_id and the MQTT payload
+    user_id = Column(Integer, index=True)
+    sim_number = Column(String, index=True)
+    edge = Column(String, index=True)
+    status = Column(String)  # Last status reported by the edge
+    accepted_at = Column(DateTime(timezone=True), index=True)  # API accepted the request
+    enqueued_at = Column(DateTime(timezone=True))  # Handed to the MQTT client
+    published_at = Column(DateTime(timezone=True))  # MQTT client queued it on the socket
+    acked_at = Column(DateTime(timezone=True))  # Broker acknowledged it (PUBACK)
+    edge_received_at = Column(DateTime(timezone=True))  # Edge reported receipt
+    delivered_at = Column(DateTime(timezone=True))  # Edge reported carrier delivery
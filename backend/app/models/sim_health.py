@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+from ..database import Base
+
+class SimHealth(Base):
+    """Last persisted health of a SIM, see SimHealthTracker"""
+    __tablename__ = "sim_health"
+
+    sim_id = Column(Integer, ForeignKey("sims.id"), primary_key=True)
+    state = Column(String, nullable=False)  # healthy or unhealthy
+    score = Column(Float, nullable=True)  # Null until there are enough outcomes
+    # Decayed counts of publishes and delivery reports
+    published = Column(Float, nullable=False, default=0)
+    delivered = Column(Float, nullable=False, default=0)
+    failed = Column(Float, nullable=False, default=0)
+    publish_failures = Column(Float, nullable=False, default=0)
+    latency_seconds = Column(Float, nullable=True)  # Moving average from publish to delivery
+    opened_at = Column(DateTime, nullable=True)  # When the SIM was found unhealthy
+    updated_at = Column(DateTime, nullable=False)
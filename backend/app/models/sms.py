@@ -1,37 +1,53 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 import enum
 
 class SMSStatus(str, enum.Enum):
+    SCHEDULED = "scheduled"  # Waiting for its send_at
     PENDING = "pending"
     SENT = "sent"
     DELIVERED = "delivered"
     FAILED = "failed"
     RECEIVED = "received"
 
+class SMSPriority(str, enum.Enum):
+    TRANSACTIONAL = "transactional"  # OTPs and alerts; never wait behind other traffic
+    NORMAL = "normal"
+    BULK = "bulk"                    # Campaigns
+
 class SMSDirection(str, enum.Enum):
     OUTBOUND = "outbound"  # Message sent from our system
     INBOUND = "inbound"    # Message received by our system
 
 class SMS(Base):
     __tablename__ = "sms"
+    __table_args__ = (
+        # The scheduled dispatcher reads due messages in send_at order
+        Index("ix_sms_status_send_at", "status", "send_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     sim_id = Column(Integer, ForeignKey("sims.id"))
     transaction_id = Column(Integer, ForeignKey('transactions.id'))
+    message_id = Column(String, unique=True, index=True, nullable=True)  # Trace id shared with the MQTT payload
     
     # Message details
     direction = Column(Enum(SMSDirection))
     status = Column(Enum(SMSStatus), default=SMSStatus.PENDING)
+    priority = Column(Enum(SMSPriority), default=SMSPriority.NORMAL)
     recipient_number = Column(String)  # For outbound messages
     sender_number = Column(String)     # For inbound messages
     content = Column(Text)
+    encoding = Column(String, nullable=True)  # gsm7 or ucs2
+    segments = Column(Integer, nullable=True)  # Parts the content is sent as
     price = Column(Integer, default=0)  # Price in cents
     
     # Timestamps
+    send_at = Column(DateTime, nullable=True)  # UTC; set for scheduled messages
+    claimed_at = Column(DateTime, nullable=True)  # UTC; when the scheduled dispatcher took it
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
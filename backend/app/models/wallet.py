@@ -32,7 +32,7 @@ class Transaction(Base):
     __table_args__ = {'extend_existing': True}
 
     id = Column(Integer, primary_key=True, index=True)
-    wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=False)  # Make it required
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=False, index=True)  # Make it required
     type = Column(Enum(TransactionType))
     amount = Column(Numeric(10, 2))
     description = Column(String)
@@ -3,11 +3,23 @@ from .api_keys import router as api_keys_router
 from .wallets import router as wallets_router
 from .sims import router as sims_router
 from .sms import router as sms_router
+from .health import router as health_router
+from .metrics import router as metrics_router
+from .traces import router as traces_router
+from .profiler import router as profiler_router
+from .events import router as events_router
+from .contact_lists import router as contact_lists_router
 
 __all__ = [
     "auth_router",
     "api_keys_router",
     "wallets_router",
     "sims_router", 
-    "sms_router"
+    "sms_router",
+    "health_router",
+    "metrics_router",
+    "traces_router",
+    "profiler_router",
+    "events_router",
+    "contact_lists_router"
 ] 
\ No newline at end of file
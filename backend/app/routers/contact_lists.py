@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+import csv
+import io
+import json
+from ..database import get_db
+from ..config import get_settings
+from ..models.user import User
+from ..models.contact_list import ContactList
+from ..models.list_send import ListSend, ListSendStatus
+from ..schemas.contact_list import (
+    ContactList as ContactListSchema, ContactListCreate, ContactListUpload, ContactListNumbers
+)
+from ..auth.dependencies import get_current_active_user
+from ..services.contacts import format_number, from_blob, pack_numbers, to_blob
+
+settings = get_settings()
+router = APIRouter(tags=["contact-lists"])
+
+def _parse_upload(content_type: str, body: bytes, name: Optional[str]) -> ContactListCreate:
+    if content_type.startswith(("text/csv", "text/plain")):
+        # The first column of every row; a header row is skipped
+        rows = csv.reader(io.StringIO(body.decode("utf-8-sig")))
+        numbers = [row[0] for row in rows if row]
+        if numbers and not any(char.isdigit() for char in numbers[0]):
+            numbers = numbers[1:]
+        return ContactListCreate(name=name or "Contacts", numbers=numbers)
+    data = json.loads(body)
+    if name is not None and isinstance(data, dict):
+        data.setdefault("name", name)
+    return ContactListCreate.model_validate(data)
+
+@router.post("/", response_model=ContactListUpload)
+async def create_contact_list(
+    request: Request,
+    name: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload a contact list as JSON (``{"name": ..., "numbers": [...]}``) or, with
+    ``Content-Type: text/csv`` or ``text/plain`` and a ``name`` query
+    parameter, as a file with a number in the first column of every row.
+    Numbers are normalized to E.164 and deduplicated.
+    """
+    body = await request.body()
+    try:
+        upload = _parse_upload(request.headers.get("content-type", ""), body, name)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not parse contact list: {str(e)}"
+        )
+    if len(upload.numbers) > settings.CONTACT_LIST_MAX_NUMBERS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.CONTACT_LIST_MAX_NUMBERS} numbers per list"
+        )
+
+    numbers, invalid, duplicates = await run_in_threadpool(pack_numbers, upload.numbers)
+    if not numbers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The list has no valid phone numbers"
+        )
+
+    contact_list = ContactList(
+        user_id=current_user.id,
+        name=upload.name,
+        count=len(numbers),
+        numbers=to_blob(numbers)
+    )
+    db.add(contact_list)
+    db.commit()
+    db.refresh(contact_list)
+    return {
+        **ContactListSchema.model_validate(contact_list).model_dump(),
+        "invalid": invalid,
+        "duplicates": duplicates
+    }
+
+@router.get("/", response_model=List[ContactListSchema])
+def read_contact_lists(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Contact lists of the current user, without their numbers"""
+    return db.query(ContactList).filter(ContactList.user_id == current_user.id).order_by(ContactList.id).all()
+
+def _get_contact_list(db: Session, list_id: int, user: User) -> ContactList:
+    contact_list = db.query(ContactList).filter(
+        ContactList.id == list_id,
+        ContactList.user_id == user.id
+    ).first()
+    if not contact_list:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Contact list not found"
+        )
+    return contact_list
+
+@router.get("/{list_id}", response_model=ContactListSchema)
+def read_contact_list(
+    list_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    return _get_contact_list(db, list_id, current_user)
+
+@router.get("/{list_id}/numbers", response_model=ContactListNumbers)
+def read_contact_list_numbers(
+    list_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """A page of the list's numbers, read from the stored array without loading all of it"""
+    contact_list = _get_contact_list(db, list_id, current_user)
+    # 8 bytes per number; substr counts from 1
+    page = db.query(func.substr(ContactList.numbers, skip * 8 + 1, limit * 8)).filter(
+        ContactList.id == contact_list.id
+    ).scalar()
+    return {
+        "id": contact_list.id,
+        "count": contact_list.count,
+        "numbers": [format_number(number) for number in from_blob(page or b"")]
+    }
+
+@router.delete("/{list_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_contact_list(
+    list_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a contact list; lists still being sent to are kept until their sends are done"""
+    contact_list = _get_contact_list(db, list_id, current_user)
+    sending = db.query(ListSend.id).filter(
+        ListSend.contact_list_id == contact_list.id,
+        ListSend.status == ListSendStatus.SCHEDULED
+    ).first()
+    if sending:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The contact list is still being sent to"
+        )
+    db.delete(contact_list)
+    db.commit()
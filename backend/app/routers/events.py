@@ -0,0 +1,43 @@
+import asyncio
+import time
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from ..auth.dependencies import get_current_active_user
+from ..config import get_settings
+from ..models.user import User
+from ..services.events import HEARTBEAT_FRAME, event_bus
+
+router = APIRouter(tags=["events"])
+settings = get_settings()
+
+async def _stream(user_id: int):
+    # Subscribed once the response starts streaming, so that a client gone
+    # before then leaves no queue behind
+    queue = event_bus.subscribe(user_id)
+    try:
+        # Reconnect quickly after a dropped connection
+        yield b"retry: 3000\n\n"
+        ends_at = time.monotonic() + settings.EVENTS_STREAM_MAX_SECONDS
+        while time.monotonic() < ends_at:
+            try:
+                timeout = min(settings.EVENTS_HEARTBEAT_SECONDS, ends_at - time.monotonic())
+                yield await asyncio.wait_for(queue.get(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield HEARTBEAT_FRAME
+    finally:
+        event_bus.unsubscribe(user_id, queue)
+
+@router.get("/stream")
+async def stream_events(current_user: User = Depends(get_current_active_user)):
+    """
+    Server-Sent Events stream of the current user's SMS status changes
+    (``sms.status``), inbound SMS (``sms.inbound``) and wallet balance
+    changes (``wallet.balance``). After a ``resync`` event the client should
+    reload what it shows, since events were dropped.
+    """
+    return StreamingResponse(
+        _stream(current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
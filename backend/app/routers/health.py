@@ -0,0 +1,20 @@
+from fastapi import APIRouter, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ..services.health import health_monitor
+
+router = APIRouter(tags=["health"])
+
+@router.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and its event loop responds"""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readiness():
+    """Readiness probe: startup finished and the database is reachable"""
+    report = health_monitor.report()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if health_monitor.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder(report)
+    )
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..services.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
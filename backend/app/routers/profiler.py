@@ -0,0 +1,34 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from ..auth.dependencies import get_current_admin_user
+from ..config import get_settings
+from ..models.user import User
+from ..services.profiler import ProfilerBusy, sampling_profiler
+
+settings = get_settings()
+
+router = APIRouter(tags=["admin"])
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=settings.PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=settings.PROFILER_MIN_INTERVAL_MS, le=1000),
+    thread: Optional[str] = Query(None, description="Only sample threads whose name contains this text"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Sample the stacks of every thread of this worker for a few seconds and
+    return them in collapsed format, ready for flamegraph.pl or speedscope
+    """
+    try:
+        stacks, samples = await run_in_threadpool(
+            sampling_profiler.profile, seconds, interval_ms / 1000, thread
+        )
+    except ProfilerBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running on this worker"
+        )
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(samples)})
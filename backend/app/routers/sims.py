@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
@@ -6,11 +6,22 @@ from ..models.user import User
 from ..models.sim import Sim, SimStatus
 from ..models.wallet import Transaction, TransactionType, TransactionStatus
 from ..models.api_key import ApiKey
-from ..schemas.sim import Sim as SimSchema, SimCreate, SimUpdate
+from ..models.edge_sim import EdgeSim
+from ..config import get_settings
+from ..schemas.sim import Sim as SimSchema, SimCreate, SimUpdate, SimImport, SimHealth as SimHealthSchema
 from ..auth.dependencies import get_current_active_user
+from ..services.inventory_sync import inventory_synchronizer
+from ..services.versioning import conditional_get
+from ..services.provisioning import NEW_SIM_DEFAULTS, import_sims
+from ..services.sim_health import sim_health, HEALTHY
 import httpx
+import csv
+import io
+import json
 from datetime import datetime
+from starlette.concurrency import run_in_threadpool
 
+settings = get_settings()
 router = APIRouter()
 
 async def get_edge_api_key():
@@ -37,62 +48,67 @@ async def get_edge_api_key():
             )
 
 @router.get("/marketplace", response_model=List[SimSchema])
-async def get_all_sims_from_edge():
-    """Get all SIM cards from the edge backend"""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Get the API key
-            api_key = "5f427c4bc12f35af8648807151aa2742f5a98a929feebc8827162cc6885a9394"
-            if not api_key:
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail="Failed to get API key from edge backend"
-                )
+def get_all_sims_from_edge(
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Get all SIM cards from the synced edge inventory"""
+    stale_edges = sorted(inventory_synchronizer.last_errors)
+    if stale_edges:
+        # Let clients know some edges could not be synced recently
+        response.headers["X-Edge-Stale"] = ",".join(stale_edges)
 
-            # Use the API key to get SIM cards
-            response = await client.get(
-                "http://192.168.95.187:5001/api/sim-cards",
-                headers={
-                    "X-API-Key": api_key
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            # Transform the edge backend data to match our schema
-            transformed_sims = []
-            current_time = datetime.utcnow()
-            expiry_date = datetime.utcnow().replace(year=current_time.year + 1)  # 1 year from now
-            
-            for sim in data.get("sim_cards", []):
-                transformed_sims.append({
-                    "id": 0,  # Temporary ID since these are marketplace SIMs
-                    "iccid": sim["id"],  # Using the edge backend's id as ICCID
-                    "phone_number": sim["number"],
-                    "status": SimStatus.ACTIVE ,
-                    "is_active": sim["status"] == "active",
-                    "messages_limit": 1000,  # Default value
-                    "messages_used": 0,  # Default value
-                    "user_id": 0,  # No user assigned yet
-                    "expiry_date": expiry_date,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                })
-            return transformed_sims
-        except httpx.HTTPError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Failed to fetch SIM cards from edge backend: {str(e)}"
-            )
+    # Transform the edge inventory to match our schema
+    transformed_sims = []
+    current_time = datetime.utcnow()
+    expiry_date = datetime.utcnow().replace(year=current_time.year + 1)  # 1 year from now
+
+    for sim in db.query(EdgeSim).order_by(EdgeSim.id).all():
+        transformed_sims.append({
+            "id": 0,  # Temporary ID since these are marketplace SIMs
+            "iccid": sim.edge_sim_id,  # Using the edge backend's id as ICCID
+            "phone_number": sim.phone_number,
+            "status": SimStatus.ACTIVE,
+            "is_active": sim.status == "active",
+            "messages_limit": 1000,  # Default value
+            "messages_used": 0,  # Default value
+            "user_id": 0,  # No user assigned yet
+            "expiry_date": expiry_date,
+            "created_at": current_time,
+            "updated_at": current_time
+        })
+    return transformed_sims
 
 @router.get("/", response_model=List[SimSchema])
 def read_sims(
+    etag: str = Depends(conditional_get("sims")),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get all SIMs for the current user"""
     return db.query(Sim).filter(Sim.user_id == current_user.id).all()
 
+@router.get("/health", response_model=List[SimHealthSchema])
+def read_sims_health(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Rolling health of the current user's SIMs; unhealthy SIMs only get probe messages"""
+    sims = db.query(Sim.id, Sim.phone_number).filter(Sim.user_id == current_user.id).order_by(Sim.id).all()
+    health = sim_health.snapshot([sim.id for sim in sims])
+    return [
+        {"state": HEALTHY, **health.get(sim.id, {}), "sim_id": sim.id, "phone_number": sim.phone_number}
+        for sim in sims
+    ]
+
+def _require_synced_inventory(db: Session):
+    """SIMs are checked against the edge inventory, which must have been synced at least once"""
+    if settings.EDGE_SYNC_ENABLED and not inventory_synchronizer.is_synced(db):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Edge inventory not synced yet; try again later"
+        )
+
 @router.post("/", response_model=SimSchema)
 def create_sim(
     sim: SimCreate,
@@ -110,15 +126,19 @@ def create_sim(
             detail="SIM with this ICCID or phone number already exists"
         )
 
+    _require_synced_inventory(db)
+    if settings.EDGE_SYNC_ENABLED:
+        # The SIM must be one of the SIM cards offered by the edges
+        edge_sim = db.query(EdgeSim).filter(EdgeSim.edge_sim_id == sim.iccid).first()
+        if not edge_sim or edge_sim.phone_number != sim.phone_number:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="SIM is not available in the edge inventory"
+            )
+
     # Create the SIM with default values
     sim_data = sim.model_dump()
-    sim_data.update({
-        "user_id": current_user.id,
-        "status": SimStatus.ACTIVE,  # Set as active by default
-        "is_active": True,  # Set as active by default
-        "messages_limit": 150,  # Default message limit
-        "messages_used": 0  # Start with 0 messages used
-    })
+    sim_data.update({"user_id": current_user.id, **NEW_SIM_DEFAULTS})
     
     db_sim = Sim(**sim_data)
     db.add(db_sim)
@@ -126,6 +146,47 @@ def create_sim(
     db.refresh(db_sim)
     return db_sim
 
+@router.post("/bulk", response_model=SimImport)
+async def create_sims_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create many SIMs for the current user from a JSON list of SIMs or, with
+    ``Content-Type: text/csv``, a CSV with ``iccid,phone_number,expiry_date``
+    columns. Returns one result per row; invalid and duplicate rows don't stop
+    the others.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+        else:
+            rows = json.loads(body)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not parse SIM list: {str(e)}"
+        )
+    if not isinstance(rows, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a list of SIMs"
+        )
+    if len(rows) > settings.SIM_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.SIM_IMPORT_MAX_ROWS} SIMs per request"
+        )
+
+    await run_in_threadpool(_require_synced_inventory, db)
+    results = await run_in_threadpool(import_sims, db, current_user.id, rows)
+    return {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "results": results
+    }
+
 @router.get("/{sim_id}", response_model=SimSchema)
 def read_sim(
     sim_id: int,
@@ -196,6 +257,7 @@ def activate_sim(
     # Create activation transaction
     activation_fee = 10.00  # Example activation fee
     db_transaction = Transaction(
+        user_id=current_user.id,
         wallet_id=current_user.wallet.id,
         type=TransactionType.DEBIT,
         amount=activation_fee,
@@ -1,14 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+from datetime import datetime, timezone
+import asyncio
+import logging
+import uuid
 from ..database import get_db
 from ..models.sms import SMS, SMSStatus, SMSDirection
 from ..models.sim import Sim
+from ..models.edge_sim import EdgeSim
 from ..models.wallet import Transaction, TransactionType, TransactionStatus, Wallet
-from ..schemas.sms import SMSCreate, SMSUpdate, SMS as SMSSchema, SMSInDB
+from ..models.contact_list import ContactList
+from ..models.list_send import ListSend
+from ..schemas.sms import SMSCreate, SMSListCreate, SMSListResult, SMSUpdate, SMS as SMSSchema, SMSInDB
 from ..auth.dependencies import get_current_user
 from ..models.user import User
 from ..services.mqtt import mqtt_service
+from ..services.batching import sms_batcher, plan_weights, record_publish_results
+from ..services.sms_encoding import segment_count
+from ..services.sim_health import sim_health
+from ..services.tracing import message_tracer
+from ..services.inbound import store_inbound_sms
+from ..services.versioning import conditional_get, bump_versions
+from ..services.export import export_response
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     tags=["sms"]
@@ -29,11 +45,21 @@ async def test_mqtt_connection():
 @router.post("/send", response_model=List[SMSSchema])
 async def send_sms(
     sms: SMSCreate,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    accepted_at = datetime.utcnow()
     sent_messages = []
-    total_cost = len(sms.sim_ids)  # Cost is 1 per message
+    outbound = []
+    encoding, segments = segment_count(sms.content)
+
+    # Messages due later are stored and released by the scheduled dispatcher
+    send_at = sms.send_at
+    if send_at is not None and send_at.tzinfo is not None:
+        send_at = send_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if send_at is not None and send_at <= accepted_at:
+        send_at = None
 
     # Get user's wallet
     wallet = db.query(Wallet).filter(Wallet.user_id == current_user.id).first()
@@ -43,13 +69,6 @@ async def send_sms(
             detail="User wallet not found"
         )
 
-    # Check if user has enough balance for all messages
-    if wallet.balance < total_cost:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Insufficient balance. Need {total_cost} credits but only have {wallet.balance}"
-        )
-
     # Check if all SIMs exist and belong to user
     sims = db.query(Sim).filter(
         Sim.id.in_(sms.sim_ids),
@@ -75,6 +94,47 @@ async def send_sms(
                 detail=f"Message limit reached for SIM {sim.id}"
             )
 
+    # Leave out unhealthy SIMs, except for an occasional probe; scheduled
+    # messages are checked when they are dispatched
+    requested = sims
+    if send_at is None:
+        sims = [sim for sim in sims if not sim_health.is_shed(sim.id)]
+        if not sims:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The selected SIMs are unhealthy; try again later or pick other SIMs"
+            )
+
+    # Cost is 1 per segment; every SIM sends the content as the same segments
+    total_cost = segments * len(sims)
+
+    # Check if user has enough balance for all messages
+    if wallet.balance < total_cost:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient balance. Need {total_cost} credits but only have {wallet.balance}"
+        )
+
+    if send_at is None:
+        # Probes are only used up once the request is valid; one taken by a
+        # concurrent request since the check above leaves its SIM out
+        sims = [sim for sim in sims if sim_health.admit(sim.id) != 0]
+        if not sims:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The selected SIMs are unhealthy; try again later or pick other SIMs"
+            )
+        if len(sims) < len(requested):
+            response.headers["X-Skipped-Sims"] = ",".join(str(sim.id) for sim in requested if sim not in sims)
+        total_cost = segments * len(sims)
+
+    # Route each message to the edge hosting its SIM
+    sim_edges = dict(
+        db.query(EdgeSim.edge_sim_id, EdgeSim.edge).filter(
+            EdgeSim.edge_sim_id.in_([sim.iccid for sim in sims])
+        ).all()
+    )
+
     try:
         # Create transaction for all messages
         transaction = Transaction(
@@ -92,15 +152,33 @@ async def send_sms(
 
         # Send message through each SIM
         for sim in sims:
+            # The message id traces the message through the broker and the edge
+            message_id = str(uuid.uuid4())
+            if send_at is None:
+                message_tracer.mark(
+                    message_id,
+                    "accepted",
+                    at=accepted_at,
+                    user_id=current_user.id,
+                    sim_number=sim.phone_number,
+                    edge=sim_edges.get(sim.iccid)
+                )
+
             # Create SMS record
             db_sms = SMS(
                 user_id=current_user.id,
                 sim_id=sim.id,
                 transaction_id=transaction.id,
+                message_id=message_id,
                 recipient_number=sms.recipient_number,
                 sender_number=sim.phone_number,
                 content=sms.content,
-                status=SMSStatus.PENDING,
+                encoding=encoding,
+                segments=segments,
+                price=segments,
+                priority=sms.priority,
+                send_at=send_at,
+                status=SMSStatus.SCHEDULED if send_at else SMSStatus.PENDING,
                 direction=SMSDirection.OUTBOUND
             )
             db.add(db_sms)
@@ -108,26 +186,178 @@ async def send_sms(
             # Update SIM message count
             sim.messages_used += 1
 
-            # Send message via MQTT
-            mqtt_success = mqtt_service.send_sms(sms.recipient_number, sms.content)
-            
-            if mqtt_success:
-                db_sms.status = SMSStatus.SENT
-            else:
-                db_sms.status = SMSStatus.FAILED
-                db_sms.error_message = "Failed to send message via MQTT"
-
             sent_messages.append(db_sms)
+            outbound.append((sim.phone_number, sim_edges.get(sim.iccid), message_id))
 
-        # Update transaction status based on overall success
-        if all(msg.status == SMSStatus.SENT for msg in sent_messages):
+        if send_at is not None:
+            # Paid for now, sent when due
             transaction.status = TransactionStatus.COMPLETED
-        else:
-            transaction.status = TransactionStatus.FAILED
+            db.commit()
+            return sent_messages
 
+        # Commit first so that the database write lock isn't held while the
+        # messages wait in their priority lane
         db.commit()
-        return sent_messages
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+    # The messages are stored and paid for from here on. A 500 now would not
+    # be kept for the Idempotency-Key, and a retry would send and charge
+    # again, so failures are recorded on the messages instead.
+    async def publish(sim_number: str, edge: Optional[str], message_id: str) -> bool:
+        return await asyncio.wrap_future(sms_batcher.submit(
+            sms.recipient_number,
+            sms.content,
+            sim_number=sim_number,
+            edge=edge,
+            message_id=message_id,
+            priority=sms.priority.value,
+            tenant=current_user.id,
+            weight=plan_weights.get(current_user.plan or "standard", 1)
+        ))
+
+    publishes = await asyncio.gather(*(publish(*message) for message in outbound), return_exceptions=True)
+    for (sim_number, edge, message_id), mqtt_success in zip(outbound, publishes):
+        if isinstance(mqtt_success, Exception):
+            logger.error(f"Publishing SMS {message_id} failed: {mqtt_success}")
+    publishes = [mqtt_success is True for mqtt_success in publishes]
+    try:
+        for sim, mqtt_success in zip(sims, publishes):
+            sim_health.record_publish(sim.id, mqtt_success)
+        sent_ids = [db_sms.id for db_sms, mqtt_success in zip(sent_messages, publishes) if mqtt_success]
+        failed_ids = [db_sms.id for db_sms, mqtt_success in zip(sent_messages, publishes) if not mqtt_success]
+        record_publish_results(db, sent_ids, failed_ids)
 
+        # Update transaction status based on overall success
+        transaction.status = TransactionStatus.FAILED if failed_ids else TransactionStatus.COMPLETED
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception(f"Recording the publish results of transaction {transaction.id} failed")
+    bump_versions(current_user.id, "sms")
+    return sent_messages
+
+@router.post("/send-list", response_model=SMSListResult)
+def send_sms_to_list(
+    sms: SMSListCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Send the same content to every number of a contact list, spread round
+    robin over ``sim_ids``. The whole list is charged now and stored as one
+    list send, due at ``send_at`` or now. The scheduled dispatcher turns it
+    into messages a chunk at a time and releases them at its rate, so a
+    large list neither holds the database nor floods the broker or edges.
+    """
+    accepted_at = datetime.utcnow()
+    encoding, segments = segment_count(sms.content)
+    send_at = sms.send_at
+    if send_at is not None and send_at.tzinfo is not None:
+        send_at = send_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if send_at is None or send_at < accepted_at:
+        send_at = accepted_at
+
+    contact_list = db.query(ContactList).filter(
+        ContactList.id == sms.contact_list_id,
+        ContactList.user_id == current_user.id
+    ).first()
+    if not contact_list:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Contact list not found"
+        )
+
+    wallet = db.query(Wallet).filter(Wallet.user_id == current_user.id).first()
+    if not wallet:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User wallet not found"
+        )
+
+    sim_ids = list(dict.fromkeys(sms.sim_ids))
+    sims = db.query(Sim).filter(
+        Sim.id.in_(sim_ids),
+        Sim.user_id == current_user.id
+    ).order_by(Sim.id).all()
+    if not sims or len(sims) != len(sim_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="One or more SIMs not found or do not belong to user"
+        )
+    for sim in sims:
+        if not sim.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"SIM {sim.id} is not active"
+            )
+
+    # Unhealthy SIMs get no share of the list
+    shed_ids = sim_health.shed_sims()
+    shed = [sim for sim in sims if sim.id in shed_ids]
+    if len(shed) == len(sims):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The selected SIMs are unhealthy; try again later or pick other SIMs"
+        )
+    if shed:
+        response.headers["X-Skipped-Sims"] = ",".join(str(sim.id) for sim in shed)
+        sims = [sim for sim in sims if sim.id not in shed_ids]
+
+    # Contact i goes through sims[i % len(sims)]
+    count = contact_list.count
+    shares = [count // len(sims) + (1 if index < count % len(sims) else 0) for index in range(len(sims))]
+    for sim, share in zip(sims, shares):
+        if sim.messages_used + share > sim.messages_limit:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"SIM {sim.id} has {max(0, sim.messages_limit - sim.messages_used)} messages left "
+                       f"but would send {share}"
+            )
+
+    total_cost = segments * count
+    if wallet.balance < total_cost:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient balance. Need {total_cost} credits but only have {wallet.balance}"
+        )
+
+    try:
+        transaction = Transaction(
+            user_id=current_user.id,
+            wallet_id=wallet.id,
+            amount=-total_cost,
+            type=TransactionType.DEBIT,
+            status=TransactionStatus.COMPLETED,
+            description=f"SMS sent to contact list {contact_list.name} ({count} numbers) via {len(sims)} SIMs"
+        )
+        db.add(transaction)
+        db.flush()
+        wallet.balance -= total_cost
+
+        list_send = ListSend(
+            user_id=current_user.id,
+            contact_list_id=contact_list.id,
+            transaction_id=transaction.id,
+            batch_id=str(uuid.uuid4()),
+            content=sms.content,
+            encoding=encoding,
+            segments=segments,
+            priority=sms.priority,
+            sim_ids=",".join(str(sim.id) for sim in sims),
+            count=count,
+            send_at=send_at
+        )
+        db.add(list_send)
+        for sim, share in zip(sims, shares):
+            sim.messages_used += share
+        db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -135,14 +365,29 @@ async def send_sms(
             detail=str(e)
         )
 
+    return {
+        "id": list_send.id,
+        "transaction_id": transaction.id,
+        "contact_list_id": contact_list.id,
+        "messages": count,
+        "total_cost": total_cost,
+        "send_at": send_at,
+    }
+
 @router.get("/", response_model=List[SMSInDB])
 async def list_sms(
     skip: int = 0,
     limit: int = 100,
+    etag: str = Depends(conditional_get("sms", "sims", "wallet")),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    sms_list = db.query(SMS).filter(SMS.user_id == current_user.id).offset(skip).limit(limit).all()
+    # Load the nested objects in a few IN queries instead of one per row
+    sms_list = db.query(SMS).options(
+        selectinload(SMS.user),
+        selectinload(SMS.sim),
+        selectinload(SMS.transaction).selectinload(Transaction.wallet)
+    ).filter(SMS.user_id == current_user.id).offset(skip).limit(limit).all()
     return [
         {
             **sms.__dict__,
@@ -156,6 +401,29 @@ async def list_sms(
         for sms in sms_list
     ]
 
+# Columns of the SMS export, in order
+EXPORT_COLUMNS = [
+    SMS.id, SMS.message_id, SMS.direction, SMS.status, SMS.priority, SMS.sim_id, SMS.transaction_id,
+    SMS.recipient_number, SMS.sender_number, SMS.content, SMS.encoding, SMS.segments, SMS.price,
+    SMS.send_at, SMS.created_at, SMS.updated_at, SMS.error_message
+]
+
+@router.get("/export")
+def export_sms(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the user's complete SMS history, optionally limited to a creation time range"""
+    filters = [SMS.user_id == current_user.id]
+    if since is not None:
+        filters.append(SMS.created_at >= since)
+    if until is not None:
+        filters.append(SMS.created_at < until)
+    return export_response(request, EXPORT_COLUMNS, filters, format, "sms")
+
 @router.get("/{sms_id}", response_model=SMSInDB)
 async def get_sms(
     sms_id: int,
@@ -195,27 +463,15 @@ async def update_sms_status(
 async def receive_sms(
     sender_number: str,
     content: str,
+    message_id: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    # Find the SIM with the matching phone number
-    sim = db.query(Sim).filter(Sim.phone_number == sender_number).first()
-    if not sim:
+    # Find the SIM with the matching phone number; a repeated message_id
+    # returns the SMS stored the first time
+    db_sms = store_inbound_sms(db, sender_number, sender_number, content, message_id)
+    if not db_sms:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="SIM not found for this phone number"
         )
-
-    # Create SMS record for received message
-    db_sms = SMS(
-        user_id=sim.user_id,
-        sim_id=sim.id,
-        recipient_number=sim.phone_number,
-        sender_number=sender_number,
-        content=content,
-        status=SMSStatus.RECEIVED,
-        direction=SMSDirection.INBOUND
-    )
-    db.add(db_sms)
-    db.commit()
-    db.refresh(db_sms)
     return db_sms 
\ No newline at end of file
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth.dependencies import get_current_active_user
+from ..models.user import User
+from ..models.message_trace import MessageTrace
+from ..schemas.trace import MessageTrace as MessageTraceSchema, TraceSummary
+from ..services.tracing import summarize_traces, trace_detail
+
+router = APIRouter(tags=["traces"])
+
+# Upper bound on the traces a summary reads
+SUMMARY_MAX_TRACES = 100_000
+
+@router.get("/summary", response_model=TraceSummary)
+def read_trace_summary(
+    group_by: str = Query("edge", pattern="^(edge|sim)$"),
+    minutes: int = Query(60, ge=1, le=7 * 24 * 60),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Latency percentiles of every delivery stage per edge or per SIM for recent messages"""
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    traces = db.query(MessageTrace).filter(
+        MessageTrace.user_id == current_user.id,
+        MessageTrace.accepted_at >= since
+    ).order_by(MessageTrace.accepted_at.desc()).limit(SUMMARY_MAX_TRACES).all()
+    return {
+        "group_by": group_by,
+        "since": since,
+        "traces": len(traces),
+        "groups": summarize_traces(traces, group_by)
+    }
+
+@router.get("/{message_id}", response_model=MessageTraceSchema)
+def read_trace(
+    message_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Stage timestamps of one message; traces are written about a second after each stage"""
+    trace = db.query(MessageTrace).filter(
+        MessageTrace.message_id == message_id,
+        MessageTrace.user_id == current_user.id
+    ).first()
+    if not trace:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trace not found"
+        )
+    return trace_detail(trace)
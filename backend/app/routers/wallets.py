@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import false
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from decimal import Decimal
 from ..database import get_db
 from ..models.user import User
 from ..models.wallet import Wallet, Transaction, TransactionType, TransactionStatus
 from ..schemas.wallet import Wallet as WalletSchema, Transaction as TransactionSchema, TransactionCreate
 from ..auth.dependencies import get_current_active_user
+from ..services.versioning import conditional_get
+from ..services.export import export_response
 
 router = APIRouter()
 
 @router.get("/", response_model=WalletSchema)
 def read_wallet(
+    etag: str = Depends(conditional_get("wallet")),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -47,6 +52,7 @@ def create_transaction(
     
     # Create the transaction
     db_transaction = Transaction(
+        user_id=current_user.id,
         wallet_id=wallet.id,
         type=transaction.type,
         amount=transaction.amount,
@@ -68,6 +74,7 @@ def create_transaction(
 
 @router.get("/transactions", response_model=List[TransactionSchema])
 def read_transactions(
+    etag: str = Depends(conditional_get("wallet")),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -76,6 +83,30 @@ def read_transactions(
         return []
     return db.query(Transaction).filter(Transaction.wallet_id == wallet.id).all()
 
+# Columns of the transaction export, in order
+EXPORT_COLUMNS = [
+    Transaction.id, Transaction.type, Transaction.amount, Transaction.status, Transaction.description,
+    Transaction.created_at
+]
+
+@router.get("/transactions/export")
+def export_transactions(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Stream the user's complete transaction history, optionally limited to a creation time range"""
+    wallet = db.query(Wallet.id).filter(Wallet.user_id == current_user.id).first()
+    filters = [Transaction.wallet_id == wallet.id] if wallet else [false()]
+    if since is not None:
+        filters.append(Transaction.created_at >= since)
+    if until is not None:
+        filters.append(Transaction.created_at < until)
+    return export_response(request, EXPORT_COLUMNS, filters, format, "transactions")
+
 @router.patch("/transactions/{transaction_id}/status", response_model=TransactionSchema)
 def update_transaction_status(
     transaction_id: int,
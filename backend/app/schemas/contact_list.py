@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class ContactListCreate(BaseModel):
+    name: str
+    numbers: List[str]
+
+class ContactList(BaseModel):
+    id: int
+    name: str
+    count: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ContactListUpload(ContactList):
+    invalid: int  # Entries that aren't phone numbers
+    duplicates: int  # Entries repeating an earlier number
+
+class ContactListNumbers(BaseModel):
+    id: int
+    count: int
+    numbers: List[str]
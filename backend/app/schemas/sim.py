@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from ..models.sim import SimStatus
 
@@ -32,4 +32,28 @@ class SimInDBBase(SimBase):
         from_attributes = True
 
 class Sim(SimInDBBase):
-    pass 
\ No newline at end of file
+    pass
+
+class SimImportResult(BaseModel):
+    row: int
+    iccid: Optional[str] = None
+    phone_number: Optional[str] = None
+    status: str  # created, duplicate, unavailable or invalid
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class SimImport(BaseModel):
+    created: int
+    results: List[SimImportResult]
+
+class SimHealth(BaseModel):
+    sim_id: int
+    phone_number: str
+    state: str  # healthy or unhealthy
+    score: Optional[float] = None  # 0 to 1; null until there are enough outcomes
+    published: float = 0
+    publish_failures: float = 0
+    delivered: float = 0
+    failed: float = 0
+    latency_seconds: Optional[float] = None
+    opened_at: Optional[datetime] = None  # When the SIM was found unhealthy
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from ..models.sms import SMSPriority
 from .user import User
 from .sim import Sim
 from .wallet import Transaction
@@ -11,6 +12,25 @@ class SMSBase(BaseModel):
 
 class SMSCreate(SMSBase):
     sim_ids: List[int]  # Changed from sim_id to sim_ids to support multiple SIMs
+    priority: SMSPriority = SMSPriority.NORMAL
+    # Send later instead of now; times without a timezone are UTC
+    send_at: Optional[datetime] = None
+
+class SMSListCreate(BaseModel):
+    contact_list_id: int
+    content: str = Field(..., min_length=1, max_length=1600)
+    sim_ids: List[int]  # Contacts are spread over these SIMs
+    priority: SMSPriority = SMSPriority.NORMAL
+    # Send later instead of now; times without a timezone are UTC
+    send_at: Optional[datetime] = None
+
+class SMSListResult(BaseModel):
+    id: int  # Of the list send
+    transaction_id: int
+    contact_list_id: int
+    messages: int
+    total_cost: int
+    send_at: datetime
 
 class SMSUpdate(BaseModel):
     status: Optional[str] = None
@@ -21,9 +41,15 @@ class SMSInDBBase(SMSBase):
     user_id: int
     sim_id: int
     transaction_id: Optional[int] = None
+    message_id: Optional[str] = None
     sender_number: str
+    encoding: Optional[str] = None
+    segments: Optional[int] = None
+    price: Optional[int] = None
     status: str
     direction: str
+    priority: Optional[str] = None
+    send_at: Optional[datetime] = None
     error_message: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+class MessageTrace(BaseModel):
+    message_id: str
+    status: Optional[str] = None
+    edge: Optional[str] = None
+    sim_number: Optional[str] = None
+    stages: Dict[str, Optional[datetime]]
+    durations_ms: Dict[str, Optional[float]]
+
+class SegmentSummary(BaseModel):
+    count: int
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+
+class TraceGroupSummary(BaseModel):
+    messages: int
+    delivered: int
+    failed: int
+    segments: Dict[str, SegmentSummary]
+
+class TraceSummary(BaseModel):
+    group_by: str
+    since: datetime
+    traces: int
+    groups: Dict[str, TraceGroupSummary]
@@ -17,6 +17,8 @@ class UserUpdate(BaseModel):
 class UserInDBBase(UserBase):
     id: int
     is_active: bool
+    is_admin: bool = False
+    plan: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
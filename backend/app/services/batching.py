@@ -0,0 +1,408 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+
+from ..config import get_settings
+from ..models.sms import SMS, SMSPriority, SMSStatus
+from . import metrics
+from .events import queue_events, sms_status_event
+from .mqtt import MQTTService, mqtt_service
+from .tracing import message_tracer
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Per-message acknowledgments of a batch, and the edge status each one records
+ACK_STATUSES = {
+    "accepted": "received",
+    "rejected": "failed",
+}
+
+
+def parse_priority_weights(raw: str) -> Dict[str, int]:
+    """
+    Parse the SMS_PRIORITY_WEIGHTS setting, e.g. ``transactional=8,normal=3,bulk=1``.
+
+    Lanes are returned from the highest priority to the lowest; lanes left
+    out get a weight of 1.
+    """
+    weights = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, weight = entry.split("=", 1)
+        weights[SMSPriority(name.strip()).value] = max(1, int(weight))
+    return {lane.value: weights.get(lane.value, 1) for lane in SMSPriority}
+
+
+def parse_plan_weights(raw: str) -> Dict[str, int]:
+    """Parse the TENANT_PLAN_WEIGHTS setting, e.g. ``free=1,standard=2,premium=4``"""
+    weights = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, weight = entry.split("=", 1)
+        weights[name.strip()] = max(1, int(weight))
+    return weights
+
+
+class DeficitRoundRobin:
+    """
+    Queues of batches per tenant, served by deficit round robin.
+
+    Active tenants take turns in a ring. On its turn a tenant earns
+    ``quantum`` times its weight in credit and publishes batches while their
+    message count fits in its credit; whatever is left carries over to its
+    next turn, and is dropped once its queue runs dry. Since the quantum is
+    at least the largest batch, every turn publishes something, so picking a
+    batch costs O(1) however many tenants are waiting.
+    """
+
+    def __init__(self, quantum: int):
+        self.quantum = quantum
+        self._queues: Dict[Optional[int], Deque[_Batch]] = {}
+        self._weights: Dict[Optional[int], int] = {}
+        self._deficits: Dict[Optional[int], int] = {}
+        self._active: Deque[Optional[int]] = deque()
+        # Whether the tenant at the head of the ring got its credit for this turn
+        self._turn_started = False
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    def push(self, tenant: Optional[int], weight: int, batch: "_Batch"):
+        queue = self._queues.get(tenant)
+        if queue is None:
+            queue = self._queues[tenant] = deque()
+            self._deficits[tenant] = 0
+            self._active.append(tenant)
+        self._weights[tenant] = weight
+        queue.append(batch)
+
+    def pop(self) -> Optional["_Batch"]:
+        while self._active:
+            tenant = self._active[0]
+            if not self._turn_started:
+                self._deficits[tenant] += self.quantum * self._weights[tenant]
+                self._turn_started = True
+            queue = self._queues[tenant]
+            cost = len(queue[0].messages)
+            if cost > self._deficits[tenant]:
+                self._active.rotate(-1)
+                self._turn_started = False
+                continue
+            self._deficits[tenant] -= cost
+            batch = queue.popleft()
+            if not queue:
+                self._active.popleft()
+                self._turn_started = False
+                del self._queues[tenant], self._weights[tenant], self._deficits[tenant]
+            return batch
+        return None
+
+
+class _Batch:
+    def __init__(self, edge: Optional[str], lane: str, tenant: Optional[int], weight: int, linger: float):
+        self.edge = edge
+        self.lane = lane
+        self.tenant = tenant
+        self.weight = weight
+        self.messages: List[dict] = []
+        self.futures: List[Future] = []
+        self.size = 0
+        self.linger = linger
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + linger
+
+
+class SMSBatcher:
+    """
+    Publishes outbound SMS through priority lanes, packing SMS for the same
+    edge and lane into one MQTT publish when batching is enabled.
+
+    Messages wait in an open batch per edge and lane until it holds
+    ``max_messages`` messages or ``max_bytes`` of payload, or until
+    ``linger`` seconds after its first message, whichever comes first;
+    transactional batches never linger. Without batching every message is a
+    batch of its own, published with ``send_sms``.
+
+    Closed batches queue per lane for ``max_in_flight`` publisher threads,
+    which pick lanes by smooth weighted round robin over ``weights``, so a
+    lane with weight 8 gets eight publishes for every one of a lane with
+    weight 1 while both have work, and an idle lane costs nothing. Lower
+    lanes never take the last free publisher, so a transactional message
+    waits for at most one publish however deep the bulk queue is. Within a
+    lane, batches are kept per tenant and served by DeficitRoundRobin, so a
+    user's campaign doesn't hold up other users' messages.
+    ``submit`` returns a future resolved once the message is acknowledged by
+    the broker.
+    """
+
+    def __init__(
+        self,
+        mqtt: MQTTService,
+        batching: bool,
+        max_messages: int,
+        max_bytes: int,
+        linger: float,
+        max_in_flight: int,
+        weights: Dict[str, int],
+        quantum: int = 1
+    ):
+        self.mqtt = mqtt
+        self.batching = batching
+        self.max_messages = max(1, max_messages) if batching else 1
+        self.max_bytes = max_bytes
+        self.linger = linger if batching else 0.0
+        self.max_in_flight = max(1, max_in_flight)
+        self.weights = weights
+        self.top_lane = next(iter(weights))
+        self._open: Dict[Tuple[Optional[str], str, Optional[int]], _Batch] = {}
+        # Every tenant turn must fit a full batch
+        quantum = max(quantum, self.max_messages)
+        self._ready: Dict[str, DeficitRoundRobin] = {lane: DeficitRoundRobin(quantum) for lane in weights}
+        self._queued: Dict[str, int] = {lane: 0 for lane in weights}
+        self._credits: Dict[str, int] = {lane: 0 for lane in weights}
+        self._busy = 0
+        self._busy_top = 0
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            self._threads.append(threading.Thread(target=self._run, name="mqtt-batcher", daemon=True))
+            for index in range(self.max_in_flight):
+                self._threads.append(threading.Thread(target=self._publisher, name=f"mqtt-publish-{index}", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        """Publish the queued and open batches, then stop the threads"""
+        with self._condition:
+            if not self._threads:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(
+        self,
+        number: str,
+        message: str,
+        sim_number: Optional[str] = None,
+        edge: Optional[str] = None,
+        message_id: Optional[str] = None,
+        priority: str = SMSPriority.NORMAL.value,
+        tenant: Optional[int] = None,
+        weight: int = 1
+    ) -> Future:
+        """
+        Queue an SMS in its priority lane for ``tenant``, the sending user,
+        whose plan has ``weight``; the future resolves to True once published
+        """
+        message_id = message_id or str(uuid.uuid4())
+        lane = SMSPriority(priority).value
+        item = {"message_id": message_id, "number": number, "message": message}
+        if sim_number:
+            item["sim_number"] = sim_number
+        size = len(json.dumps(item)) if self.batching else 0
+        future: Future = Future()
+        message_tracer.mark(message_id, "enqueued")
+
+        with self._condition:
+            if not self._threads or self._stopping:
+                future.set_result(False)
+                return future
+            key = (edge, lane, tenant)
+            batch = self._open.get(key)
+            if batch is not None and batch.size + size > self.max_bytes:
+                self._close(key)
+                batch = None
+            if batch is None:
+                linger = 0.0 if lane == self.top_lane else self.linger
+                batch = self._open[key] = _Batch(edge, lane, tenant, weight, linger)
+            batch.messages.append(item)
+            batch.futures.append(future)
+            batch.size += size
+            if not batch.linger or len(batch.messages) >= self.max_messages or batch.size >= self.max_bytes:
+                self._close(key)
+            else:
+                # The flusher may be sleeping past this batch's deadline
+                self._condition.notify_all()
+        return future
+
+    def pending(self, lane: Optional[str] = None) -> int:
+        """Messages waiting for a publisher, in one lane or in all of them"""
+        if lane is not None:
+            return self._queued[lane]
+        return sum(self._queued.values())
+
+    def _close(self, key: Tuple[Optional[str], str, Optional[int]]):
+        """Queue the open batch under ``key`` for the publishers; called with the lock held"""
+        batch = self._open.pop(key)
+        self._ready[batch.lane].push(batch.tenant, batch.weight, batch)
+        self._queued[batch.lane] += len(batch.messages)
+        self._condition.notify_all()
+
+    def _run(self):
+        """Close open batches once they have lingered long enough"""
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                for key in [key for key, batch in self._open.items() if batch.deadline <= now]:
+                    self._close(key)
+                timeout = min((batch.deadline for batch in self._open.values()), default=now + 1) - now
+                self._condition.wait(max(timeout, 0))
+            for key in list(self._open):
+                self._close(key)
+
+    def _next_batch(self) -> Optional[_Batch]:
+        """Pick the next batch by smooth weighted round robin; called with the lock held"""
+        reserve = self.max_in_flight > 1 and self._busy - self._busy_top >= self.max_in_flight - 1
+        lanes = [
+            lane for lane, batches in self._ready.items()
+            if batches and (lane == self.top_lane or not reserve)
+        ]
+        if not lanes:
+            return None
+        total = sum(self.weights[lane] for lane in lanes)
+        for lane in lanes:
+            self._credits[lane] += self.weights[lane]
+        lane = max(lanes, key=lambda lane: self._credits[lane])
+        self._credits[lane] -= total
+        batch = self._ready[lane].pop()
+        self._queued[lane] -= len(batch.messages)
+        return batch
+
+    def _publisher(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+                while batch is None:
+                    if self._stopping and not self._open and not any(self._ready.values()):
+                        return
+                    self._condition.wait()
+                    batch = self._next_batch()
+                self._busy += 1
+                if batch.lane == self.top_lane:
+                    self._busy_top += 1
+            try:
+                self._publish(batch)
+            finally:
+                with self._condition:
+                    self._busy -= 1
+                    if batch.lane == self.top_lane:
+                        self._busy_top -= 1
+                    self._condition.notify_all()
+
+    def _publish(self, batch: _Batch):
+        metrics.sms_queue_wait_seconds.labels(batch.lane).observe(time.monotonic() - batch.created_at)
+        try:
+            if self.batching:
+                metrics.mqtt_batch_size.observe(len(batch.messages))
+                success = self.mqtt.send_sms_batch(batch.edge, str(uuid.uuid4()), batch.messages)
+            else:
+                message = batch.messages[0]
+                success = self.mqtt.send_sms(
+                    message["number"],
+                    message["message"],
+                    sim_number=message.get("sim_number"),
+                    edge=batch.edge,
+                    message_id=message["message_id"]
+                )
+        except Exception:
+            logger.exception("Publishing an SMS batch failed")
+            success = False
+        for future in batch.futures:
+            # A waiter cancelled at shutdown or on a leader change no longer wants the result
+            if future.set_running_or_notify_cancel():
+                future.set_result(success)
+
+
+def record_publish_results(db, sent_ids: List[int], failed_ids: List[int]):
+    """
+    Mark published SMS as sent and the others as failed, without committing.
+
+    Only pending rows change, so that a delivery report that arrived while
+    the publish was awaited isn't overwritten. The caller must bump the
+    users' "sms" versions after committing.
+    """
+    changes = [
+        (sent_ids, SMSStatus.SENT, None),
+        (failed_ids, SMSStatus.FAILED, "Failed to send message via MQTT"),
+    ]
+    for ids, sms_status, error in changes:
+        if not ids:
+            continue
+        rows = db.execute(
+            update(SMS)
+            .where(SMS.id.in_(ids), SMS.status == SMSStatus.PENDING)
+            .values(status=sms_status, error_message=error)
+            .returning(SMS.id, SMS.user_id, SMS.message_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        queue_events(db, [(row.user_id, sms_status_event(row.id, row.message_id, sms_status, error)) for row in rows])
+
+
+def handle_batch_ack(payload: bytes):
+    """
+    Consume the acknowledgment of a batch or binary frame published by an
+    edge on sms/ack:
+
+        {"batch_id": "...", "timestamp": 1700000000.123,
+         "results": [{"message_id": "...", "status": "accepted|rejected", "error": "..."}]}
+
+    Accepted messages are traced as received by the edge and rejected ones
+    as failed, exactly like the matching reports on sms/status.
+    """
+    try:
+        ack = json.loads(payload)
+        results = ack["results"]
+        iter(results)
+    except (ValueError, TypeError, KeyError):
+        logger.warning("Ignoring malformed batch acknowledgment: %r", payload[:200])
+        return
+
+    at = None
+    if isinstance(ack.get("timestamp"), (int, float)):
+        at = datetime.utcfromtimestamp(ack["timestamp"])
+    for result in results:
+        try:
+            message_id = result["message_id"]
+            edge_status = ACK_STATUSES[result["status"]]
+        except (TypeError, KeyError):
+            logger.warning("Ignoring malformed result in batch %s: %r", ack.get("batch_id"), result)
+            continue
+        message_tracer.record_status(message_id, edge_status, at, result.get("error"))
+
+
+plan_weights = parse_plan_weights(settings.TENANT_PLAN_WEIGHTS)
+
+sms_batcher = SMSBatcher(
+    mqtt_service,
+    settings.MQTT_BATCH_ENABLED,
+    settings.MQTT_BATCH_MAX_MESSAGES,
+    settings.MQTT_BATCH_MAX_BYTES,
+    settings.MQTT_BATCH_LINGER_MS / 1000,
+    settings.MQTT_BATCH_MAX_IN_FLIGHT,
+    parse_priority_weights(settings.SMS_PRIORITY_WEIGHTS),
+    settings.TENANT_QUANTUM
+)
+for _lane in sms_batcher.weights:
+    metrics.background_queue_depth.set_function(lambda lane=_lane: sms_batcher.pending(lane), f"sms_{_lane}")
@@ -0,0 +1,76 @@
+import re
+import sys
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Separators people put in phone numbers
+_SEPARATORS = re.compile(r"[\s\-().]")
+# E.164: a country code and subscriber number of at most 15 digits, never starting with 0
+_E164_DIGITS = re.compile(r"[1-9][0-9]{6,14}")
+
+
+def normalize_number(raw: str, default_country_code: str = "") -> Optional[int]:
+    """
+    The E.164 digits of ``raw`` as an integer, or None when it isn't a phone
+    number. Separators are dropped, a leading 00 counts as +, and numbers
+    without either get ``default_country_code`` when one is set.
+    """
+    number = _SEPARATORS.sub("", raw)
+    if number.startswith("+"):
+        number = number[1:]
+    elif number.startswith("00"):
+        number = number[2:]
+    elif default_country_code:
+        number = default_country_code + number.lstrip("0")
+    else:
+        return None
+    if not _E164_DIGITS.fullmatch(number):
+        return None
+    return int(number)
+
+
+def format_number(number: int) -> str:
+    return f"+{number}"
+
+
+def pack_numbers(raw_numbers: Iterable[str]) -> Tuple[array, int, int]:
+    """
+    Normalize, sort and deduplicate ``raw_numbers`` into an array of 64-bit
+    integers. Returns the array and the counts of invalid and duplicate
+    entries.
+    """
+    numbers = array("q")
+    invalid = 0
+    for raw in raw_numbers:
+        number = normalize_number(raw, settings.CONTACT_DEFAULT_COUNTRY_CODE)
+        if number is None:
+            invalid += 1
+        else:
+            numbers.append(number)
+    unique = array("q", sorted(set(numbers)))
+    return unique, invalid, len(numbers) - len(unique)
+
+
+def to_blob(numbers: array) -> bytes:
+    """Numbers as little-endian 8 byte integers, 8 bytes per contact"""
+    if sys.byteorder == "big":
+        numbers = array("q", numbers)
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def from_blob(blob: bytes) -> array:
+    numbers = array("q")
+    numbers.frombytes(blob)
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    return numbers
+
+
+def iter_chunks(numbers: array, size: int) -> Iterator[array]:
+    for start in range(0, len(numbers), size):
+        yield numbers[start:start + size]
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class EdgeEndpoint:
+    name: str
+    base_url: str
+
+
+def parse_edge_endpoints(raw: str) -> List[EdgeEndpoint]:
+    """
+    Parse the EDGE_ENDPOINTS setting.
+
+    Entries are comma separated ``name=url`` pairs. An entry without a name
+    is named after its position, e.g. ``edge1``.
+    """
+    endpoints = []
+    for position, entry in enumerate(raw.split(","), start=1):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" in entry:
+            name, url = entry.split("=", 1)
+        else:
+            name, url = f"edge{position}", entry
+        endpoints.append(EdgeEndpoint(name=name.strip(), base_url=url.strip().rstrip("/")))
+    return endpoints
+
+
+class CircuitBreaker:
+    """
+    Classic three state circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    requests are short-circuited for ``reset_timeout`` seconds. After that a
+    single trial request is let through (half-open); its outcome decides
+    whether the breaker closes again or re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through after one that ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class EdgeInventory:
+    """Merged inventory of all edges, with the edges that could not be read"""
+    sim_cards: List[dict] = field(default_factory=list)
+    healthy_edges: List[str] = field(default_factory=list)
+    # Healthy edges that answered 304, i.e. whose SIM cards did not change
+    unchanged_edges: List[str] = field(default_factory=list)
+    # ETags of the fetched SIM cards; stored with store_etags once they are applied
+    etags: Dict[str, str] = field(default_factory=dict)
+    failed_edges: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_partial(self) -> bool:
+        return bool(self.failed_edges)
+
+
+class EdgeCircuitOpen(Exception):
+    pass
+
+
+class EdgeClient:
+    def __init__(
+        self,
+        endpoints: List[EdgeEndpoint],
+        api_key: str,
+        timeout: float,
+        failure_threshold: int,
+        reset_timeout: float,
+    ):
+        self.endpoints = endpoints
+        self.api_key = api_key
+        self.timeout = timeout
+        self.breakers = {
+            endpoint.name: CircuitBreaker(failure_threshold, reset_timeout)
+            for endpoint in endpoints
+        }
+        self._etags: Dict[str, str] = {}
+
+    @classmethod
+    def from_settings(cls) -> "EdgeClient":
+        return cls(
+            endpoints=parse_edge_endpoints(settings.EDGE_ENDPOINTS),
+            api_key=settings.EDGE_API_KEY,
+            timeout=settings.EDGE_TIMEOUT_SECONDS,
+            failure_threshold=settings.EDGE_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.EDGE_BREAKER_RESET_SECONDS,
+        )
+
+    async def _fetch_sim_cards(
+        self,
+        client: httpx.AsyncClient,
+        endpoint: EdgeEndpoint,
+        conditional: bool
+    ) -> Optional[Tuple[List[dict], Optional[str]]]:
+        """Fetch an edge's SIM cards and their ETag, or None if they did not change since the last fetch"""
+        breaker = self.breakers[endpoint.name]
+        if not breaker.allow_request():
+            raise EdgeCircuitOpen(f"circuit open for edge {endpoint.name}")
+        headers = {"X-API-Key": self.api_key}
+        if conditional and endpoint.name in self._etags:
+            headers["If-None-Match"] = self._etags[endpoint.name]
+        try:
+            response = await asyncio.wait_for(
+                client.get(f"{endpoint.base_url}/api/sim-cards", headers=headers),
+                timeout=self.timeout
+            )
+            if response.status_code == 304:
+                breaker.record_success()
+                return None
+            response.raise_for_status()
+            sim_cards = response.json().get("sim_cards", [])
+        except asyncio.CancelledError:
+            # Cancelled from outside, e.g. at shutdown; says nothing about the edge
+            breaker.release_trial()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return sim_cards, response.headers.get("ETag")
+
+    async def fetch_inventory(self, conditional: bool = False) -> EdgeInventory:
+        """
+        Query every edge concurrently and merge their SIM cards.
+
+        Edges that time out, error or have an open circuit are reported in
+        ``failed_edges`` instead of failing the whole call. With
+        ``conditional`` set, edges that support ETags and whose SIM cards did
+        not change are listed in ``unchanged_edges`` and contribute no rows.
+        """
+        inventory = EdgeInventory()
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            results = await asyncio.gather(
+                *(self._fetch_sim_cards(client, endpoint, conditional) for endpoint in self.endpoints),
+                return_exceptions=True
+            )
+
+        # SIM ids are ICCIDs, so the same id on two edges is one SIM reported
+        # twice, e.g. moved without the old edge noticing; the first edge keeps it
+        seen: Dict[str, str] = {}
+        for endpoint, result in zip(self.endpoints, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Failed to fetch SIM cards from edge {endpoint.name}: {result!r}")
+                inventory.failed_edges[endpoint.name] = str(result) or type(result).__name__
+                continue
+            inventory.healthy_edges.append(endpoint.name)
+            if result is None:
+                inventory.unchanged_edges.append(endpoint.name)
+                continue
+            sim_cards, etag = result
+            if etag is not None:
+                inventory.etags[endpoint.name] = etag
+            for sim in sim_cards:
+                if sim["id"] in seen:
+                    logger.warning(
+                        f"Edge {endpoint.name} reports SIM {sim['id']}, already reported by "
+                        f"edge {seen[sim['id']]}; ignoring the duplicate"
+                    )
+                    continue
+                seen[sim["id"]] = endpoint.name
+                inventory.sim_cards.append({**sim, "edge": endpoint.name})
+        return inventory
+
+    def store_etags(self, etags: Dict[str, str]):
+        """
+        Send ``etags`` with the next conditional fetches. Call only once the
+        SIM cards they belong to are applied, or a failed apply would be
+        answered with 304 and never retried.
+        """
+        self._etags.update(etags)
+
+    def status(self) -> Dict[str, str]:
+        """Circuit state per edge"""
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+
+edge_client = EdgeClient.from_settings()
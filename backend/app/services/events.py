@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import secrets
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.sms import SMS, SMSDirection
+from ..models.wallet import Wallet
+from . import metrics
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Topic the workers exchange their events on when relaying through the broker
+RELAY_TOPIC = "cloud/events"
+
+# Sent instead of the backlog of a stream that fell too far behind
+RESYNC_FRAME = b"event: resync\ndata: {}\n\n"
+HEARTBEAT_FRAME = b": ping\n\n"
+
+
+def encode_event(event_type: str, data: dict) -> bytes:
+    """A Server-Sent Events frame, encoded once and shared by every stream of the user"""
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n".encode()
+
+
+class EventBus:
+    """
+    Fans out per-user events to the open event streams of this process.
+
+    Every stream is an asyncio queue of encoded frames, so an idle stream
+    costs a queue and a suspended coroutine. Events may be published from
+    any thread; they are handed to the event loop in one call per publish.
+    A stream whose queue fills up loses its backlog and gets a ``resync``
+    event, telling the client to reload instead of slowing down the others.
+
+    With a relay, events are also published on RELAY_TOPIC and events of the
+    other workers are delivered here, since delivery reports and inbound SMS
+    are consumed by whichever worker the broker picks.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.origin = secrets.token_hex(6)
+        self._streams: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._relay = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def enable_relay(self, mqtt):
+        """Relay events through ``mqtt`` to the other workers, and theirs to this one"""
+        self._relay = mqtt
+        mqtt.subscribe(RELAY_TOPIC, self.handle_relayed, shared=False)
+
+    @property
+    def stream_count(self) -> int:
+        return sum(len(streams) for streams in self._streams.values())
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Open a stream of ``user_id``'s events; call on the event loop"""
+        queue = asyncio.Queue(self.queue_size)
+        self._streams[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        streams = self._streams.get(user_id)
+        if streams is not None:
+            streams.discard(queue)
+            if not streams:
+                del self._streams[user_id]
+
+    def publish(self, events: List[Tuple[int, bytes]]):
+        """Deliver (user id, frame) pairs to this process's streams and relay them"""
+        if not events:
+            return
+        if self._relay is not None:
+            payload = json.dumps({
+                "origin": self.origin,
+                "events": [[user_id, frame.decode()] for user_id, frame in events]
+            })
+            try:
+                self._relay.publish_nowait(RELAY_TOPIC, payload)
+            except Exception:
+                logger.exception("Relaying events failed")
+        self._schedule(events)
+
+    def handle_relayed(self, payload: bytes):
+        """Consume events published by the other workers on RELAY_TOPIC"""
+        try:
+            message = json.loads(payload)
+            if message["origin"] == self.origin:
+                return
+            events = [(int(user_id), frame.encode()) for user_id, frame in message["events"]]
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Ignoring malformed relayed events: %r", payload[:200])
+            return
+        self._schedule(events)
+
+    def _schedule(self, events: List[Tuple[int, bytes]]):
+        # Nobody to deliver to; checked without the loop since most users have no stream open
+        if self._loop is None or not any(user_id in self._streams for user_id, _ in events):
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, events)
+        except RuntimeError:
+            # The loop closed during shutdown
+            pass
+
+    def _deliver(self, events: List[Tuple[int, bytes]]):
+        for user_id, frame in events:
+            for queue in self._streams.get(user_id, ()):
+                try:
+                    queue.put_nowait(frame)
+                except asyncio.QueueFull:
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(RESYNC_FRAME)
+
+
+event_bus = EventBus(settings.EVENTS_QUEUE_SIZE)
+metrics.event_streams_open.set_function(lambda: event_bus.stream_count)
+
+
+def sms_status_event(sms_id: int, message_id: Optional[str], status, error: Optional[str] = None) -> bytes:
+    return encode_event("sms.status", {
+        "id": sms_id,
+        "message_id": message_id,
+        "status": getattr(status, "value", status),
+        "error_message": error,
+    })
+
+
+def queue_events(db, events: Iterable[Tuple[int, bytes]]):
+    """Publish events once ``db`` commits, for writes that bypass the ORM"""
+    db.info.setdefault("events", []).extend(events)
+
+
+def _sms_event(sms: SMS) -> bytes:
+    if sms.direction == SMSDirection.INBOUND:
+        return encode_event("sms.inbound", {
+            "id": sms.id,
+            "message_id": sms.message_id,
+            "sim_id": sms.sim_id,
+            "sender_number": sms.sender_number,
+            "content": sms.content,
+        })
+    return sms_status_event(sms.id, sms.message_id, sms.status, sms.error_message)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_events(session, flush_context):
+    events = []
+    for obj in session.new:
+        if isinstance(obj, SMS) and obj.user_id is not None:
+            events.append((obj.user_id, _sms_event(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, SMS) and inspect(obj).attrs.status.history.has_changes():
+            events.append((obj.user_id, _sms_event(obj)))
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Wallet) and inspect(obj).attrs.balance.history.has_changes():
+            events.append((obj.user_id, encode_event("wallet.balance", {"balance": obj.balance})))
+    if events:
+        queue_events(session, events)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_events(session):
+    events = session.info.pop("events", None)
+    if events:
+        event_bus.publish(events)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_events(session):
+    session.info.pop("events", None)
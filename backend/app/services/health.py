@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import engine
+from .edge import edge_client
+from .inventory_sync import inventory_synchronizer
+from .leader import leader_elector
+from .mqtt import mqtt_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class HealthMonitor:
+    """
+    Checks dependencies in the background and caches the results.
+
+    Probes only read the cached state, so they answer instantly and never
+    wait on the database, the broker or the edges.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.started = False
+        self.db_ok = False
+        self.db_error: Optional[str] = None
+        self.db_checked_at: Optional[datetime] = None
+        self.db_latency_ms: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_started(self):
+        self.started = True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.check_database()
+            await asyncio.sleep(self.interval)
+
+    def _ping_database(self):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def check_database(self):
+        started_at = time.perf_counter()
+        try:
+            await run_in_threadpool(self._ping_database)
+            self.db_ok = True
+            self.db_error = None
+        except Exception as e:
+            if self.db_ok:
+                logger.error(f"Database health check failed: {str(e)}")
+            self.db_ok = False
+            self.db_error = str(e)
+        self.db_latency_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        self.db_checked_at = datetime.utcnow()
+
+    @property
+    def ready(self) -> bool:
+        return self.started and self.db_ok
+
+    def report(self) -> dict:
+        edges = inventory_synchronizer.status()
+        for name, circuit in edge_client.status().items():
+            edges.setdefault(name, {})["circuit"] = circuit
+        broker_ok = mqtt_service.connected
+        edges_ok = all(edge.get("last_error") is None for edge in edges.values())
+        if not self.ready:
+            status = "unavailable"
+        elif broker_ok and edges_ok:
+            status = "ok"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "started": self.started,
+            "database": {
+                "ok": self.db_ok,
+                "error": self.db_error,
+                "latency_ms": self.db_latency_ms,
+                "checked_at": self.db_checked_at
+            },
+            "broker": {
+                "connected": broker_ok,
+                "host": mqtt_service.host,
+                "port": mqtt_service.port,
+                "error": mqtt_service.last_error
+            },
+            "edges": edges,
+            # Edge sync state is only known to the leader
+            "leader": leader_elector.status()
+        }
+
+
+health_monitor = HealthMonitor(settings.HEALTH_CHECK_INTERVAL_SECONDS)
@@ -0,0 +1,83 @@
+import json
+import logging
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.sim import Sim
+from ..models.sms import SMS, SMSDirection, SMSStatus
+
+logger = logging.getLogger(__name__)
+
+
+def store_inbound_sms(
+    db: Session,
+    sim_number: str,
+    sender_number: str,
+    content: str,
+    message_id: Optional[str] = None
+) -> Optional[SMS]:
+    """
+    Record an SMS received by one of our SIMs.
+
+    With a ``message_id`` the call is idempotent: a message seen before
+    returns the stored row instead of a duplicate, also when two consumers
+    store the same message concurrently. Returns None for unknown SIMs.
+    """
+    if message_id:
+        existing = db.query(SMS).filter(SMS.message_id == message_id).first()
+        if existing:
+            return existing
+
+    sim = db.query(Sim).filter(Sim.phone_number == sim_number).first()
+    if not sim:
+        return None
+
+    db_sms = SMS(
+        user_id=sim.user_id,
+        sim_id=sim.id,
+        message_id=message_id,
+        recipient_number=sim.phone_number,
+        sender_number=sender_number,
+        content=content,
+        status=SMSStatus.RECEIVED,
+        direction=SMSDirection.INBOUND
+    )
+    db.add(db_sms)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another consumer stored the same message first
+        db.rollback()
+        return db.query(SMS).filter(SMS.message_id == message_id).first()
+    db.refresh(db_sms)
+    return db_sms
+
+
+def handle_inbound_message(payload: bytes):
+    """
+    Consume an SMS received by an edge, published on sms/inbound:
+
+        {"message_id": "...", "sim_number": "+1555...", "sender_number": "+1444...", "content": "..."}
+
+    Runs on the MQTT network thread and writes before returning, so the
+    message is acknowledged to the broker only once it is stored.
+    """
+    try:
+        message = json.loads(payload)
+        message_id = message["message_id"]
+        sim_number = message["sim_number"]
+        sender_number = message["sender_number"]
+        content = message["content"]
+    except (ValueError, TypeError, KeyError):
+        logger.warning("Ignoring malformed inbound SMS: %r", payload[:200])
+        return
+
+    db = SessionLocal()
+    try:
+        if store_inbound_sms(db, sim_number, sender_number, content, message_id) is None:
+            logger.warning("Ignoring inbound SMS for unknown SIM %s", sim_number, extra={"message_id": message_id})
+    finally:
+        db.close()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, insert, or_, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.edge_sim import EdgeSim
+from .edge import EdgeClient, EdgeInventory, edge_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class InventorySynchronizer:
+    """
+    Periodically mirrors the edges' SIM cards into the edge_sims table.
+
+    Every run diffs the fetched SIM cards against the local rows and only
+    writes the rows that were added, changed or removed. Edges that fail keep
+    their last synced rows, so readers never see an edge outage.
+    """
+
+    def __init__(self, client: EdgeClient, interval: float):
+        self.client = client
+        self.interval = interval
+        self.last_synced_at: Dict[str, datetime] = {}
+        self.last_errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._synced = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Edge inventory sync failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def sync_once(self) -> Dict[str, int]:
+        """Run one sync and return the number of inserted, updated and deleted rows"""
+        async with self._lock:
+            inventory = await self.client.fetch_inventory(conditional=True)
+            stats = await run_in_threadpool(self._apply, inventory)
+            self.client.store_etags(inventory.etags)
+
+            now = datetime.utcnow()
+            for edge in inventory.healthy_edges:
+                self.last_synced_at[edge] = now
+                self.last_errors.pop(edge, None)
+            self.last_errors.update(inventory.failed_edges)
+            if any(stats.values()):
+                logger.info(f"Edge inventory synced: {stats}")
+            return stats
+
+    def _apply(self, inventory: EdgeInventory) -> Dict[str, int]:
+        changed_edges = [
+            edge for edge in inventory.healthy_edges
+            if edge not in inventory.unchanged_edges
+        ]
+        stats = {"inserted": 0, "updated": 0, "deleted": 0}
+        if not changed_edges:
+            return stats
+
+        fetched = {
+            sim["id"]: {
+                "edge": sim["edge"],
+                "phone_number": sim["number"],
+                "status": sim["status"]
+            }
+            for sim in inventory.sim_cards
+        }
+
+        db = SessionLocal()
+        try:
+            # Only the rows of the edges that answered with data, plus rows
+            # of SIMs that moved to one of those edges
+            existing = db.query(
+                EdgeSim.id, EdgeSim.edge_sim_id, EdgeSim.edge, EdgeSim.phone_number, EdgeSim.status
+            ).filter(
+                or_(EdgeSim.edge.in_(changed_edges), EdgeSim.edge_sim_id.in_(list(fetched)))
+            ).all()
+
+            inserts = []
+            updates = []
+            deletes = []
+            seen = set()
+            for row in existing:
+                seen.add(row.edge_sim_id)
+                sim = fetched.get(row.edge_sim_id)
+                if sim is None:
+                    if row.edge in changed_edges:
+                        deletes.append(row.id)
+                elif (row.edge, row.phone_number, row.status) != (sim["edge"], sim["phone_number"], sim["status"]):
+                    updates.append({"id": row.id, **sim})
+            for edge_sim_id, sim in fetched.items():
+                if edge_sim_id not in seen:
+                    inserts.append({"edge_sim_id": edge_sim_id, **sim})
+
+            if inserts:
+                db.execute(insert(EdgeSim), inserts)
+            if updates:
+                db.execute(update(EdgeSim), updates)
+            if deletes:
+                db.execute(delete(EdgeSim).where(EdgeSim.id.in_(deletes)))
+            db.commit()
+
+            stats.update(inserted=len(inserts), updated=len(updates), deleted=len(deletes))
+            return stats
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def is_synced(self, db) -> bool:
+        """
+        Whether a sync has succeeded, in this worker or on the leader. Until
+        then the edge_sims table is empty and says nothing about the edges.
+        """
+        if not self._synced:
+            self._synced = bool(self.last_synced_at) or db.query(EdgeSim.id).first() is not None
+        return self._synced
+
+    def status(self) -> Dict[str, dict]:
+        """Last successful sync time and last error per edge"""
+        return {
+            endpoint.name: {
+                "last_synced_at": self.last_synced_at.get(endpoint.name),
+                "last_error": self.last_errors.get(endpoint.name)
+            }
+            for endpoint in self.client.endpoints
+        }
+
+
+inventory_synchronizer = InventorySynchronizer(edge_client, settings.EDGE_SYNC_INTERVAL_SECONDS)
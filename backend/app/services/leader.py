@@ -0,0 +1,152 @@
+import asyncio
+import inspect
+import logging
+import os
+import secrets
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.lease import Lease
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class LeaderElector:
+    """
+    Elects one process, across workers and nodes sharing the database, to run
+    singleton background jobs.
+
+    Every process periodically tries to take or renew a lease row. The holder
+    renews it every ``renew_interval`` seconds; when it dies, the lease runs
+    out after ``ttl`` seconds and another process takes over. A clean shutdown
+    releases the lease right away. Jobs are started when this process becomes
+    leader and stopped when it loses the lease, including when the database
+    can't be reached to renew it.
+    """
+
+    def __init__(self, name: str, ttl: float, renew_interval: float):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl)
+        self.renew_interval = renew_interval
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.is_leader = False
+        self.leader_since: Optional[datetime] = None
+        self._jobs: List[Tuple[Callable[[], Any], Callable[[], Any]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, start: Callable[[], Any], stop: Callable[[], Any]):
+        """Call ``start`` on becoming leader and ``stop`` (sync or async) on losing it"""
+        self._jobs.append((start, stop))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+            try:
+                await run_in_threadpool(self._release)
+            except Exception as e:
+                logger.error(f"Releasing the {self.name} lease failed: {str(e)}")
+
+    async def _run(self):
+        while True:
+            try:
+                leader = await run_in_threadpool(self._acquire)
+            except Exception as e:
+                logger.error(f"Renewing the {self.name} lease failed: {str(e)}")
+                leader = False
+            if leader and not self.is_leader:
+                await self._become_leader()
+            elif not leader and self.is_leader:
+                await self._step_down()
+            await asyncio.sleep(self.renew_interval)
+
+    def _acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if we hold it"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(Lease)
+                .where(Lease.name == self.name, or_(Lease.holder == self.holder, Lease.expires_at < now))
+                .values(holder=self.holder, expires_at=now + self.ttl)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                db.commit()
+                return True
+            if db.get(Lease, self.name) is not None:
+                db.rollback()
+                return False
+            db.add(Lease(name=self.name, holder=self.holder, expires_at=now + self.ttl))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process created the lease first
+                db.rollback()
+                return False
+            return True
+        finally:
+            db.close()
+
+    def _release(self):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Lease)
+                .where(Lease.name == self.name, Lease.holder == self.holder)
+                .values(expires_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _become_leader(self):
+        logger.info(f"{self.holder} became leader for {self.name}")
+        self.is_leader = True
+        self.leader_since = datetime.utcnow()
+        for start, _ in self._jobs:
+            try:
+                start()
+            except Exception:
+                logger.exception(f"Starting a {self.name} job failed")
+
+    async def _step_down(self):
+        logger.info(f"{self.holder} is no longer leader for {self.name}")
+        self.is_leader = False
+        self.leader_since = None
+        for _, stop in reversed(self._jobs):
+            try:
+                result = stop()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception(f"Stopping a {self.name} job failed")
+
+    def status(self) -> dict:
+        return {"is_leader": self.is_leader, "holder": self.holder, "leader_since": self.leader_since}
+
+
+leader_elector = LeaderElector(
+    "background-jobs",
+    settings.LEADER_LEASE_SECONDS,
+    settings.LEADER_RENEW_SECONDS
+)
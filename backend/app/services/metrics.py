@@ -0,0 +1,238 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond DB queries to slow sends
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    """Gauge whose value is either set directly or read from a callback"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float], *values: str):
+        """Report ``function()`` at scrape time instead of a stored value"""
+        self._functions[values] = function
+
+    def _samples(self) -> List[str]:
+        samples = super()._samples()
+        for values, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception:
+                continue
+            samples.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return samples
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels((*self.labelnames, "le"), (*values, _format_value(bound)))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled"
+)
+
+# Database
+db_queries_total = Counter("db_queries_total", "SQL statements executed")
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "SQL statement latency")
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("route",), buckets=COUNT_BUCKETS
+)
+http_request_db_duration_seconds = Histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL statements per HTTP request", ("route",)
+)
+
+# MQTT
+mqtt_publish_total = Counter("mqtt_publish_total", "MQTT messages published", ("topic",))
+mqtt_publish_failures_total = Counter("mqtt_publish_failures_total", "MQTT publishes that failed", ("topic",))
+mqtt_publish_duration_seconds = Histogram(
+    "mqtt_publish_duration_seconds", "Time from publish until the broker acknowledged it", ("topic",)
+)
+mqtt_publish_in_flight = Gauge("mqtt_publish_in_flight", "MQTT publishes waiting for the broker")
+mqtt_batch_size = Histogram("mqtt_batch_size", "SMS packed into each sms/send/batch publish", buckets=COUNT_BUCKETS)
+sms_queue_wait_seconds = Histogram(
+    "sms_queue_wait_seconds", "Time outbound SMS waited for a publisher, per priority lane", ("lane",)
+)
+
+# Background workers
+sims_unhealthy = Gauge("sims_unhealthy", "SIMs whose outbound traffic is being shed")
+event_streams_open = Gauge("event_streams_open", "Event streams open on this worker")
+background_queue_depth = Gauge("background_queue_depth", "Items waiting in background worker queues", ("queue",))
+log_records_dropped_total = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
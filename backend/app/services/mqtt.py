@@ -1,21 +1,40 @@
 import paho.mqtt.client as mqtt
-from typing import Optional
+from typing import Callable, Dict, Optional, Sequence, Tuple
 import json
 import logging
 import time
 import os
 import uuid
+from . import metrics
+from .tracing import message_tracer
+from .sms_encoding import BINARY_ENCODING, encode_frame, segment_count
 
 logger = logging.getLogger(__name__)
+# One record per SMS; rate limited by app.logging_config
+message_logger = logging.getLogger(__name__ + ".messages")
 
 class MQTTService:
     def __init__(self):
         # Get configuration from environment variables with defaults
         self.host = os.getenv("MQTT_HOST", "192.168.95.187")
         self.port = int(os.getenv("MQTT_PORT", "1883"))
+        # QoS 1 makes the broker acknowledge every publish with a PUBACK
+        self.qos = int(os.getenv("MQTT_QOS", "1"))
+        self.publish_timeout = float(os.getenv("MQTT_PUBLISH_TIMEOUT_SECONDS", "5"))
+        # Consumers in the same shared subscription group split the messages
+        # of a topic between them instead of each receiving all of them
+        self.shared_group = os.getenv("MQTT_SHARED_GROUP", "cloud-server")
+        # Send binary frames on sms/send/binary to edges that announce support
+        self.binary_payloads = os.getenv("MQTT_BINARY_PAYLOADS", "true").lower() == "true"
+        # edge -> payload encodings announced on edges/<edge>/capabilities
+        self.edge_encodings: Dict[str, Tuple[str, ...]] = {}
+        # topic -> (subscription filter, handler)
+        self._handlers: Dict[str, Tuple[str, Callable[[bytes], None]]] = {}
         self.client = mqtt.Client()
         self._setup_client()
         self.connected = False
+        self.started = False
+        self.last_error: Optional[str] = None
         logger.info(f"MQTT Service initialized with host: {self.host}, port: {self.port}")
         
     def _setup_client(self):
@@ -23,26 +42,103 @@ class MQTTService:
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
         
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when connected to MQTT broker"""
         if rc == 0:
             logger.info(f"Connected to MQTT broker at {self.host}:{self.port}")
             self.connected = True
+            self.last_error = None
+            # Subscriptions don't survive a reconnect with a clean session
+            for subscription, _ in list(self._handlers.values()):
+                client.subscribe(subscription, self.qos)
         else:
             logger.error(f"Failed to connect to MQTT broker with code: {rc}")
             self.connected = False
+            self.last_error = mqtt.connack_string(rc)
             
     def _on_disconnect(self, client, userdata, rc):
         """Callback when disconnected from MQTT broker"""
         self.connected = False
         if rc != 0:
             logger.warning(f"Unexpected disconnection from MQTT broker with code: {rc}")
+            self.last_error = mqtt.error_string(rc)
             
     def _on_publish(self, client, userdata, mid):
         """Callback when message is published"""
-        logger.debug(f"Message published with ID: {mid}")
-        
+        logger.debug("Message published with ID: %s", mid)
+
+    def _on_message(self, client, userdata, msg):
+        """Callback when a message arrives on a subscribed topic"""
+        for topic, (_, handler) in list(self._handlers.items()):
+            if mqtt.topic_matches_sub(topic, msg.topic):
+                try:
+                    handler(msg.payload)
+                except Exception:
+                    logger.exception(f"Handler for MQTT topic {topic} failed")
+
+    def subscribe(self, topic: str, handler: Callable[[bytes], None], shared: bool = True):
+        """
+        Call ``handler`` with the payload of messages on ``topic``
+
+        Shared subscriptions go through ``$share/MQTT_SHARED_GROUP/``, so the
+        broker hands each message to one consumer of the group, across workers
+        and nodes. Handlers must then be idempotent: after a consumer fails,
+        the broker may deliver a message again to another one. Handlers run
+        on the MQTT network thread and should be quick.
+        """
+        subscription = f"$share/{self.shared_group}/{topic}" if shared and self.shared_group else topic
+        self._handlers[topic] = (subscription, handler)
+        if self.connected:
+            self.client.subscribe(subscription, self.qos)
+
+    def unsubscribe(self, topic: str):
+        """Stop delivering messages on ``topic``"""
+        entry = self._handlers.pop(topic, None)
+        if entry is not None and self.connected:
+            self.client.unsubscribe(entry[0])
+
+    def handle_capabilities(self, payload: bytes):
+        """
+        Consume the retained capabilities an edge publishes on edges/<edge>/capabilities:
+
+            {"edge": "site-a", "encodings": ["binary-v1", "json"]}
+        """
+        try:
+            capabilities = json.loads(payload)
+            edge = capabilities["edge"]
+            encodings = tuple(capabilities.get("encodings", ()))
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Ignoring malformed edge capabilities: %r", payload[:200])
+            return
+        if self.edge_encodings.get(edge) != encodings:
+            logger.info(f"Edge {edge} supports payload encodings {', '.join(encodings) or 'json'}")
+        self.edge_encodings[edge] = encodings
+
+    def uses_binary(self, edge: Optional[str]) -> bool:
+        """Whether messages for ``edge`` go out as binary frames instead of JSON"""
+        return self.binary_payloads and edge is not None and BINARY_ENCODING in self.edge_encodings.get(edge, ())
+
+    def start(self):
+        """
+        Connect to MQTT broker in the background
+
+        Returns immediately; the network thread keeps retrying until the
+        broker is reachable and reconnects after disconnections.
+        """
+        if self.started:
+            return
+        logger.info(f"Starting MQTT connection to {self.host}:{self.port}")
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.connect_async(self.host, self.port)
+        self.client.loop_start()
+        # Name the network thread so that it is recognizable in profiles
+        network_thread = getattr(self.client, "_thread", None)
+        if network_thread is not None:
+            network_thread.name = "mqtt-network"
+        self.started = True
+
     def connect(self):
         """Connect to MQTT broker"""
         try:
@@ -65,26 +161,40 @@ class MQTTService:
     def disconnect(self):
         """Disconnect from MQTT broker"""
         try:
-            self.client.loop_stop()
             self.client.disconnect()
+            self.client.loop_stop()
             self.connected = False
+            self.started = False
             logger.info("Disconnected from MQTT broker")
         except Exception as e:
             logger.error(f"Error during MQTT disconnect: {str(e)}")
         
     def ensure_connected(self):
         """Ensure MQTT client is connected, reconnect if necessary"""
+        if self.started:
+            # The network thread reconnects on its own; don't block callers
+            return
         if not self.connected:
             logger.info("MQTT client not connected, attempting to reconnect...")
             self.connect()
         
-    def send_sms(self, number: str, message: str) -> bool:
+    def send_sms(
+        self,
+        number: str,
+        message: str,
+        sim_number: Optional[str] = None,
+        edge: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> bool:
         """
         Send SMS via MQTT
         
         Args:
             number: Recipient phone number
             message: SMS content
+            sim_number: Phone number of the SIM that should send the message
+            edge: Name of the edge backend hosting that SIM
+            message_id: Trace id of the message, generated when not given
             
         Returns:
             bool: True if message was published successfully
@@ -93,47 +203,132 @@ class MQTTService:
             self.ensure_connected()
             
             if not self.connected:
-                logger.error("MQTT client is not connected")
+                message_logger.error("MQTT client is not connected")
+                metrics.mqtt_publish_failures_total.labels("sms/send").inc()
                 return False
                 
             # Generate a unique message ID
-            message_id = str(uuid.uuid4())
+            message_id = message_id or str(uuid.uuid4())
             
-            payload = json.dumps({
+            payload = {
                 "message_id": message_id,
                 "number": number,
                 "message": message
-            })
+            }
+            if sim_number:
+                payload["sim_number"] = sim_number
+            if self.uses_binary(edge):
+                # A frame of one message, acknowledged on sms/ack like a batch
+                topic = "sms/send/binary"
+                payload = encode_frame(str(uuid.uuid4()), edge, [payload])
+            else:
+                topic = "sms/send"
+                if edge:
+                    payload["edge"] = edge
+                payload["encoding"], payload["segments"] = segment_count(message)
+                payload = json.dumps(payload)
             
-            logger.info(f"Sending SMS to {number} via MQTT with message_id: {message_id}")
-            result = self.client.publish("sms/send", payload)
-            result.wait_for_publish()
-            success = result.rc == mqtt.MQTT_ERR_SUCCESS
+            message_logger.debug("Sending SMS to %s via MQTT", number, extra={"message_id": message_id})
+            message_tracer.mark(message_id, "enqueued")
+            success = self._publish(topic, payload, (message_id,))
             if success:
-                logger.info(f"Successfully sent SMS to {number} with message_id: {message_id}")
+                message_logger.info("Sent SMS to %s", number, extra={"message_id": message_id})
             else:
-                logger.error(f"Failed to publish SMS to {number} with message_id: {message_id}")
+                message_logger.error("Failed to publish SMS to %s", number, extra={"message_id": message_id})
             return success
         except Exception as e:
-            logger.error(f"Failed to send SMS via MQTT: {str(e)}")
+            message_logger.error("Failed to send SMS via MQTT: %s", e, extra={"message_id": message_id})
             return False
             
+    def send_sms_batch(self, edge: Optional[str], batch_id: str, messages: list) -> bool:
+        """
+        Send several SMS for the same edge in one publish on sms/send/batch,
+        or as a binary frame on sms/send/binary when the edge supports it
+
+        ``messages`` holds the per-message fields of ``send_sms`` payloads.
+        The edge acknowledges every message separately on sms/ack.
+
+        Returns:
+            bool: True if the batch was published successfully
+        """
+        message_ids = [message["message_id"] for message in messages]
+        try:
+            self.ensure_connected()
+            if not self.connected:
+                logger.error("MQTT client is not connected")
+                metrics.mqtt_publish_failures_total.labels("sms/send/batch").inc()
+                return False
+
+            if self.uses_binary(edge):
+                topic = "sms/send/binary"
+                payload = encode_frame(batch_id, edge, messages)
+            else:
+                topic = "sms/send/batch"
+                payload = {"batch_id": batch_id, "messages": messages}
+                if edge:
+                    payload["edge"] = edge
+                for message in messages:
+                    message["encoding"], message["segments"] = segment_count(message["message"])
+                payload = json.dumps(payload)
+            success = self._publish(topic, payload, message_ids)
+            if success:
+                logger.debug("Sent batch %s of %d SMS", batch_id, len(messages))
+            else:
+                logger.error("Failed to publish batch %s of %d SMS", batch_id, len(messages))
+            return success
+        except Exception as e:
+            logger.error(f"Failed to send SMS batch via MQTT: {str(e)}")
+            return False
+
+    def publish_nowait(self, topic: str, payload) -> bool:
+        """Publish at QoS 0 without waiting for the broker, for messages that may be lost"""
+        if not self.connected:
+            return False
+        result = self.client.publish(topic, payload, qos=0)
+        metrics.mqtt_publish_total.labels(topic).inc()
+        return result.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _publish(self, topic: str, payload, message_ids: Sequence[str] = ()) -> bool:
+        """Publish and wait for the broker, recording latency and failures"""
+        metrics.mqtt_publish_in_flight.inc()
+        started_at = time.perf_counter()
+        try:
+            result = self.client.publish(topic, payload, qos=self.qos)
+            for message_id in message_ids:
+                message_tracer.mark(message_id, "published")
+            result.wait_for_publish(self.publish_timeout)
+            success = result.rc == mqtt.MQTT_ERR_SUCCESS and result.is_published()
+            if success and self.qos:
+                for message_id in message_ids:
+                    message_tracer.mark(message_id, "acked")
+        except Exception:
+            metrics.mqtt_publish_failures_total.labels(topic).inc()
+            raise
+        finally:
+            metrics.mqtt_publish_in_flight.dec()
+        metrics.mqtt_publish_duration_seconds.labels(topic).observe(time.perf_counter() - started_at)
+        metrics.mqtt_publish_total.labels(topic).inc()
+        if not success:
+            metrics.mqtt_publish_failures_total.labels(topic).inc()
+        return success
+
+    def outgoing_queue_depth(self) -> int:
+        """Messages queued in the client that the broker has not acknowledged yet"""
+        return len(getattr(self.client, "_out_messages", ()))
+
     def update_config(self, host: str, port: int):
         """Update MQTT broker configuration"""
         logger.info(f"Updating MQTT configuration to {host}:{port}")
         self.disconnect()
         self.host = host
         self.port = port
-        self.connect()
+        self.start()
 
     def test_connection(self) -> bool:
-        """Test MQTT connection and return True if successful"""
-        try:
-            self.ensure_connected()
-            return self.connected
-        except Exception as e:
-            logger.error(f"MQTT connection test failed: {str(e)}")
-            return False
+        """Return the current MQTT connection state without blocking"""
+        self.start()
+        return self.connected
 
 # Create a singleton instance
-mqtt_service = MQTTService() 
\ No newline at end of file
+mqtt_service = MQTTService()
+metrics.background_queue_depth.set_function(mqtt_service.outgoing_queue_depth, "mqtt_outgoing") 
\ No newline at end of file
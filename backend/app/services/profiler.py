@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread in the process.
+
+    The sampler runs in the calling thread and reads ``sys._current_frames()``
+    every ``interval`` seconds, so the profiled code is never instrumented:
+    the cost is one stack walk per thread per sample, paid while holding the
+    GIL. That covers the event loop, the threadpool running sync endpoints and
+    the MQTT network thread alike. Only one profile runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[Tuple[str, str, int], str] = {}
+
+    def profile(self, duration: float, interval: float, thread_filter: Optional[str] = None) -> Tuple[str, int]:
+        """
+        Sample for ``duration`` seconds and return the stacks in collapsed
+        format, one ``thread;frame;frame count`` line per distinct stack,
+        together with the number of samples taken.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            stacks: Counter = Counter()
+            own_ident = threading.get_ident()
+            samples = 0
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    name = names.get(ident, f"thread-{ident}")
+                    if thread_filter and thread_filter not in name:
+                        continue
+                    stacks[self._collapse(name, frame)] += 1
+                samples += 1
+                time.sleep(interval)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), samples
+        finally:
+            self._lock.release()
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_name, code.co_firstlineno)
+            label = self._labels.get(key)
+            if label is None:
+                label = self._labels[key] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            frames.append(label)
+            frame = frame.f_back
+        frames.append(thread_name.replace(";", ":").replace(" ", "_"))
+        return ";".join(reversed(frames))
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to the longest matching sys.path entry"""
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(entry) > len(best):
+            best = entry
+    return filename[len(best):].lstrip(os.sep) if best else filename
+
+
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,107 @@
+from typing import List
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..models.edge_sim import EdgeSim
+from ..models.sim import Sim, SimStatus
+from ..schemas.sim import SimCreate
+from .versioning import bump_versions
+
+settings = get_settings()
+
+# Values every SIM a user adds starts with
+NEW_SIM_DEFAULTS = {
+    "status": SimStatus.ACTIVE,
+    "is_active": True,
+    "messages_limit": 150,
+    "messages_used": 0,
+}
+
+
+def _validation_error(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def import_sims(db: Session, user_id: int, rows: List[dict]) -> List[dict]:
+    """
+    Add SIMs for ``user_id`` and return one result per row, in order.
+
+    Rows are validated one by one, then checked for ICCIDs and phone numbers
+    already taken in a single query against the unique indexes, and the rest
+    are inserted in one statement. A row is ``created``, ``duplicate`` (of an
+    existing SIM or of an earlier row), ``unavailable`` (not in the edge
+    inventory) or ``invalid``.
+    """
+    results = [{"row": index, "iccid": None, "phone_number": None} for index in range(len(rows))]
+    candidates = {}
+    for index, row in enumerate(rows):
+        try:
+            sim = SimCreate.model_validate(row)
+        except ValidationError as e:
+            results[index].update(status="invalid", error=_validation_error(e))
+            continue
+        results[index].update(iccid=sim.iccid, phone_number=sim.phone_number)
+        candidates[index] = sim
+
+    for attempt in range(2):
+        pending = _check_candidates(db, candidates, results)
+        if not pending:
+            break
+        try:
+            inserted = db.execute(
+                insert(Sim).returning(Sim.id, Sim.iccid),
+                [{**candidates[index].model_dump(), "user_id": user_id, **NEW_SIM_DEFAULTS} for index in pending]
+            ).all()
+            db.commit()
+        except IntegrityError:
+            # A concurrent request took some of the numbers; check again
+            db.rollback()
+            if attempt:
+                raise
+            continue
+        ids = {row.iccid: row.id for row in inserted}
+        for index in pending:
+            results[index].update(status="created", id=ids[candidates[index].iccid])
+        bump_versions(user_id, "sims")
+        break
+    return results
+
+
+def _check_candidates(db: Session, candidates: dict, results: List[dict]) -> List[int]:
+    """Mark duplicate and unavailable candidates in ``results``; return the rows left to insert"""
+    iccids = {sim.iccid for sim in candidates.values()}
+    phone_numbers = {sim.phone_number for sim in candidates.values()}
+    taken_iccids, taken_numbers = set(), set()
+    if candidates:
+        for iccid, phone_number in db.query(Sim.iccid, Sim.phone_number).filter(
+            or_(Sim.iccid.in_(iccids), Sim.phone_number.in_(phone_numbers))
+        ):
+            taken_iccids.add(iccid)
+            taken_numbers.add(phone_number)
+
+    inventory = None
+    if settings.EDGE_SYNC_ENABLED and candidates:
+        # SIMs must be among the SIM cards offered by the edges
+        inventory = dict(
+            db.query(EdgeSim.edge_sim_id, EdgeSim.phone_number).filter(EdgeSim.edge_sim_id.in_(iccids))
+        )
+
+    pending = []
+    for index, sim in candidates.items():
+        if sim.iccid in taken_iccids or sim.phone_number in taken_numbers:
+            results[index].update(status="duplicate", error="SIM with this ICCID or phone number already exists")
+            continue
+        if inventory is not None and inventory.get(sim.iccid) != sim.phone_number:
+            results[index].update(status="unavailable", error="SIM is not available in the edge inventory")
+            continue
+        # Later rows repeating this one are duplicates
+        taken_iccids.add(sim.iccid)
+        taken_numbers.add(sim.phone_number)
+        pending.append(index)
+    return pending
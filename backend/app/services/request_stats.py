@@ -0,0 +1,119 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from ..config import get_settings
+from ..database import engine
+from . import metrics
+
+settings = get_settings()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class NPlusOneDetected(AssertionError):
+    pass
+
+
+class RequestStats:
+    """
+    Database work done while handling one request.
+
+    Query count, DB time and the slowest statements are always kept. With
+    ``track_statements`` every statement's distinct parameter sets are also
+    counted, which is what the N+1 detection works from.
+    """
+
+    __slots__ = ("queries", "db_time", "slowest", "statements", "track_statements")
+
+    def __init__(self, track_statements: bool = False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+        self.statements: Dict[str, set] = {}
+        self.track_statements = track_statements
+
+    def record(self, statement: str, parameters, elapsed: float):
+        self.queries += 1
+        self.db_time += elapsed
+
+        keep = settings.SQL_SLOW_STATEMENTS
+        if len(self.slowest) < keep or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[keep:]
+
+        if self.track_statements:
+            self.statements.setdefault(statement, set()).add(repr(parameters))
+
+    def repeated_statements(self, threshold: Optional[int] = None) -> Dict[str, int]:
+        """Statements run with at least ``threshold`` different parameter sets"""
+        threshold = threshold or settings.SQL_N_PLUS_ONE_THRESHOLD
+        return {
+            statement: len(parameter_sets)
+            for statement, parameter_sets in self.statements.items()
+            if len(parameter_sets) >= threshold
+        }
+
+    def check(self, budget: Optional[int] = None):
+        """Raise if the query budget is exceeded or an N+1 pattern was seen"""
+        budget = budget if budget is not None else settings.SQL_QUERY_BUDGET
+        if budget and self.queries > budget:
+            raise QueryBudgetExceeded(f"{self.queries} SQL statements executed, budget is {budget}")
+        repeated = self.repeated_statements()
+        if repeated:
+            statement, count = max(repeated.items(), key=lambda item: item[1])
+            raise NPlusOneDetected(f"Statement executed with {count} different parameter sets: {statement}")
+
+
+# Set by RequestStatsMiddleware for the duration of each HTTP request; sync
+# endpoints see it too because the threadpool copies the context
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+# Collectors that see every statement regardless of context, see query_budget
+_watchers: List[RequestStats] = []
+
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None):
+    """
+    Fail if the enclosed code runs more than ``max_queries`` statements or
+    shows the N+1 signature. Meant for tests:
+
+        with query_budget(5):
+            client.get("/api/sms/", headers=headers)
+
+    Statements from any thread are counted, so requests made through a
+    test client are covered.
+    """
+    stats = RequestStats(track_statements=True)
+    _watchers.append(stats)
+    try:
+        yield stats
+    finally:
+        _watchers.remove(stats)
+    stats.check(max_queries)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one statement at a time, and a statement that fails
+    # never reaches the handler below, so the next one simply overwrites this
+    conn.info["query_started_at"] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started_at"]
+    metrics.db_queries_total.inc()
+    metrics.db_query_duration_seconds.observe(elapsed)
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.record(statement, parameters, elapsed)
+    for watcher in _watchers:
+        watcher.record(statement, parameters, elapsed)
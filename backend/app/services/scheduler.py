@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import func, insert, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.contact_list import ContactList
+from ..models.edge_sim import EdgeSim
+from ..models.list_send import ListSend, ListSendStatus
+from ..models.sim import Sim
+from ..models.sms import SMS, SMSDirection, SMSStatus
+from ..models.user import User
+from ..models.wallet import Transaction, TransactionStatus, TransactionType, Wallet
+from .batching import SMSBatcher, plan_weights, record_publish_results, sms_batcher
+from .contacts import format_number, from_blob
+from .events import queue_events, sms_status_event
+from .sim_health import sim_health
+from .tracing import message_tracer
+from .versioning import bump_versions
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class ScheduledDispatcher:
+    """
+    Releases scheduled SMS into the outbound lanes once their send_at is due.
+
+    Runs on the leader only. Every ``interval`` seconds it reads the oldest
+    due messages through the (status, send_at) index, up to ``max_rate``
+    messages per second of interval and ``batch_size`` per read, so a burst
+    scheduled for the same minute drains at a steady rate instead of hitting
+    the publishers at once. Messages are claimed with a conditional update
+    before they are published, so two leaders never send the same one.
+
+    A claimed message whose publish outcome wasn't recorded within
+    ``claim_timeout`` seconds, because its leader died or lost the lease,
+    is scheduled again when a leader starts and every ``claim_timeout``
+    seconds after. Such a message may then be sent twice. Claimed messages
+    whose SIM no longer exists fail and are refunded.
+
+    Due list sends are turned into scheduled messages on the way, no more
+    numbers per pass than the pass may release, each chunk in its own short
+    transaction.
+    """
+
+    def __init__(self, batcher: SMSBatcher, interval: float, batch_size: int, max_rate: float, claim_timeout: float):
+        self.batcher = batcher
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.claim_timeout = claim_timeout
+        self.last_dispatched_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_release = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        self._last_release = 0.0
+        while True:
+            started_at = time.monotonic()
+            try:
+                if started_at - self._last_release >= self.claim_timeout:
+                    self._last_release = started_at
+                    await run_in_threadpool(self.release_stale_claims)
+                await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Dispatching scheduled SMS failed: {str(e)}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started_at)))
+
+    async def dispatch_once(self) -> int:
+        """Publish the messages due now, within this interval's budget, and return how many"""
+        limit = min(self.batch_size, max(1, int(self.max_rate * self.interval)))
+        await run_in_threadpool(self._expand, limit)
+        claimed = await run_in_threadpool(self._claim, limit)
+        if not claimed:
+            return 0
+
+        publishes = await asyncio.gather(*(
+            asyncio.wrap_future(self.batcher.submit(
+                message["recipient_number"],
+                message["content"],
+                sim_number=message["sim_number"],
+                edge=message["edge"],
+                message_id=message["message_id"],
+                priority=message["priority"],
+                tenant=message["user_id"],
+                weight=plan_weights.get(message["plan"] or "standard", 1)
+            ))
+            for message in claimed
+        ))
+        await run_in_threadpool(self._record, claimed, publishes)
+        self.last_dispatched_at = datetime.utcnow()
+        logger.info(f"Dispatched {len(claimed)} scheduled SMS")
+        return len(claimed)
+
+    def _expand(self, limit: int) -> int:
+        """Turn up to ``limit`` numbers of due list sends into scheduled SMS and return how many"""
+        now = datetime.utcnow()
+        expanded = 0
+        users = set()
+        db = SessionLocal()
+        try:
+            while expanded < limit:
+                job = db.query(ListSend).filter(
+                    ListSend.status == ListSendStatus.SCHEDULED,
+                    ListSend.send_at <= now
+                ).order_by(ListSend.send_at, ListSend.id).first()
+                if job is None:
+                    break
+                size = min(limit - expanded, job.count - job.position)
+                # 8 bytes per number; substr counts from 1
+                page = db.query(func.substr(ContactList.numbers, job.position * 8 + 1, size * 8)).filter(
+                    ContactList.id == job.contact_list_id
+                ).scalar()
+                numbers = from_blob(page or b"")
+                sim_ids = [int(sim_id) for sim_id in job.sim_ids.split(",")]
+                senders = dict(db.query(Sim.id, Sim.phone_number).filter(Sim.id.in_(sim_ids)))
+                if numbers:
+                    # Columns shared by the chunk are bound once
+                    # Ids derive from the batch so that a re-run chunk gets the same
+                    # ones, and are UUIDs as binary frames require
+                    batch_id = uuid.UUID(job.batch_id)
+                    db.execute(
+                        insert(SMS.__table__).values(
+                            user_id=job.user_id,
+                            transaction_id=job.transaction_id,
+                            content=job.content,
+                            encoding=job.encoding,
+                            segments=job.segments,
+                            price=job.segments,
+                            priority=job.priority,
+                            send_at=job.send_at,
+                            status=SMSStatus.SCHEDULED,
+                            direction=SMSDirection.OUTBOUND
+                        ),
+                        [
+                            {
+                                "sim_id": sim_ids[index % len(sim_ids)],
+                                "message_id": str(uuid.uuid5(batch_id, str(index))),
+                                "recipient_number": format_number(number),
+                                "sender_number": senders.get(sim_ids[index % len(sim_ids)]),
+                            }
+                            for index, number in enumerate(numbers, start=job.position)
+                        ]
+                    )
+                else:
+                    logger.error(f"The contact list of list send {job.id} is gone; {job.count - job.position} numbers skipped")
+                position = job.position + len(numbers) if numbers else job.count
+                # Conditional, so a chunk is never expanded twice by two leaders
+                advanced = db.execute(
+                    update(ListSend)
+                    .where(ListSend.id == job.id, ListSend.position == job.position)
+                    .values(
+                        position=position,
+                        status=ListSendStatus.DONE if position >= job.count else ListSendStatus.SCHEDULED
+                    )
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not advanced:
+                    db.rollback()
+                    continue
+                db.commit()
+                expanded += len(numbers)
+                users.add(job.user_id)
+        finally:
+            db.close()
+        for user_id in users:
+            bump_versions(user_id, "sms")
+        return expanded
+
+    def _claim(self, limit: int) -> List[dict]:
+        """Move the oldest due messages from scheduled to pending and return them"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # Messages of unhealthy SIMs wait, except for an occasional probe
+            due = db.query(SMS.id, SMS.sim_id).filter(SMS.status == SMSStatus.SCHEDULED, SMS.send_at <= now)
+            shed_sims = sim_health.shed_sims()
+            if shed_sims:
+                due = due.filter(SMS.sim_id.notin_(shed_sims))
+            quotas = {}
+            due_ids = []
+            for sms_id, sim_id in due.order_by(SMS.send_at).limit(limit):
+                if sim_id not in quotas:
+                    quotas[sim_id] = sim_health.admit(sim_id)
+                if quotas[sim_id] is None:
+                    due_ids.append(sms_id)
+                elif quotas[sim_id] > 0:
+                    quotas[sim_id] -= 1
+                    due_ids.append(sms_id)
+            if not due_ids:
+                return []
+            claimed_rows = db.execute(
+                update(SMS)
+                .where(SMS.id.in_(due_ids), SMS.status == SMSStatus.SCHEDULED)
+                .values(status=SMSStatus.PENDING, claimed_at=now)
+                .returning(SMS.id, SMS.user_id, SMS.message_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            claimed_ids = [row.id for row in claimed_rows]
+            queue_events(db, [
+                (row.user_id, sms_status_event(row.id, row.message_id, SMSStatus.PENDING)) for row in claimed_rows
+            ])
+            rows = db.query(
+                SMS.id, SMS.user_id, SMS.sim_id, SMS.message_id, SMS.recipient_number, SMS.content, SMS.priority,
+                Sim.phone_number, Sim.iccid, User.plan
+            ).join(Sim, SMS.sim_id == Sim.id).join(User, SMS.user_id == User.id).filter(
+                SMS.id.in_(claimed_ids)
+            ).order_by(SMS.send_at).all()
+            orphaned_ids = set(claimed_ids) - {row.id for row in rows}
+            refunded_users = _fail_orphaned(db, orphaned_ids) if orphaned_ids else set()
+            edges = dict(
+                db.query(EdgeSim.edge_sim_id, EdgeSim.edge).filter(
+                    EdgeSim.edge_sim_id.in_({row.iccid for row in rows})
+                ).all()
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        claimed = []
+        for row in rows:
+            edge = edges.get(row.iccid)
+            message_tracer.mark(row.message_id, "accepted", user_id=row.user_id, sim_number=row.phone_number, edge=edge)
+            claimed.append({
+                "id": row.id,
+                "user_id": row.user_id,
+                "sim_id": row.sim_id,
+                "message_id": row.message_id,
+                "recipient_number": row.recipient_number,
+                "content": row.content,
+                "priority": row.priority.value,
+                "sim_number": row.phone_number,
+                "edge": edge,
+                "plan": row.plan,
+            })
+        for user_id in {message["user_id"] for message in claimed} | refunded_users:
+            bump_versions(user_id, "sms")
+        for user_id in refunded_users:
+            bump_versions(user_id, "wallet")
+        return claimed
+
+    def release_stale_claims(self) -> int:
+        """Schedule again the claimed messages without a publish outcome after ``claim_timeout``"""
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                update(SMS)
+                .where(
+                    SMS.status == SMSStatus.PENDING,
+                    SMS.claimed_at < datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+                )
+                .values(status=SMSStatus.SCHEDULED, claimed_at=None)
+                .returning(SMS.id, SMS.user_id, SMS.message_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            queue_events(db, [
+                (row.user_id, sms_status_event(row.id, row.message_id, SMSStatus.SCHEDULED)) for row in rows
+            ])
+            db.commit()
+        finally:
+            db.close()
+        if rows:
+            logger.warning(f"Scheduled {len(rows)} SMS again whose claim expired without a publish outcome")
+        for user_id in {row.user_id for row in rows}:
+            bump_versions(user_id, "sms")
+        return len(rows)
+
+    def _record(self, claimed: List[dict], publishes: List[bool]):
+        for message, published in zip(claimed, publishes):
+            sim_health.record_publish(message["sim_id"], published)
+        db = SessionLocal()
+        try:
+            record_publish_results(
+                db,
+                [message["id"] for message, published in zip(claimed, publishes) if published],
+                [message["id"] for message, published in zip(claimed, publishes) if not published]
+            )
+            db.commit()
+        finally:
+            db.close()
+        for user_id in {message["user_id"] for message in claimed}:
+            bump_versions(user_id, "sms")
+
+
+def _fail_orphaned(db, sms_ids: Set[int]) -> Set[int]:
+    """Fail claimed messages whose SIM no longer exists and refund them; return the users refunded"""
+    error = "SIM no longer exists"
+    rows = db.execute(
+        update(SMS)
+        .where(SMS.id.in_(sms_ids), SMS.status == SMSStatus.PENDING)
+        .values(status=SMSStatus.FAILED, error_message=error)
+        .returning(SMS.id, SMS.user_id, SMS.message_id, SMS.price)
+        .execution_options(synchronize_session=False)
+    ).all()
+    queue_events(db, [(row.user_id, sms_status_event(row.id, row.message_id, SMSStatus.FAILED, error)) for row in rows])
+
+    refunds: Dict[int, List] = {}
+    for row in rows:
+        refunds.setdefault(row.user_id, []).append(row.price or 0)
+    for wallet in db.query(Wallet).filter(Wallet.user_id.in_(list(refunds))):
+        amount = sum(refunds[wallet.user_id])
+        if not amount:
+            continue
+        db.add(Transaction(
+            user_id=wallet.user_id,
+            wallet_id=wallet.id,
+            amount=amount,
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.COMPLETED,
+            description=f"Refund for {len(refunds[wallet.user_id])} scheduled SMS whose SIM no longer exists"
+        ))
+        wallet.balance += amount
+    logger.warning(f"Failed {len(rows)} scheduled SMS whose SIM no longer exists")
+    return set(refunds)
+
+
+scheduled_dispatcher = ScheduledDispatcher(
+    sms_batcher,
+    settings.SCHEDULE_POLL_SECONDS,
+    settings.SCHEDULE_BATCH_SIZE,
+    settings.SCHEDULE_MAX_RATE,
+    settings.SCHEDULE_CLAIM_TIMEOUT_SECONDS
+)
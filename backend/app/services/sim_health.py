@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import insert, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.sim_health import SimHealth
+from . import metrics
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+
+# Weight of the newest delivery in the latency moving average
+LATENCY_ALPHA = 0.2
+
+# Topic the workers exchange breaker openings and recoveries on
+RELAY_TOPIC = "cloud/sim-health"
+
+
+@dataclass
+class _SimStats:
+    updated_at: float
+    published: float = 0.0
+    delivered: float = 0.0
+    failed: float = 0.0
+    publish_failures: float = 0.0
+    latency: Optional[float] = None
+    opened_at: Optional[float] = None
+    opened_wall: Optional[datetime] = None
+    last_probe_at: Optional[float] = None
+
+
+class SimHealthTracker:
+    """
+    Rolling health score per SIM, and a breaker that sheds traffic from
+    unhealthy SIMs.
+
+    The score multiplies the share of delivery reports that say delivered,
+    the share of publishes the broker acknowledged and, when the average
+    time from publish to delivery exceeds ``latency_target``, the ratio of
+    the two. Counts decay with a half-life of ``half_life`` seconds, so old
+    outcomes fade. A SIM with at least ``min_samples`` outcomes and a score
+    under ``threshold`` is unhealthy. It then gets one probe message every
+    ``probe_interval`` seconds, and a delivery of a message sent after it
+    turned unhealthy makes it healthy again with fresh counts.
+
+    Each worker scores the publishes it made and the delivery reports it
+    consumed. Each ratio compares counts of the same source, so every worker
+    gets a fair sample of a SIM's health. The leader persists its scores
+    every ``persist_interval`` seconds, and workers start from them.
+    When not ``enabled`` scores are kept but no traffic is shed.
+
+    With a relay, a worker that opens or resets a breaker tells the others
+    on RELAY_TOPIC. The delivery report of a probe goes to whichever worker
+    the broker picks, and that worker can only recover the SIM if it knows
+    when the breaker opened.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        half_life: float,
+        min_samples: float,
+        threshold: float,
+        latency_target: float,
+        probe_interval: float,
+        persist_interval: float
+    ):
+        self.enabled = enabled
+        self.half_life = half_life
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.latency_target = latency_target
+        self.probe_interval = probe_interval
+        self.persist_interval = persist_interval
+        self._stats: Dict[int, _SimStats] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.origin = secrets.token_hex(6)
+        self._relay = None
+
+    def enable_relay(self, mqtt):
+        """Share breaker openings and recoveries through ``mqtt`` with the other workers"""
+        self._relay = mqtt
+        mqtt.subscribe(RELAY_TOPIC, self.handle_relayed, shared=False)
+
+    def _publish_transition(self, sim_id: int, state: str, opened_at: Optional[datetime] = None):
+        if self._relay is None:
+            return
+        payload = json.dumps({
+            "origin": self.origin,
+            "sim_id": sim_id,
+            "state": state,
+            "opened_at": opened_at.isoformat() if opened_at else None,
+        })
+        try:
+            self._relay.publish_nowait(RELAY_TOPIC, payload)
+        except Exception:
+            logger.exception("Relaying SIM health failed")
+
+    def handle_relayed(self, payload: bytes):
+        """Apply a breaker opening or recovery of another worker"""
+        try:
+            message = json.loads(payload)
+            if message["origin"] == self.origin:
+                return
+            sim_id = int(message["sim_id"])
+            state = message["state"]
+            opened_at = datetime.fromisoformat(message["opened_at"]) if message.get("opened_at") else None
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Ignoring malformed relayed SIM health: %r", payload[:200])
+            return
+        now = time.monotonic()
+        with self._lock:
+            stats = self._get(sim_id, now)
+            if state == HEALTHY and stats.opened_at is not None:
+                self._reset(sim_id, now)
+            elif state == UNHEALTHY and opened_at is not None:
+                if stats.opened_at is None:
+                    stats.opened_at = stats.last_probe_at = now
+                    stats.opened_wall = opened_at
+                else:
+                    # The earliest opening decides which deliveries are probes
+                    stats.opened_wall = min(stats.opened_wall, opened_at)
+
+    def _get(self, sim_id: int, now: float) -> _SimStats:
+        """The stats of ``sim_id`` decayed to ``now``; call with the lock held"""
+        stats = self._stats.get(sim_id)
+        if stats is None:
+            stats = self._stats[sim_id] = _SimStats(updated_at=now)
+            return stats
+        factor = 0.5 ** ((now - stats.updated_at) / self.half_life)
+        stats.published *= factor
+        stats.delivered *= factor
+        stats.failed *= factor
+        stats.publish_failures *= factor
+        stats.updated_at = now
+        return stats
+
+    def _score(self, stats: _SimStats) -> Optional[float]:
+        reports = stats.delivered + stats.failed
+        publishes = stats.published + stats.publish_failures
+        if reports + stats.publish_failures < self.min_samples:
+            return None
+        score = 1.0
+        if reports:
+            score *= stats.delivered / reports
+        if publishes:
+            score *= stats.published / publishes
+        if stats.latency is not None and stats.latency > self.latency_target:
+            score *= self.latency_target / stats.latency
+        return score
+
+    def _update_state(self, sim_id: int, now: float) -> bool:
+        """Open the breaker of ``sim_id`` if its score fell under the threshold; return whether it did"""
+        stats = self._stats[sim_id]
+        if stats.opened_at is not None:
+            return False
+        score = self._score(stats)
+        if score is not None and score < self.threshold:
+            stats.opened_at = stats.last_probe_at = now
+            stats.opened_wall = datetime.utcnow()
+            logger.warning(f"SIM {sim_id} is unhealthy (score {score:.2f}); shedding its traffic")
+            return True
+        return False
+
+    def _reset(self, sim_id: int, now: float):
+        self._stats[sim_id] = _SimStats(updated_at=now)
+        logger.info(f"SIM {sim_id} recovered")
+
+    def record_publish(self, sim_id: int, published: bool):
+        """Record whether the broker acknowledged a message sent through ``sim_id``"""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._get(sim_id, now)
+            if published:
+                stats.published += 1
+            else:
+                stats.publish_failures += 1
+            opened = self._update_state(sim_id, now)
+        if opened:
+            self._publish_transition(sim_id, UNHEALTHY, stats.opened_wall)
+
+    def record_delivery(self, sim_id: int, delivered: bool, sent_at: Optional[datetime], reported_at: Optional[datetime]):
+        """Record the delivery report of a message sent through ``sim_id`` at ``sent_at``"""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._get(sim_id, now)
+            # Send times have whole seconds
+            if stats.opened_at is not None and delivered and sent_at is not None \
+                    and sent_at > stats.opened_wall - timedelta(seconds=1):
+                # A message sent while unhealthy, such as a probe, got through
+                self._reset(sim_id, now)
+                recovered, opened = True, False
+            else:
+                recovered = False
+                if delivered:
+                    stats.delivered += 1
+                    if sent_at is not None and reported_at is not None:
+                        latency = max(0.0, (reported_at - sent_at).total_seconds())
+                        stats.latency = latency if stats.latency is None else (
+                            LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * stats.latency
+                        )
+                else:
+                    stats.failed += 1
+                opened = self._update_state(sim_id, now)
+        if recovered:
+            self._publish_transition(sim_id, HEALTHY)
+        elif opened:
+            self._publish_transition(sim_id, UNHEALTHY, stats.opened_wall)
+
+    def admit(self, sim_id: int) -> Optional[int]:
+        """
+        How many messages ``sim_id`` may take now: None for any number, 1
+        when an unhealthy SIM is due a probe (which this call uses up) and 0
+        while its traffic is shed.
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(sim_id)
+            if stats is None or stats.opened_at is None:
+                return None
+            if now - stats.last_probe_at < self.probe_interval:
+                return 0
+            stats.last_probe_at = now
+            return 1
+
+    def is_shed(self, sim_id: int) -> bool:
+        """Whether ``sim_id`` is unhealthy and not due a probe; unlike admit() this uses up nothing"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            stats = self._stats.get(sim_id)
+            return stats is not None and stats.opened_at is not None \
+                and time.monotonic() - stats.last_probe_at < self.probe_interval
+
+    def shed_sims(self) -> Set[int]:
+        """Unhealthy SIMs that aren't due a probe"""
+        if not self.enabled:
+            return set()
+        now = time.monotonic()
+        with self._lock:
+            return {
+                sim_id for sim_id, stats in self._stats.items()
+                if stats.opened_at is not None and now - stats.last_probe_at < self.probe_interval
+            }
+
+    def snapshot(self, sim_ids: Optional[List[int]] = None) -> Dict[int, dict]:
+        """Current health of ``sim_ids``, or of every tracked SIM"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for sim_id in (sim_ids if sim_ids is not None else list(self._stats)):
+                if sim_id not in self._stats:
+                    continue
+                stats = self._get(sim_id, now)
+                score = self._score(stats)
+                result[sim_id] = {
+                    "sim_id": sim_id,
+                    "state": UNHEALTHY if stats.opened_at is not None else HEALTHY,
+                    "score": round(score, 4) if score is not None else None,
+                    "published": round(stats.published, 2),
+                    "delivered": round(stats.delivered, 2),
+                    "failed": round(stats.failed, 2),
+                    "publish_failures": round(stats.publish_failures, 2),
+                    "latency_seconds": round(stats.latency, 3) if stats.latency is not None else None,
+                    "opened_at": stats.opened_wall,
+                }
+            return result
+
+    @property
+    def unhealthy_count(self) -> int:
+        return sum(1 for stats in self._stats.values() if stats.opened_at is not None)
+
+    def load(self):
+        """Start from the persisted scores"""
+        db = SessionLocal()
+        try:
+            records = db.query(SimHealth).all()
+        except Exception as e:
+            logger.warning(f"Could not load SIM health: {str(e)}")
+            return
+        finally:
+            db.close()
+        now, wall = time.monotonic(), datetime.utcnow()
+        with self._lock:
+            for record in records:
+                stats = _SimStats(
+                    updated_at=now - (wall - record.updated_at).total_seconds(),
+                    published=record.published,
+                    delivered=record.delivered,
+                    failed=record.failed,
+                    publish_failures=record.publish_failures,
+                    latency=record.latency_seconds
+                )
+                if record.state == UNHEALTHY:
+                    stats.opened_at = stats.last_probe_at = now
+                    stats.opened_wall = record.opened_at or wall
+                self._stats[record.sim_id] = stats
+        if records:
+            logger.info(f"Loaded the health of {len(records)} SIMs")
+
+    def persist(self):
+        """Write the current scores to the sim_health table"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            existing = {
+                sim_id for (sim_id,) in db.query(SimHealth.sim_id).filter(SimHealth.sim_id.in_(list(snapshot)))
+            }
+            rows = [{**health, "updated_at": now} for health in snapshot.values()]
+            inserts = [row for row in rows if row["sim_id"] not in existing]
+            updates = [row for row in rows if row["sim_id"] in existing]
+            if inserts:
+                db.execute(insert(SimHealth), inserts)
+            if updates:
+                db.execute(update(SimHealth), updates)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await run_in_threadpool(self.persist)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Persisting SIM health failed: {str(e)}")
+
+
+sim_health = SimHealthTracker(
+    settings.SIM_HEALTH_ENABLED,
+    settings.SIM_HEALTH_HALF_LIFE_SECONDS,
+    settings.SIM_HEALTH_MIN_SAMPLES,
+    settings.SIM_HEALTH_THRESHOLD,
+    settings.SIM_HEALTH_LATENCY_TARGET_SECONDS,
+    settings.SIM_HEALTH_PROBE_SECONDS,
+    settings.SIM_HEALTH_PERSIST_SECONDS
+)
+metrics.sims_unhealthy.set_function(lambda: sim_health.unhealthy_count)
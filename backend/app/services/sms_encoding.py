@@ -0,0 +1,163 @@
+import struct
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+GSM7 = "gsm7"
+UCS2 = "ucs2"
+
+# Value of the payload encodings edges announce on edges/<edge>/capabilities
+BINARY_ENCODING = "binary-v1"
+
+# GSM 03.38 default alphabet; a character's index is its septet
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Extension table, reached through the escape septet 0x1B; each costs two septets
+GSM7_EXTENSION = {
+    "\f": 0x0A, "^": 0x14, "{": 0x28, "}": 0x29, "\\": 0x2F,
+    "[": 0x3C, "~": 0x3D, "]": 0x3E, "|": 0x40, "€": 0x65,
+}
+GSM7_ESCAPE = 0x1B
+
+_GSM7_CODES: Dict[str, bytes] = {char: bytes([code]) for code, char in enumerate(GSM7_BASIC) if code != GSM7_ESCAPE}
+_GSM7_CODES.update((char, bytes([GSM7_ESCAPE, code])) for char, code in GSM7_EXTENSION.items())
+_GSM7_CHARS = {code: char for char, code in _GSM7_CODES.items()}
+
+# Units per segment: septets for GSM-7, UTF-16 code units for UCS-2. A
+# concatenated message loses room in every segment to the 6 byte header.
+SINGLE_SEGMENT_UNITS = {GSM7: 160, UCS2: 70}
+MULTI_SEGMENT_UNITS = {GSM7: 153, UCS2: 67}
+
+_ENCODING_CODES = {GSM7: 0, UCS2: 1}
+_ENCODINGS = {code: encoding for encoding, code in _ENCODING_CODES.items()}
+
+
+def detect_encoding(text: str) -> str:
+    """GSM-7 when every character is in the default alphabet or its extension, UCS-2 otherwise"""
+    return GSM7 if all(char in _GSM7_CODES for char in text) else UCS2
+
+
+def _units(text: str, encoding: str) -> List[bytes]:
+    """The encoded form of each character, which must not be split across segments"""
+    if encoding == GSM7:
+        return [_GSM7_CODES[char] for char in text]
+    # Characters outside the BMP take a surrogate pair of two code units
+    return [char.encode("utf-16-be") for char in text]
+
+
+def _unit_count(encoded: bytes, encoding: str) -> int:
+    return len(encoded) if encoding == GSM7 else len(encoded) // 2
+
+
+def split_segments(text: str) -> Tuple[str, List[bytes]]:
+    """
+    Encode ``text`` as GSM-7 septets (one per byte, unpacked) or UTF-16BE and
+    split it into the segments an edge sends, without splitting escape
+    sequences or surrogate pairs.
+    """
+    encoding = detect_encoding(text)
+    units = _units(text, encoding)
+    encoded = b"".join(units)
+    if _unit_count(encoded, encoding) <= SINGLE_SEGMENT_UNITS[encoding]:
+        return encoding, [encoded]
+
+    limit = MULTI_SEGMENT_UNITS[encoding]
+    segments, current, used = [], [], 0
+    for unit in units:
+        size = _unit_count(unit, encoding)
+        if used + size > limit:
+            segments.append(b"".join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += size
+    segments.append(b"".join(current))
+    return encoding, segments
+
+
+def segment_count(text: str) -> Tuple[str, int]:
+    """The encoding of ``text`` and the number of segments it is sent as"""
+    encoding, segments = split_segments(text)
+    return encoding, len(segments)
+
+
+def decode_segments(encoding: str, segments: List[bytes]) -> str:
+    """Text of the segments produced by ``split_segments``"""
+    data = b"".join(segments)
+    if encoding == UCS2:
+        return data.decode("utf-16-be")
+    chars, index = [], 0
+    while index < len(data):
+        width = 2 if data[index] == GSM7_ESCAPE else 1
+        chars.append(_GSM7_CHARS[data[index:index + width]])
+        index += width
+    return "".join(chars)
+
+
+def _pack_string(value: Optional[str]) -> bytes:
+    data = (value or "").encode()
+    return struct.pack("!B", len(data)) + data
+
+
+def encode_frame(batch_id: str, edge: Optional[str], messages: List[dict]) -> bytes:
+    """
+    Encode ``send_sms`` payloads for one edge as a binary frame:
+
+        version u8 | batch id 16B | edge len u8 + utf-8 | message count u16
+        per message: message id 16B | number len u8 + ascii | sim number len u8 + ascii
+                     | encoding u8 (0 GSM-7, 1 UCS-2) | segment count u8
+                     | per segment: length u8 + encoded segment
+
+    Message and batch ids must be UUIDs. Integers are big-endian.
+    """
+    parts = [struct.pack("!B", 1), uuid.UUID(batch_id).bytes, _pack_string(edge), struct.pack("!H", len(messages))]
+    for message in messages:
+        encoding, segments = split_segments(message["message"])
+        parts += [
+            uuid.UUID(message["message_id"]).bytes,
+            _pack_string(message["number"]),
+            _pack_string(message.get("sim_number")),
+            struct.pack("!BB", _ENCODING_CODES[encoding], len(segments)),
+        ]
+        for segment in segments:
+            parts += [struct.pack("!B", len(segment)), segment]
+    return b"".join(parts)
+
+
+def decode_frame(frame: bytes) -> dict:
+    """Decode a frame built by ``encode_frame``, as edges do"""
+    offset = 0
+
+    def take(size: int) -> bytes:
+        nonlocal offset
+        data = frame[offset:offset + size]
+        if len(data) != size:
+            raise ValueError("Truncated SMS frame")
+        offset += size
+        return data
+
+    def take_string() -> str:
+        return take(take(1)[0]).decode()
+
+    version = take(1)[0]
+    if version != 1:
+        raise ValueError(f"Unsupported SMS frame version {version}")
+    batch_id = str(uuid.UUID(bytes=take(16)))
+    edge = take_string() or None
+    messages = []
+    for _ in range(struct.unpack("!H", take(2))[0]):
+        message_id = str(uuid.UUID(bytes=take(16)))
+        number = take_string()
+        sim_number = take_string() or None
+        encoding_code, count = struct.unpack("!BB", take(2))
+        encoding = _ENCODINGS[encoding_code]
+        segments = [take(take(1)[0]) for _ in range(count)]
+        messages.append({
+            "message_id": message_id,
+            "number": number,
+            "sim_number": sim_number,
+            "encoding": encoding,
+            "segments": segments,
+            "message": decode_segments(encoding, segments),
+        })
+    return {"batch_id": batch_id, "edge": edge, "messages": messages}
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.message_trace import MessageTrace, TRACE_STAGES
+from ..models.sms import SMS, SMSStatus
+from .events import queue_events, sms_status_event
+from .sim_health import sim_health
+from .versioning import bump_versions
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Time spent between two stages, named after where it is spent
+TRACE_SEGMENTS = (
+    ("api", "accepted", "enqueued"),
+    ("client", "enqueued", "published"),
+    ("broker", "published", "acked"),
+    ("to_edge", "published", "edge_received"),
+    ("carrier", "edge_received", "delivered"),
+    ("total", "accepted", "delivered"),
+)
+
+# Statuses an edge reports on sms/status, and the stage each one marks
+EDGE_STATUS_STAGES = {
+    "received": "edge_received",
+    "delivered": "delivered",
+    "failed": None,
+}
+
+# Order of the edge statuses on a trace; a report never moves a trace back,
+# and delivered may replace failed as it does on the SMS row
+TRACE_STATUS_RANKS = {
+    "received": 1,
+    "failed": 2,
+    "delivered": 3,
+}
+
+# SMS statuses a delivery report may replace
+FINAL_STATUS_SOURCES = {
+    SMSStatus.DELIVERED: (SMSStatus.PENDING, SMSStatus.SENT, SMSStatus.FAILED),
+    SMSStatus.FAILED: (SMSStatus.PENDING, SMSStatus.SENT),
+}
+
+
+class MessageTracer:
+    """
+    Records when each outbound SMS passes a stage, keyed by its message_id.
+
+    Marks only touch an in-memory buffer, so they are cheap enough for the
+    send path and the MQTT network thread. A background task writes the
+    buffer to the message_traces table every ``flush_interval`` seconds,
+    together with the SMS status changes reported by the edges.
+    """
+
+    def __init__(self, flush_interval: float, retention: timedelta):
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._pending: Dict[str, dict] = {}
+        # message_id -> (status, error, first seen, reported at); kept until the SMS row is committed
+        self._statuses: Dict[str, Tuple[SMSStatus, Optional[str], float, Optional[datetime]]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    def mark(self, message_id: Optional[str], stage: str, at: Optional[datetime] = None, **fields):
+        """Record that ``message_id`` reached ``stage``; the first mark of a stage wins"""
+        if not message_id:
+            return
+        with self._lock:
+            entry = self._pending.setdefault(message_id, {})
+            entry.setdefault(f"{stage}_at", at or datetime.utcnow())
+            entry.update((key, value) for key, value in fields.items() if value is not None)
+
+    def handle_status_report(self, payload: bytes):
+        """
+        Consume a delivery report published by an edge on sms/status:
+
+            {"message_id": "...", "status": "received|delivered|failed", "timestamp": 1700000000.123, "error": "..."}
+
+        ``timestamp`` is when the edge saw the event, in seconds since the
+        epoch; the time the report arrives is used when it is missing.
+        """
+        try:
+            report = json.loads(payload)
+            message_id = report["message_id"]
+            edge_status = report["status"]
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Ignoring malformed SMS status report: %r", payload[:200])
+            return
+        if edge_status not in EDGE_STATUS_STAGES:
+            logger.warning("Ignoring unknown SMS status %r", edge_status, extra={"message_id": message_id})
+            return
+
+        at = None
+        if isinstance(report.get("timestamp"), (int, float)):
+            at = datetime.utcfromtimestamp(report["timestamp"])
+        self.record_status(message_id, edge_status, at, report.get("error"))
+
+    def record_status(self, message_id: str, edge_status: str, at: Optional[datetime] = None, error: Optional[str] = None):
+        """Record a status from EDGE_STATUS_STAGES reported by an edge for ``message_id``"""
+        stage = EDGE_STATUS_STAGES[edge_status]
+        with self._lock:
+            entry = self._pending.setdefault(message_id, {})
+            if stage:
+                entry.setdefault(f"{stage}_at", at or datetime.utcnow())
+            if TRACE_STATUS_RANKS[edge_status] >= TRACE_STATUS_RANKS.get(entry.get("status"), 0):
+                entry["status"] = edge_status
+            if edge_status in ("delivered", "failed"):
+                sms_status = SMSStatus.DELIVERED if edge_status == "delivered" else SMSStatus.FAILED
+                self._statuses[message_id] = (sms_status, error, time.monotonic(), at or datetime.utcnow())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_in_threadpool(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await run_in_threadpool(self.flush)
+                if time.monotonic() - self._last_purge > 3600:
+                    await run_in_threadpool(self.purge)
+            except Exception as e:
+                logger.error(f"Writing message traces failed: {str(e)}")
+
+    def flush(self):
+        """Write buffered marks and apply buffered delivery reports"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            statuses, self._statuses = self._statuses, {}
+        if not pending and not statuses:
+            return
+
+        db = SessionLocal()
+        try:
+            if pending:
+                _write_traces(db, pending)
+
+            changed_users = set()
+            outcomes = []
+            unresolved = dict(statuses)
+            if statuses:
+                rows = db.query(SMS.id, SMS.message_id, SMS.user_id, SMS.sim_id, SMS.status, SMS.updated_at).filter(
+                    SMS.message_id.in_(list(statuses))
+                ).all()
+                updates, events = [], []
+                for row in rows:
+                    sms_status, error, _, reported_at = unresolved.pop(row.message_id)
+                    if row.status in FINAL_STATUS_SOURCES[sms_status]:
+                        updates.append({"id": row.id, "status": sms_status, "error_message": error})
+                        changed_users.add(row.user_id)
+                        events.append((row.user_id, sms_status_event(row.id, row.message_id, sms_status, error)))
+                        # Sent rows were last updated when they were published
+                        sent_at = row.updated_at if row.status == SMSStatus.SENT else None
+                        outcomes.append((row.sim_id, sms_status == SMSStatus.DELIVERED, sent_at, reported_at))
+                if updates:
+                    db.execute(update(SMS), updates)
+                    queue_events(db, events)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Delivery reports are worth another attempt, traces are not
+            self._requeue_statuses(statuses)
+            raise
+        finally:
+            db.close()
+
+        for user_id in changed_users:
+            bump_versions(user_id, "sms")
+        for sim_id, delivered, sent_at, reported_at in outcomes:
+            if sim_id is not None:
+                sim_health.record_delivery(sim_id, delivered, sent_at, reported_at)
+        # Reports can overtake the commit of the SMS they belong to
+        self._requeue_statuses(unresolved)
+
+    def _requeue_statuses(self, statuses: Dict[str, Tuple[SMSStatus, Optional[str], float, Optional[datetime]]]):
+        deadline = time.monotonic() - settings.TRACE_STATUS_RETRY_SECONDS
+        with self._lock:
+            for message_id, value in statuses.items():
+                if value[2] >= deadline:
+                    self._statuses.setdefault(message_id, value)
+
+    def purge(self):
+        """Delete traces older than the retention period"""
+        self._last_purge = time.monotonic()
+        db = SessionLocal()
+        try:
+            deleted = db.query(MessageTrace).filter(
+                MessageTrace.accepted_at < datetime.utcnow() - self.retention
+            ).delete(synchronize_session=False)
+            db.commit()
+            if deleted:
+                logger.info(f"Deleted {deleted} expired message traces")
+        finally:
+            db.close()
+
+
+def _write_traces(db, pending: Dict[str, dict]):
+    """
+    Merge buffered marks into message_traces.
+
+    Marks of one message can be buffered by several workers, e.g. the one
+    that sent it and the one that consumed its delivery report, so rows are
+    upserted: stage times already stored win, the status only moves forward
+    in TRACE_STATUS_RANKS and other fields are overwritten.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        existing = {
+            trace.message_id: trace
+            for trace in db.query(MessageTrace).filter(MessageTrace.message_id.in_(list(pending)))
+        }
+        for message_id, fields in pending.items():
+            trace = existing.get(message_id)
+            if trace is None:
+                db.add(MessageTrace(message_id=message_id, **fields))
+                continue
+            for key, value in fields.items():
+                if key.endswith("_at") and getattr(trace, key) is not None:
+                    continue
+                if key == "status" and TRACE_STATUS_RANKS.get(value, 0) < TRACE_STATUS_RANKS.get(trace.status, 0):
+                    continue
+                setattr(trace, key, value)
+        return
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = MessageTrace.__table__
+    columns = [column.name for column in table.columns if column.name != "message_id"]
+    statement = insert(table)
+    excluded = statement.excluded
+    set_ = {
+        column: (
+            func.coalesce(table.c[column], excluded[column]) if column.endswith("_at")
+            else func.coalesce(excluded[column], table.c[column])
+        )
+        for column in columns
+    }
+    # A late or redelivered report doesn't move the status back
+    set_["status"] = case(
+        (_status_rank(excluded.status) >= _status_rank(table.c.status), set_["status"]),
+        else_=table.c.status
+    )
+    statement = statement.on_conflict_do_update(index_elements=["message_id"], set_=set_)
+    db.execute(statement, [
+        {"message_id": message_id, **{column: fields.get(column) for column in columns}}
+        for message_id, fields in pending.items()
+    ])
+
+
+def _status_rank(column):
+    return case(TRACE_STATUS_RANKS, value=column, else_=0)
+
+
+def _milliseconds(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds() * 1000, 3)
+
+
+def trace_detail(trace: MessageTrace) -> dict:
+    """A trace with its stage timestamps and the time spent in each segment"""
+    return {
+        "message_id": trace.message_id,
+        "status": trace.status,
+        "edge": trace.edge,
+        "sim_number": trace.sim_number,
+        "stages": {stage: getattr(trace, f"{stage}_at") for stage in TRACE_STAGES},
+        "durations_ms": {
+            name: _milliseconds(getattr(trace, f"{start}_at"), getattr(trace, f"{end}_at"))
+            for name, start, end in TRACE_SEGMENTS
+        },
+    }
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize_traces(traces: Iterable[MessageTrace], group_by: str) -> Dict[str, dict]:
+    """Count and p50/p90/p99 of every segment, per edge or per SIM number"""
+    key = "edge" if group_by == "edge" else "sim_number"
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    counts: Dict[str, Dict[str, int]] = {}
+    for trace in traces:
+        group = getattr(trace, key) or "unknown"
+        group_counts = counts.setdefault(group, {"messages": 0, "delivered": 0, "failed": 0})
+        group_counts["messages"] += 1
+        if trace.status in ("delivered", "failed"):
+            group_counts[trace.status] += 1
+        group_samples = samples.setdefault(group, {})
+        for name, start, end in TRACE_SEGMENTS:
+            duration = _milliseconds(getattr(trace, f"{start}_at"), getattr(trace, f"{end}_at"))
+            if duration is not None:
+                group_samples.setdefault(name, []).append(duration)
+
+    summary = {}
+    for group, group_counts in counts.items():
+        segments = {}
+        for name, values in samples[group].items():
+            values.sort()
+            segments[name] = {
+                "count": len(values),
+                "p50_ms": _percentile(values, 0.50),
+                "p90_ms": _percentile(values, 0.90),
+                "p99_ms": _percentile(values, 0.99),
+            }
+        summary[group] = {**group_counts, "segments": segments}
+    return summary
+
+
+message_tracer = MessageTracer(
+    settings.TRACE_FLUSH_INTERVAL_SECONDS,
+    timedelta(days=settings.TRACE_RETENTION_DAYS)
+)
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import secrets
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy import event
+
+from ..auth.dependencies import get_current_active_user
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models.user import User
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Version scope bumped by writes to each model
+MODEL_SCOPES = {
+    "SMS": "sms",
+    "Sim": "sims",
+    "Wallet": "wallet",
+    "Transaction": "wallet",
+}
+
+
+class MemoryVersionStore:
+    """
+    Per-user change counters kept in process memory.
+
+    The epoch changes on every restart so ETags handed out by a previous
+    process never match.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, scopes: Iterable[str]) -> List[int]:
+        return [self._versions[(user_id, scope)] for scope in scopes]
+
+    def bump(self, keys: Iterable[Tuple[int, str]]):
+        with self._lock:
+            for key in keys:
+                self._versions[key] += 1
+
+
+class RedisVersionStore:
+    """
+    Per-user change counters kept in Redis, shared by every worker.
+
+    Requires the optional ``redis`` package.
+    """
+
+    epoch = "r"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// VERSION_STORE_BACKEND")
+        self._client = redis.from_url(url)
+
+    def get(self, user_id: int, scopes: Iterable[str]) -> List[int]:
+        values = self._client.mget([f"version:{user_id}:{scope}" for scope in scopes])
+        return [int(value or 0) for value in values]
+
+    def bump(self, keys: Iterable[Tuple[int, str]]):
+        pipeline = self._client.pipeline()
+        for user_id, scope in keys:
+            pipeline.incr(f"version:{user_id}:{scope}")
+        pipeline.execute()
+
+
+def create_version_store(spec: str):
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisVersionStore(spec)
+    if settings.WEB_CONCURRENCY > 1:
+        # A worker's counters would miss writes made by the other workers and
+        # answer 304 for data that changed
+        logger.warning("ETags are disabled: several workers need a redis:// VERSION_STORE_BACKEND")
+        return None
+    return MemoryVersionStore()
+
+
+version_store = create_version_store(settings.VERSION_STORE_BACKEND)
+
+
+def bump_versions(user_id: int, *scopes: str):
+    """Bump versions for writes that bypass the ORM, such as bulk inserts"""
+    if version_store is not None:
+        version_store.bump((user_id, scope) for scope in scopes)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault("version_changes", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        scope = MODEL_SCOPES.get(type(obj).__name__)
+        user_id = getattr(obj, "user_id", None)
+        if scope and user_id is not None:
+            changes.add((user_id, scope))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_changes(session):
+    changes = session.info.pop("version_changes", None)
+    if changes and version_store is not None:
+        version_store.bump(changes)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("version_changes", None)
+
+
+class ResponseCache:
+    """LRU of serialized response bodies keyed by ETag"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+
+    def set(self, etag: str, body: bytes):
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+response_cache = (
+    ResponseCache(settings.RESPONSE_CACHE_MAX_ENTRIES)
+    if settings.RESPONSE_CACHE_ENABLED and version_store is not None else None
+)
+
+
+class CachedResponse(Exception):
+    """Raised to short-circuit an endpoint with a cached body"""
+
+    def __init__(self, etag: str, body: bytes):
+        self.etag = etag
+        self.body = body
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def conditional_get(*scopes: str):
+    """
+    Dependency adding version based ETags to a read endpoint.
+
+    The ETag is derived from the current user's change counters for
+    ``scopes`` and the request URL, so it is computed without querying the
+    data it describes. A matching ``If-None-Match`` answers 304, and with the
+    response cache enabled a known ETag answers with the stored body.
+    """
+    def dependency(
+        request: Request,
+        response: Response,
+        current_user: User = Depends(get_current_active_user)
+    ) -> str:
+        if version_store is None:
+            return ""
+        versions = version_store.get(current_user.id, scopes)
+        url_hash = hashlib.sha1(str(request.url.path + "?" + request.url.query).encode()).hexdigest()[:12]
+        etag = f'W/"{version_store.epoch}-{current_user.id}-{".".join(map(str, versions))}-{url_hash}"'
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        if response_cache is not None:
+            body = response_cache.get(etag)
+            if body is not None:
+                raise CachedResponse(etag, body)
+            # Picked up by ResponseCacheMiddleware once the body is rendered
+            request.state.response_cache_key = etag
+
+        response.headers["ETag"] = etag
+        return etag
+
+    return dependency
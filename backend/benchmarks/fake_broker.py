@@ -0,0 +1,261 @@
+"""
+Minimal in-process MQTT 3.1.1 broker for benchmarks.
+
+Supports CONNECT, PUBLISH (QoS 0 and 1), SUBSCRIBE, UNSUBSCRIBE, PINGREQ and
+DISCONNECT, which is everything the API's paho client uses, plus shared
+subscriptions (``$share/<group>/<filter>``), whose messages go round robin to
+one subscriber of each group, and retained messages. Messages are delivered
+to subscribers at QoS 0. Latency before each PUBACK and PUBACK loss can be
+injected to see how the send path behaves with a slow or lossy broker.
+"""
+import asyncio
+import random
+import struct
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def split_shared(topic_filter: str) -> Tuple[Optional[str], str]:
+    """Split ``$share/<group>/<filter>`` into group and filter; the group is None for plain filters"""
+    if topic_filter.startswith("$share/"):
+        _, group, shared_filter = topic_filter.split("/", 2)
+        return group, shared_filter
+    return None, topic_filter
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _Session:
+    def __init__(self, broker: "FakeBroker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions: List[str] = []
+
+    async def _read_packet(self) -> Tuple[int, int, bytes]:
+        header = await self.reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await self.reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def run(self):
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet()
+                if packet_type == CONNECT:
+                    await self._on_connect(body)
+                elif packet_type == PUBLISH:
+                    await self._on_publish(flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self._on_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._on_unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.send(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.broker._sessions.discard(self)
+            self.writer.close()
+
+    async def _on_connect(self, body: bytes):
+        # Skip protocol name, level, flags and keep alive to reach the client id
+        offset = 2 + struct.unpack("!H", body[:2])[0] + 4
+        length = struct.unpack("!H", body[offset:offset + 2])[0]
+        self.client_id = body[offset + 2:offset + 2 + length].decode() or f"anonymous-{id(self):x}"
+        self.send(_packet(CONNACK, 0, b"\x00\x00"))
+
+    async def _on_publish(self, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        length = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + length].decode()
+        offset = 2 + length
+        packet_id = None
+        if qos:
+            packet_id = struct.unpack("!H", body[offset:offset + 2])[0]
+            offset += 2
+        payload = body[offset:]
+
+        self.broker.published[topic] += 1
+        self.broker.published_bytes[topic] += len(payload)
+        if flags & 0x01:
+            self.broker.retained[topic] = payload
+        self.broker.deliver(topic, payload)
+
+        if qos:
+            if self.broker.latency:
+                await asyncio.sleep(self.broker.latency)
+            if self.broker.puback_loss and random.random() < self.broker.puback_loss:
+                self.broker.pubacks_dropped += 1
+                return
+            self.send(_packet(PUBACK, 0, struct.pack("!H", packet_id)))
+
+    def _on_subscribe(self, body: bytes):
+        packet_id = body[:2]
+        offset, granted = 2, bytearray()
+        topic_filters = []
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            topic_filters.append(body[offset + 2:offset + 2 + length].decode())
+            offset += 2 + length + 1
+            granted.append(0)
+        self.subscriptions.extend(topic_filters)
+        self.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+        for topic_filter in topic_filters:
+            _, plain_filter = split_shared(topic_filter)
+            for topic, payload in list(self.broker.retained.items()):
+                if topic_matches(plain_filter, topic):
+                    self.send(_packet(PUBLISH, 0x01, _encode_string(topic) + payload))
+
+    def _on_unsubscribe(self, body: bytes):
+        packet_id = body[:2]
+        offset = 2
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            topic_filter = body[offset + 2:offset + 2 + length].decode()
+            if topic_filter in self.subscriptions:
+                self.subscriptions.remove(topic_filter)
+            offset += 2 + length
+        self.send(_packet(UNSUBACK, 0, packet_id))
+
+
+class FakeBroker:
+    """
+    MQTT broker running on its own event loop thread.
+
+    ``latency`` delays every PUBACK by that many seconds and ``puback_loss``
+    is the probability that a PUBACK is never sent. ``hooks`` are called with
+    ``(topic, payload)`` for every published message, which lets stand-ins
+    for edges react to what the API publishes.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, puback_loss: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.puback_loss = puback_loss
+        self.published: Counter = Counter()
+        self.published_bytes: Counter = Counter()
+        self.retained: Dict[str, bytes] = {}
+        # Messages delivered per client id, to check how shared groups spread them
+        self.delivered: Counter = Counter()
+        self._round_robin: Counter = Counter()
+        self.pubacks_dropped = 0
+        self.hooks: List[Callable[[str, bytes], None]] = []
+        self._sessions = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def deliver(self, topic: str, payload: bytes):
+        for hook in self.hooks:
+            hook(topic, payload)
+        message = _packet(PUBLISH, 0, _encode_string(topic) + payload)
+        groups: Dict[Tuple[str, str], List[_Session]] = {}
+        for session in sorted(self._sessions, key=lambda session: session.client_id):
+            plain_match = False
+            for topic_filter in session.subscriptions:
+                group, shared_filter = split_shared(topic_filter)
+                if not topic_matches(shared_filter, topic):
+                    continue
+                if group is None:
+                    plain_match = True
+                else:
+                    groups.setdefault((group, shared_filter), []).append(session)
+            if plain_match:
+                self.delivered[session.client_id] += 1
+                session.send(message)
+        for key, members in groups.items():
+            session = members[self._round_robin[key] % len(members)]
+            self._round_robin[key] += 1
+            self.delivered[session.client_id] += 1
+            session.send(message)
+
+    def inject(self, topic: str, payload: bytes, delay: float = 0.0, retain: bool = False):
+        """Publish a message from outside the broker's loop, e.g. as an edge, after ``delay`` seconds"""
+        if retain:
+            self.retained[topic] = payload
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, self.deliver, topic, payload)
+
+    async def _handle(self, reader, writer):
+        session = _Session(self, reader, writer)
+        self._sessions.add(session)
+        await session.run()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> "FakeBroker":
+        self._thread = threading.Thread(target=self._run, name="fake-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "published": sum(self.published.values()),
+            "published_bytes": sum(self.published_bytes.values()),
+            "pubacks_dropped": self.pubacks_dropped
+        }
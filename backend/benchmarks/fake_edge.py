@@ -0,0 +1,74 @@
+"""
+Fake edge backend serving ``/api/sim-cards`` for benchmarks.
+"""
+import hashlib
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+class FakeEdge:
+    """
+    HTTP server answering ``GET /api/sim-cards`` with a fixed inventory.
+
+    Supports ``If-None-Match`` like a well behaved edge, and ``latency``
+    delays every response to imitate a remote site.
+    """
+
+    def __init__(self, name: str, sim_count: int, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.sim_cards: List[dict] = [
+            {"id": f"{name}-sim-{index:05d}", "number": f"+1555{zlib.crc32(name.encode()) % 1000:03d}{index:05d}", "status": "active"}
+            for index in range(sim_count)
+        ]
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _handler(self):
+        edge = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                edge.requests += 1
+                if self.path != "/api/sim-cards":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if edge.latency:
+                    threading.Event().wait(edge.latency)
+                body = json.dumps({"sim_cards": edge.sim_cards}).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeEdge":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-edge-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,285 @@
+"""
+End-to-end load test of the API against local stand-ins.
+
+Starts a fake MQTT broker, fake edge backends and the API under uvicorn in
+this process, provisions users and SIMs through the API, then drives
+concurrent send, list and inbound workloads and reports throughput and
+latency percentiles. Run from the backend directory:
+
+    python -m benchmarks.loadtest --duration 20 --concurrency 16
+
+Edges are simulated on the broker: every message published on ``sms/send``
+is reported back on ``sms/status`` as received, or acknowledged on ``sms/ack``
+when it came in a batch on ``sms/send/batch`` (``--batch``) or in a binary
+frame on ``sms/send/binary`` (``--binary``), and, after
+``--delivery-latency-ms``, as delivered, so the per-stage trace summary in
+the result covers the whole path.
+
+Every run uses a fresh SQLite database and a fixed random seed, so numbers
+from the same machine are comparable across commits. Use ``--output`` to
+append results to a JSON lines history file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+from .fake_broker import FakeBroker
+from .fake_edge import FakeEdge
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def record(self, workload: str, elapsed: float, status: int):
+        if 200 <= status < 300:
+            self.latencies.setdefault(workload, []).append(elapsed)
+        else:
+            errors = self.errors.setdefault(workload, {})
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, dict]:
+        summary = {}
+        for workload in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(workload, []))
+            summary[workload] = {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / duration, 2),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p90_ms": round(percentile(values, 0.90) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+                "errors": self.errors.get(workload, {}),
+            }
+        return summary
+
+
+def simulate_edges(broker: FakeBroker, delivery_latency: float):
+    """Report every sent SMS as received right away and as delivered later"""
+    def on_publish(topic: str, payload: bytes):
+        if topic == "sms/send":
+            message_id = json.loads(payload)["message_id"]
+            broker.inject("sms/status", json.dumps({"message_id": message_id, "status": "received", "timestamp": time.time()}).encode())
+            message_ids = [message_id]
+        elif topic in ("sms/send/batch", "sms/send/binary"):
+            # The app is only importable once main() has configured it
+            from app.services.sms_encoding import decode_frame
+            batch = json.loads(payload) if topic == "sms/send/batch" else decode_frame(payload)
+            message_ids = [message["message_id"] for message in batch["messages"]]
+            broker.inject("sms/ack", json.dumps({
+                "batch_id": batch["batch_id"],
+                "timestamp": time.time(),
+                "results": [{"message_id": message_id, "status": "accepted"} for message_id in message_ids]
+            }).encode())
+        else:
+            return
+        for message_id in message_ids:
+            broker.inject("sms/status", json.dumps({"message_id": message_id, "status": "delivered"}).encode(), delivery_latency)
+    broker.hooks.append(on_publish)
+
+
+def start_api(port: int):
+    """Run the API under uvicorn in a background thread"""
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def provision(client: httpx.AsyncClient, users: int, sims_per_user: int) -> List[dict]:
+    """Create users with funded wallets and SIMs bought from the marketplace"""
+    marketplace = []
+    for _ in range(200):
+        marketplace = (await client.get("/api/sims/marketplace")).json()
+        if len(marketplace) >= users * sims_per_user:
+            break
+        await asyncio.sleep(0.1)
+    if len(marketplace) < users * sims_per_user:
+        raise RuntimeError("Edge inventory was not synced in time")
+
+    accounts = []
+    for index in range(users):
+        credentials = {"email": f"load{index}@example.com", "username": f"load{index}", "password": "load-test"}
+        (await client.post("/api/auth/register", json=credentials)).raise_for_status()
+        token = (await client.post(
+            "/api/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        await client.get("/api/wallets/", headers=headers)
+        (await client.post("/api/wallets/transactions", headers=headers, json={
+            "type": "credit", "amount": "1000000", "description": "load test funds"
+        })).raise_for_status()
+
+        sims = []
+        for offset in range(sims_per_user):
+            listed = marketplace[index * sims_per_user + offset]
+            response = await client.post("/api/sims/", headers=headers, json={
+                "iccid": listed["iccid"], "phone_number": listed["phone_number"], "expiry_date": listed["expiry_date"]
+            })
+            response.raise_for_status()
+            sim = response.json()
+            (await client.patch(f"/api/sims/{sim['id']}", headers=headers, json={"messages_limit": 10_000_000})).raise_for_status()
+            sims.append(sim)
+        accounts.append({"headers": headers, "sims": sims})
+    return accounts
+
+
+async def run_workload(name: str, client, accounts, recorder: Recorder, deadline: float, rng: random.Random):
+    while time.perf_counter() < deadline:
+        account = rng.choice(accounts)
+        sim = rng.choice(account["sims"])
+        started_at = time.perf_counter()
+        if name == "send":
+            response = await client.post("/api/sms/send", headers=account["headers"], json={
+                "recipient_number": f"+1444{rng.randrange(10**7):07d}",
+                "content": "Load test message " + "x" * rng.randrange(10, 150),
+                "sim_ids": [sim["id"]]
+            })
+        elif name == "list":
+            response = await client.get("/api/sms/", headers=account["headers"], params={"limit": 50})
+        else:
+            response = await client.post("/api/sms/webhook/receive", params={
+                "sender_number": sim["phone_number"], "content": "Inbound load test message"
+            })
+        recorder.record(name, time.perf_counter() - started_at, response.status_code)
+
+
+async def drive(base_url: str, args) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    limits = httpx.Limits(max_connections=args.concurrency * 3 + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        accounts = await provision(client, args.users, args.sims_per_user)
+        recorder = Recorder()
+        deadline = time.perf_counter() + args.duration
+        workloads = [name for name in ("send", "list", "inbound") if name in args.workloads]
+        await asyncio.gather(*(
+            run_workload(name, client, accounts, recorder, deadline, random.Random(args.seed + worker))
+            for worker, name in enumerate(
+                name for name in workloads for _ in range(args.concurrency)
+            )
+        ))
+        summary = recorder.summary(args.duration)
+
+        # Let the last delivery reports arrive and the traces be written
+        await asyncio.sleep(args.delivery_latency_ms / 1000 + 2)
+        traces = (await client.get(
+            "/api/traces/summary", headers=accounts[0]["headers"], params={"group_by": "edge"}
+        )).json()
+        return summary, traces["groups"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run the workloads")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per workload")
+    parser.add_argument("--workloads", default="send,list,inbound")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--sims-per-user", type=int, default=2)
+    parser.add_argument("--edges", type=int, default=2)
+    parser.add_argument("--broker-latency-ms", type=float, default=0, help="Delay before every PUBACK")
+    parser.add_argument("--puback-loss", type=float, default=0, help="Probability that a PUBACK is dropped")
+    parser.add_argument("--delivery-latency-ms", type=float, default=50, help="Delay before edges report delivery")
+    parser.add_argument("--batch", action="store_true", help="Send SMS in batches on sms/send/batch")
+    parser.add_argument("--binary", action="store_true", help="Let edges announce binary frame support")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+    args.workloads = args.workloads.split(",")
+
+    broker = FakeBroker(latency=args.broker_latency_ms / 1000, puback_loss=args.puback_loss).start()
+    simulate_edges(broker, args.delivery_latency_ms / 1000)
+    sims_per_edge = -(-args.users * args.sims_per_user // args.edges)
+    edges = [FakeEdge(f"edge{index}", sims_per_edge).start() for index in range(args.edges)]
+    if args.binary:
+        for edge in edges:
+            capabilities = {"edge": edge.name, "encodings": ["binary-v1", "json"]}
+            broker.inject(f"edges/{edge.name}/capabilities", json.dumps(capabilities).encode(), retain=True)
+    database = tempfile.NamedTemporaryFile(prefix="loadtest-", suffix=".db", delete=False)
+    database.close()
+
+    # The API reads its settings at import time
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database.name}",
+        "MQTT_HOST": broker.host,
+        "MQTT_PORT": str(broker.port),
+        "EDGE_ENDPOINTS": ",".join(f"{edge.name}={edge.url}" for edge in edges),
+        "EDGE_SYNC_INTERVAL_SECONDS": "1",
+        "RATE_LIMIT_ENABLED": "false",
+        "AUTO_CREATE_TABLES": "true",
+        "MQTT_BATCH_ENABLED": str(args.batch).lower(),
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    port = free_port()
+    server, thread = start_api(port)
+    try:
+        workloads, traces = asyncio.run(drive(f"http://127.0.0.1:{port}", args))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        broker.stop()
+        for edge in edges:
+            edge.stop()
+        os.unlink(database.name)
+
+    result = {
+        "benchmark": "loadtest",
+        "commit": git_commit(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("duration", "concurrency", "workloads", "users", "sims_per_user", "edges",
+                        "broker_latency_ms", "puback_loss", "delivery_latency_ms", "batch", "binary", "seed")
+        },
+        "workloads": workloads,
+        "broker": broker.stats(),
+        "traces": traces,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
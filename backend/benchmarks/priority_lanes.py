@@ -0,0 +1,130 @@
+"""
+Latency of transactional SMS while a bulk backlog drains.
+
+Queues ``--bulk`` bulk messages at once on an SMSBatcher publishing to the
+in-process broker, then submits a transactional message every
+``--interval-ms`` while the backlog drains, and reports the time from submit
+to PUBACK per lane. With ``--fifo`` every message goes through the normal
+lane instead, which shows what transactional traffic would wait without
+lanes. Run from the backend directory:
+
+    python -m benchmarks.priority_lanes --bulk 20000 --broker-latency-ms 1
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Dict, List
+
+from .fake_broker import FakeBroker
+from .loadtest import git_commit
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk", type=int, default=20000, help="Bulk messages queued up front")
+    parser.add_argument("--transactional", type=int, default=50, help="Transactional messages sent while draining")
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--broker-latency-ms", type=float, default=1, help="Delay before every PUBACK")
+    parser.add_argument("--batch", action="store_true", help="Batch messages per edge and lane")
+    parser.add_argument("--fifo", action="store_true", help="Send everything through the normal lane")
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    broker = FakeBroker(latency=args.broker_latency_ms / 1000).start()
+    database = tempfile.NamedTemporaryFile(prefix="lanes-", suffix=".db", delete=False)
+    database.close()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database.name}",
+        "MQTT_HOST": broker.host,
+        "MQTT_PORT": str(broker.port),
+        "MQTT_BATCH_ENABLED": str(args.batch).lower(),
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from app.config import get_settings
+    from app.services.batching import SMSBatcher, parse_priority_weights
+    from app.services.mqtt import MQTTService
+
+    settings = get_settings()
+    mqtt = MQTTService()
+    mqtt.start()
+    while not mqtt.connected:
+        time.sleep(0.05)
+    batcher = SMSBatcher(
+        mqtt,
+        settings.MQTT_BATCH_ENABLED,
+        settings.MQTT_BATCH_MAX_MESSAGES,
+        settings.MQTT_BATCH_MAX_BYTES,
+        settings.MQTT_BATCH_LINGER_MS / 1000,
+        settings.MQTT_BATCH_MAX_IN_FLIGHT,
+        parse_priority_weights(settings.SMS_PRIORITY_WEIGHTS)
+    )
+    batcher.start()
+
+    latencies: Dict[str, List[float]] = {"transactional": [], "bulk": []}
+    futures = []
+
+    def send(lane: str, index: int):
+        submitted_at = time.perf_counter()
+        future = batcher.submit(
+            f"+1444{index:07d}", f"{lane} message {index}", edge="edge0",
+            priority="normal" if args.fifo else lane
+        )
+        future.add_done_callback(lambda _: latencies[lane].append(time.perf_counter() - submitted_at))
+        futures.append(future)
+
+    try:
+        started_at = time.perf_counter()
+        for index in range(args.bulk):
+            send("bulk", index)
+        for index in range(args.transactional):
+            send("transactional", index)
+            time.sleep(args.interval_ms / 1000)
+        wait(futures)
+        drained_in = time.perf_counter() - started_at
+    finally:
+        batcher.stop()
+        mqtt.disconnect()
+        broker.stop()
+        os.unlink(database.name)
+
+    result = {
+        "benchmark": "priority_lanes",
+        "commit": git_commit(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("bulk", "transactional", "interval_ms", "broker_latency_ms", "batch", "fifo")
+        },
+        "weights": settings.SMS_PRIORITY_WEIGHTS,
+        "drained_in_s": round(drained_in, 3),
+        "lanes": {lane: summarize(values) for lane, values in latencies.items()},
+        "broker": broker.stats(),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Time the read endpoints and key queries against a large database.
+
+Seed the database with ``benchmarks.seed_large`` first, then run from the
+backend directory with the same DATABASE_URL:
+
+    DATABASE_URL=sqlite:///./large.db python -m benchmarks.query_bench --history query_history.jsonl
+
+Each case runs for the heaviest, the median and the lightest user by SMS
+count. With ``--history`` the result is appended as a JSON line and compared
+with the last run on the same dataset; cases whose median got slower than
+``--threshold`` are reported as regressions, and ``--fail-on-regression``
+turns them into a non-zero exit code for CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+
+def summarize(samples: List[float], queries: Optional[int]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "queries": queries,
+    }
+
+
+def measure(call: Callable[[], Optional[int]], repeat: int, warmup: int) -> dict:
+    """Run ``call`` and time it; ``call`` may return the number of SQL statements it ran"""
+    for _ in range(warmup):
+        call()
+    samples, queries = [], None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        queries = call()
+        samples.append(time.perf_counter() - started_at)
+    return summarize(samples, queries)
+
+
+def pick_users(db) -> Dict[str, int]:
+    """The heaviest, median and lightest users by SMS count"""
+    from sqlalchemy import func
+    from app.models import SMS
+
+    counts = db.query(SMS.user_id, func.count(SMS.id)).group_by(SMS.user_id).order_by(func.count(SMS.id).desc()).all()
+    if not counts:
+        raise SystemExit("The database has no SMS, run benchmarks.seed_large first")
+    return {
+        "heavy": counts[0][0],
+        "median": counts[len(counts) // 2][0],
+        "light": counts[-1][0],
+    }
+
+
+def dataset_summary(db) -> Dict[str, int]:
+    from sqlalchemy import func
+    from app.models import SMS, Sim, Transaction, User
+
+    return {
+        model.__tablename__: db.query(func.count(model.id)).scalar()
+        for model in (User, Sim, SMS, Transaction)
+    }
+
+
+def endpoint_cases(client, users: Dict[str, int]) -> Dict[str, Callable[[], Optional[int]]]:
+    from app.auth.utils import create_access_token
+
+    def get(path: str, headers: dict, params: Optional[dict] = None) -> Callable[[], Optional[int]]:
+        def call():
+            response = client.get(path, headers=headers, params=params)
+            response.raise_for_status()
+            return int(response.headers.get("x-db-query-count", 0)) or None
+        return call
+
+    cases = {}
+    for label, user_id in users.items():
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        cases[f"GET /api/auth/me [{label}]"] = get("/api/auth/me", headers)
+        cases[f"GET /api/sms/ [{label}]"] = get("/api/sms/", headers, {"limit": 100})
+        cases[f"GET /api/sms/ deep page [{label}]"] = get("/api/sms/", headers, {"skip": 10_000, "limit": 100})
+        cases[f"GET /api/sims/ [{label}]"] = get("/api/sims/", headers)
+        cases[f"GET /api/wallets/ [{label}]"] = get("/api/wallets/", headers)
+        cases[f"GET /api/wallets/transactions [{label}]"] = get("/api/wallets/transactions", headers)
+    return cases
+
+
+def query_cases(db, users: Dict[str, int]) -> Dict[str, Callable[[], Optional[int]]]:
+    from sqlalchemy import func
+    from app.models import SMS, SMSStatus, Transaction, User, Wallet
+
+    def run(query) -> Callable[[], Optional[int]]:
+        def call():
+            query.all()
+            return None
+        return call
+
+    cases = {}
+    for label, user_id in users.items():
+        cases[f"user by id [{label}]"] = run(db.query(User).filter(User.id == user_id))
+        cases[f"latest 50 sms [{label}]"] = run(
+            db.query(SMS).filter(SMS.user_id == user_id).order_by(SMS.created_at.desc()).limit(50)
+        )
+        cases[f"sms count by status [{label}]"] = run(
+            db.query(SMS.status, func.count(SMS.id)).filter(SMS.user_id == user_id).group_by(SMS.status)
+        )
+        cases[f"pending sms [{label}]"] = run(
+            db.query(SMS.id).filter(SMS.user_id == user_id, SMS.status == SMSStatus.PENDING)
+        )
+        cases[f"latest 50 transactions [{label}]"] = run(
+            db.query(Transaction).join(Wallet).filter(Wallet.user_id == user_id)
+            .order_by(Transaction.created_at.desc()).limit(50)
+        )
+    return cases
+
+
+def find_regressions(previous: dict, current: dict, threshold: float, min_delta_ms: float) -> List[dict]:
+    regressions = []
+    for name, result in current["cases"].items():
+        before = previous["cases"].get(name)
+        if not before:
+            continue
+        delta = result["p50_ms"] - before["p50_ms"]
+        if delta > min_delta_ms and result["p50_ms"] > before["p50_ms"] * (1 + threshold):
+            regressions.append({
+                "case": name,
+                "before_ms": before["p50_ms"],
+                "after_ms": result["p50_ms"],
+                "change": f"+{delta / before['p50_ms'] * 100:.0f}%" if before["p50_ms"] else "new",
+            })
+    return regressions
+
+
+def last_run(history: Path, dataset: Dict[str, int]) -> Optional[dict]:
+    if not history.exists():
+        return None
+    previous = None
+    with open(history) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("benchmark") == "query_bench" and entry.get("dataset") == dataset:
+                previous = entry
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--history", help="JSON lines file to append the result to and compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative p50 slowdown counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    # Measure the request path only: no broker, edges or rate limiting, and
+    # per-request query counts in the response headers
+    os.environ.update({
+        "EDGE_SYNC_ENABLED": "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "SQL_DEBUG": "true",
+        "SQL_STRICT": "false",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from fastapi.testclient import TestClient
+    from app.database import SessionLocal
+    from app.main import app
+    from .loadtest import git_commit
+
+    db = SessionLocal()
+    try:
+        dataset = dataset_summary(db)
+        users = pick_users(db)
+        with TestClient(app) as client:
+            cases = {**endpoint_cases(client, users), **query_cases(db, users)}
+            results = {}
+            for name, call in cases.items():
+                if args.only and args.only not in name:
+                    continue
+                results[name] = measure(call, args.repeat, args.warmup)
+                print(f"{name:<50} p50 {results[name]['p50_ms']:>9.2f} ms  p95 {results[name]['p95_ms']:>9.2f} ms")
+    finally:
+        db.close()
+
+    result = {
+        "benchmark": "query_bench",
+        "commit": git_commit(),
+        "dataset": dataset,
+        "users": users,
+        "config": {"repeat": args.repeat, "warmup": args.warmup},
+        "cases": results,
+    }
+
+    regressions = []
+    if args.history:
+        history = Path(args.history)
+        previous = last_run(history, dataset)
+        if previous:
+            regressions = find_regressions(previous, result, args.threshold, args.min_delta_ms)
+            print(f"\nCompared with {previous['commit']}: {len(regressions)} regression(s)")
+            for regression in regressions:
+                print(f"  {regression['case']}: {regression['before_ms']} ms -> {regression['after_ms']} ms ({regression['change']})")
+        result["regressions"] = regressions
+        with open(history, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
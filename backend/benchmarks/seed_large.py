@@ -0,0 +1,182 @@
+"""
+Fill a database with a large synthetic dataset.
+
+Activity is skewed across users with a Zipf distribution, so a few users own
+most of the SMS and transactions like in production. Rows are written with
+batched executemany inserts. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./large.db python -m benchmarks.seed_large --sms 2000000
+
+Every seeded user can log in with the password ``benchmark``.
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from sqlalchemy import event, func, insert, select
+
+from app.auth.utils import get_password_hash
+from app.database import create_tables, engine
+from app.models import (
+    SMS, Sim, SimStatus, SMSDirection, SMSStatus, Transaction, TransactionStatus, TransactionType, User, Wallet
+)
+
+PASSWORD = "benchmark"
+
+
+class ZipfChooser:
+    """Picks indexes in ``range(n)`` with probability proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def choose(self) -> int:
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+def chunks(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(table, rows: Iterator[dict], batch_size: int, label: str) -> int:
+    total = 0
+    started_at = time.perf_counter()
+    with engine.begin() as connection:
+        for chunk in chunks(rows, batch_size):
+            connection.execute(insert(table), chunk)
+            total += len(chunk)
+    elapsed = time.perf_counter() - started_at
+    print(f"{label}: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sims-per-user", type=int, default=3)
+    parser.add_argument("--sms", type=int, default=1_000_000)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of activity across users")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if engine.dialect.name == "sqlite":
+        # Seeding is disposable; trade durability for speed
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.close()
+
+    create_tables()
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    hashed_password = get_password_hash(PASSWORD)
+
+    with engine.connect() as connection:
+        first_user_id, first_sim_id, first_wallet_id, first_transaction_id = (
+            (connection.scalar(select(func.max(model.id))) or 0) + 1
+            for model in (User, Sim, Wallet, Transaction)
+        )
+    run = f"{args.seed}-{first_user_id}"
+
+    user_ids = [first_user_id + index for index in range(args.users)]
+    bulk_insert(User, ({
+        "id": user_id,
+        "email": f"bench{run}-{user_id}@example.com",
+        "username": f"bench{run}-{user_id}",
+        "hashed_password": hashed_password,
+        "is_active": True,
+        "created_at": now,
+    } for user_id in user_ids), args.batch_size, "users")
+
+    bulk_insert(Wallet, ({
+        "id": first_wallet_id + index,
+        "user_id": user_id,
+        "balance": 1_000_000,
+        "created_at": now,
+    } for index, user_id in enumerate(user_ids)), args.batch_size, "wallets")
+
+    sims_by_user = {
+        user_id: [
+            (first_sim_id + index * args.sims_per_user + offset, f"+1999{user_id:07d}{offset}")
+            for offset in range(args.sims_per_user)
+        ]
+        for index, user_id in enumerate(user_ids)
+    }
+    bulk_insert(Sim, ({
+        "id": sim_id,
+        "iccid": f"bench-{run}-{sim_id}",
+        "phone_number": phone_number,
+        "status": SimStatus.ACTIVE,
+        "is_active": True,
+        "user_id": user_id,
+        "messages_used": 0,
+        "messages_limit": 10_000_000,
+        "expiry_date": now + timedelta(days=365),
+        "created_at": now,
+    } for user_id, sims in sims_by_user.items() for sim_id, phone_number in sims), args.batch_size, "sims")
+
+    chooser = ZipfChooser(args.users, args.skew, rng)
+    span = timedelta(days=365).total_seconds()
+
+    transaction_ids = {}
+
+    def transactions():
+        for index in range(args.transactions):
+            user_index = chooser.choose()
+            transaction_id = first_transaction_id + index
+            transaction_ids.setdefault(user_index, []).append(transaction_id)
+            credit = rng.random() < 0.1
+            yield {
+                "id": transaction_id,
+                "wallet_id": first_wallet_id + user_index,
+                "user_id": user_ids[user_index],
+                "type": TransactionType.CREDIT if credit else TransactionType.DEBIT,
+                "amount": rng.choice((50, 100, 500)) if credit else rng.randint(1, 20),
+                "description": "Wallet top-up" if credit else "Bulk SMS",
+                "status": TransactionStatus.COMPLETED,
+                "created_at": now - timedelta(seconds=rng.random() * span),
+            }
+
+    bulk_insert(Transaction, transactions(), args.batch_size, "transactions")
+
+    statuses = [SMSStatus.DELIVERED] * 70 + [SMSStatus.SENT] * 20 + [SMSStatus.FAILED] * 5 + [SMSStatus.PENDING] * 5
+
+    def messages():
+        for _ in range(args.sms):
+            user_index = chooser.choose()
+            user_id = user_ids[user_index]
+            sim_id, phone_number = rng.choice(sims_by_user[user_id])
+            inbound = rng.random() < 0.15
+            user_transactions = transaction_ids.get(user_index)
+            yield {
+                "user_id": user_id,
+                "sim_id": sim_id,
+                "transaction_id": None if inbound or not user_transactions else rng.choice(user_transactions),
+                "direction": SMSDirection.INBOUND if inbound else SMSDirection.OUTBOUND,
+                "status": SMSStatus.RECEIVED if inbound else rng.choice(statuses),
+                "recipient_number": phone_number if inbound else f"+1444{rng.randrange(10**7):07d}",
+                "sender_number": f"+1444{rng.randrange(10**7):07d}" if inbound else phone_number,
+                "content": "Synthetic message " + "x" * rng.randrange(10, 160),
+                "price": 0 if inbound else 1,
+                "created_at": now - timedelta(seconds=rng.random() * span),
+                "retry_count": 0,
+            }
+
+    bulk_insert(SMS, messages(), args.batch_size, "sms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Check shared subscription consumers against the in-process broker.
+
+Runs several MQTTService consumers, standing in for workers or nodes, in one
+shared subscription group and checks that:
+
+- every message published on a shared topic is handled exactly once, spread
+  across the consumers;
+- inbound SMS and delivery reports delivered twice, as after a consumer
+  failover, and reports arriving out of order leave the database as if each
+  message had been seen once.
+
+Run from the backend directory:
+
+    python -m benchmarks.shared_subscriptions --consumers 3 --messages 300
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from .fake_broker import FakeBroker
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    print(f"{'PASS' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumers", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    broker = FakeBroker().start()
+    database = tempfile.NamedTemporaryFile(prefix="shared-", suffix=".db", delete=False)
+    database.close()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database.name}",
+        "MQTT_HOST": broker.host,
+        "MQTT_PORT": str(broker.port),
+        "EDGE_SYNC_ENABLED": "false",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from datetime import datetime, timedelta
+    from app.database import SessionLocal, create_tables
+    from app.models import SMS, Sim, SimStatus, SMSDirection, SMSStatus, User
+    from app.services.inbound import handle_inbound_message
+    from app.services.mqtt import MQTTService
+    from app.services.tracing import message_tracer
+
+    create_tables()
+    results = []
+    consumers = [MQTTService() for _ in range(args.consumers)]
+    try:
+        # 1. Messages of a shared topic are split between the consumers
+        handled = Counter()
+        for index, consumer in enumerate(consumers):
+            consumer.subscribe("check/shared", lambda payload, index=index: handled.update([index]))
+            consumer.start()
+        wait_for(lambda: all(consumer.connected for consumer in consumers))
+        time.sleep(0.2)
+        for index in range(args.messages):
+            broker.inject("check/shared", str(index).encode())
+        wait_for(lambda: sum(handled.values()) >= args.messages)
+        time.sleep(0.2)
+        results.append(check(
+            "each shared message handled once",
+            sum(handled.values()) == args.messages,
+            f"{sum(handled.values())} handled for {args.messages} published"
+        ))
+        results.append(check(
+            "messages spread across consumers",
+            len(handled) == args.consumers,
+            ", ".join(f"consumer {index}: {count}" for index, count in sorted(handled.items()))
+        ))
+
+        # 2. Redelivered inbound SMS are stored once
+        db = SessionLocal()
+        user = User(email="shared@example.com", username="shared", hashed_password="-")
+        db.add(user)
+        db.flush()
+        sim = Sim(
+            iccid="shared-sim", phone_number="+15550009999", status=SimStatus.ACTIVE, is_active=True,
+            user_id=user.id, messages_limit=1000, expiry_date=datetime.utcnow() + timedelta(days=1)
+        )
+        db.add(sim)
+        db.commit()
+
+        for consumer in consumers:
+            consumer.subscribe("sms/inbound", handle_inbound_message)
+            consumer.subscribe("sms/status", message_tracer.handle_status_report)
+        time.sleep(0.2)
+
+        inbound = [
+            json.dumps({
+                "message_id": f"inbound-{index}", "sim_number": sim.phone_number,
+                "sender_number": "+14440000000", "content": f"Inbound {index}"
+            }).encode()
+            for index in range(args.messages)
+        ]
+        deliveries = inbound + inbound
+        rng.shuffle(deliveries)
+        for payload in deliveries:
+            broker.inject("sms/inbound", payload)
+
+        def inbound_count():
+            return db.query(SMS).filter(SMS.direction == SMSDirection.INBOUND).count()
+        wait_for(lambda: inbound_count() >= args.messages)
+        time.sleep(0.5)
+        results.append(check(
+            "redelivered inbound SMS stored once",
+            inbound_count() == args.messages,
+            f"{inbound_count()} rows for {args.messages} messages delivered twice"
+        ))
+
+        # 3. Duplicate and out of order delivery reports end in the latest status
+        outbound = [
+            SMS(
+                user_id=user.id, sim_id=sim.id, message_id=f"outbound-{index}", direction=SMSDirection.OUTBOUND,
+                status=SMSStatus.SENT, recipient_number="+14440000000", sender_number=sim.phone_number, content="x"
+            )
+            for index in range(args.messages)
+        ]
+        db.add_all(outbound)
+        db.commit()
+        reports = []
+        for index in range(args.messages):
+            message_id = f"outbound-{index}"
+            reports += [{"message_id": message_id, "status": "received"}] * 2
+            reports += [{"message_id": message_id, "status": "delivered"}] * 2
+        rng.shuffle(reports)
+        for report in reports:
+            broker.inject("sms/status", json.dumps(report).encode())
+        time.sleep(1)
+        message_tracer.flush()
+        # Late failure reports must not undo deliveries
+        for index in range(args.messages):
+            broker.inject("sms/status", json.dumps({"message_id": f"outbound-{index}", "status": "failed"}).encode())
+        time.sleep(1)
+        message_tracer.flush()
+
+        db.expire_all()
+        statuses = Counter(
+            status for (status,) in db.query(SMS.status).filter(SMS.direction == SMSDirection.OUTBOUND)
+        )
+        results.append(check(
+            "duplicate and late delivery reports are idempotent",
+            statuses == Counter({SMSStatus.DELIVERED: args.messages}),
+            ", ".join(f"{status.value}: {count}" for status, count in statuses.items())
+        ))
+        db.close()
+    finally:
+        for consumer in consumers:
+            consumer.disconnect()
+        time.sleep(0.2)
+        broker.stop()
+        os.unlink(database.name)
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
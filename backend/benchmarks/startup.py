@@ -0,0 +1,79 @@
+"""
+Measure import and boot time of the API.
+
+Every sample runs in a fresh interpreter so module caches do not hide the
+cost of imports. Run from the backend directory:
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+# Executed in a child interpreter; prints one JSON sample
+SAMPLE = """
+import json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    booted = time.perf_counter()
+    while client.get("/readyz").status_code != 200:
+        if time.perf_counter() - booted > 30:
+            break
+        time.sleep(0.01)
+    ready = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "boot_ms": (booted - imported) * 1000,
+    "ready_ms": (ready - started) * 1000,
+}))
+"""
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_sample() -> dict:
+    output = subprocess.check_output([sys.executable, "-c", SAMPLE], cwd=BACKEND_DIR, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    samples = [run_sample() for _ in range(args.runs)]
+    result = {"benchmark": "startup", "commit": git_commit(), "runs": args.runs}
+    for metric in ("import_ms", "boot_ms", "ready_ms"):
+        values = [sample[metric] for sample in samples]
+        result[metric] = {
+            "median": round(statistics.median(values), 2),
+            "min": round(min(values), 2),
+            "max": round(max(values), 2),
+        }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
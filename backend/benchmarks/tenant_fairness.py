@@ -0,0 +1,120 @@
+"""
+Latency of small senders while one tenant's campaign drains.
+
+Queues ``--heavy`` messages for one tenant at once on an SMSBatcher
+publishing to the in-process broker, then has ``--tenants`` small tenants
+each send a message every ``--interval-ms`` while the backlog drains, all in
+the same priority lane, and reports the time from submit to PUBACK per
+tenant class. With ``--unfair`` every message is queued as the same tenant,
+which shows what small senders would wait without per-tenant scheduling.
+Run from the backend directory:
+
+    python -m benchmarks.tenant_fairness --heavy 20000 --tenants 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Dict, List
+
+from .fake_broker import FakeBroker
+from .loadtest import git_commit
+from .priority_lanes import summarize
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy", type=int, default=20000, help="Messages queued up front by the heavy tenant")
+    parser.add_argument("--tenants", type=int, default=20, help="Small tenants sending while it drains")
+    parser.add_argument("--rounds", type=int, default=20, help="Messages sent by each small tenant")
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--broker-latency-ms", type=float, default=1, help="Delay before every PUBACK")
+    parser.add_argument("--batch", action="store_true", help="Batch messages per edge, lane and tenant")
+    parser.add_argument("--unfair", action="store_true", help="Queue every message as the same tenant")
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    broker = FakeBroker(latency=args.broker_latency_ms / 1000).start()
+    database = tempfile.NamedTemporaryFile(prefix="fairness-", suffix=".db", delete=False)
+    database.close()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database.name}",
+        "MQTT_HOST": broker.host,
+        "MQTT_PORT": str(broker.port),
+        "MQTT_BATCH_ENABLED": str(args.batch).lower(),
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from app.config import get_settings
+    from app.services.batching import SMSBatcher, parse_priority_weights
+    from app.services.mqtt import MQTTService
+
+    settings = get_settings()
+    mqtt = MQTTService()
+    mqtt.start()
+    while not mqtt.connected:
+        time.sleep(0.05)
+    batcher = SMSBatcher(
+        mqtt,
+        settings.MQTT_BATCH_ENABLED,
+        settings.MQTT_BATCH_MAX_MESSAGES,
+        settings.MQTT_BATCH_MAX_BYTES,
+        settings.MQTT_BATCH_LINGER_MS / 1000,
+        settings.MQTT_BATCH_MAX_IN_FLIGHT,
+        parse_priority_weights(settings.SMS_PRIORITY_WEIGHTS),
+        settings.TENANT_QUANTUM
+    )
+    batcher.start()
+
+    latencies: Dict[str, List[float]] = {"small": [], "heavy": []}
+    futures = []
+
+    def send(kind: str, tenant: int, index: int):
+        submitted_at = time.perf_counter()
+        future = batcher.submit(
+            f"+1444{index:07d}", f"{kind} message {index}", edge="edge0", tenant=0 if args.unfair else tenant
+        )
+        future.add_done_callback(lambda _: latencies[kind].append(time.perf_counter() - submitted_at))
+        futures.append(future)
+
+    try:
+        started_at = time.perf_counter()
+        for index in range(args.heavy):
+            send("heavy", 0, index)
+        for index in range(args.rounds):
+            for tenant in range(1, args.tenants + 1):
+                send("small", tenant, index)
+            time.sleep(args.interval_ms / 1000)
+        wait(futures)
+        drained_in = time.perf_counter() - started_at
+    finally:
+        batcher.stop()
+        mqtt.disconnect()
+        broker.stop()
+        os.unlink(database.name)
+
+    result = {
+        "benchmark": "tenant_fairness",
+        "commit": git_commit(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("heavy", "tenants", "rounds", "interval_ms", "broker_latency_ms", "batch", "unfair")
+        },
+        "drained_in_s": round(drained_in, 3),
+        "tenants": {kind: summarize(values) for kind, values in latencies.items()},
+        "broker": broker.stats(),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,8 @@ def init_db():
             test_user = User(
                 email="amine@admin.com",
                 username="amine",
-                hashed_password=get_password_hash("amine")
+                hashed_password=get_password_hash("amine"),
+                is_admin=True
             )
             db.add(test_user)
             db.commit()
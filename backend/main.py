@@ -31,9 +31,9 @@ app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"]
 async def startup_event():
     """Initialize services on startup"""
     try:
-        # Connect to MQTT broker
-        mqtt_service.connect()
-        logger.info("MQTT service initialized successfully")
+        # Connect to MQTT broker in the background
+        mqtt_service.start()
+        logger.info("MQTT service started")
     except Exception as e:
         logger.error(f"Failed to initialize MQTT service: {str(e)}")
 
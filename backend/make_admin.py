@@ -0,0 +1,25 @@
+import sys
+from app.database import SessionLocal
+from app.models import User
+
+def make_admin(email: str) -> bool:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if not user:
+            return False
+        user.is_admin = True
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python make_admin.py <email>")
+        sys.exit(1)
+    if make_admin(sys.argv[1]):
+        print(f"{sys.argv[1]} is now an admin")
+    else:
+        print(f"No user with email {sys.argv[1]}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+"""
+Run the API with several worker processes:
+
+    WEB_CONCURRENCY=4 python serve.py
+
+Several workers need the rate limits, idempotency keys and ETag counters in
+Redis, since each worker would otherwise keep its own. WEB_CONCURRENCY
+defaults to the number of CPUs when those backends are shared and to 1
+otherwise, and asking for more workers without them refuses to start. Tables
+are created once here instead of by every worker. Each worker serves requests
+and publishes with its own MQTT client; singleton background jobs run in the
+worker holding the leader lease.
+"""
+import logging
+import os
+import sys
+from typing import List
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+def memory_backends(settings) -> List[str]:
+    """Settings left on per-process state that several workers would need to share"""
+    names = []
+    if settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_BACKEND == "memory":
+        names.append("RATE_LIMIT_BACKEND")
+    if settings.IDEMPOTENCY_BACKEND == "memory":
+        names.append("IDEMPOTENCY_BACKEND")
+    if settings.VERSION_STORE_BACKEND == "memory":
+        names.append("VERSION_STORE_BACKEND")
+    return names
+
+def main():
+    from app.config import get_settings
+    from app.database import create_tables
+    from app.logging_config import configure_logging, shutdown_logging
+
+    settings = get_settings()
+    configure_logging()
+    try:
+        unshared = memory_backends(settings)
+        if os.getenv("WEB_CONCURRENCY"):
+            workers = int(os.environ["WEB_CONCURRENCY"])
+        elif unshared:
+            workers = 1
+            logger.info(f"Starting one worker; set {', '.join(unshared)} to redis:// URLs to run one per CPU")
+        else:
+            workers = os.cpu_count() or 1
+        if workers > 1 and unshared:
+            # Retries reaching another worker would send and charge again
+            logger.error(
+                f"Refusing to start {workers} workers with per-worker state; "
+                f"set {', '.join(unshared)} to redis:// URLs or WEB_CONCURRENCY=1"
+            )
+            sys.exit(1)
+        # Workers read their settings from the environment they inherit
+        os.environ["WEB_CONCURRENCY"] = str(workers)
+
+        if settings.AUTO_CREATE_TABLES:
+            create_tables()
+            os.environ["AUTO_CREATE_TABLES"] = "false"
+    finally:
+        shutdown_logging()
+
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        proxy_headers=True,
+        # Open event streams would otherwise hold up a shutdown until they end
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "10"))
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import sys
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import User
+from app.services.batching import parse_plan_weights
+
+def set_plan(email: str, plan: str) -> bool:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if not user:
+            return False
+        user.plan = plan
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python set_plan.py <email> <plan>")
+        sys.exit(1)
+    email, plan = sys.argv[1], sys.argv[2]
+    plans = parse_plan_weights(get_settings().TENANT_PLAN_WEIGHTS)
+    if plan not in plans:
+        print(f"Unknown plan {plan}; TENANT_PLAN_WEIGHTS has {', '.join(plans)}")
+        sys.exit(1)
+    if set_plan(email, plan):
+        print(f"{email} is now on the {plan} plan")
+    else:
+        print(f"No user with email {email}")
+        sys.exit(1)
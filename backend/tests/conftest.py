@@ -0,0 +1,72 @@
+import itertools
+import os
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Settings are read at import time, so the test environment goes first
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/test.db",
+    EDGE_SYNC_ENABLED="false",
+    RATE_LIMIT_ENABLED="false",
+    RESPONSE_CACHE_ENABLED="false",
+    LOG_LEVEL="WARNING",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth.utils import create_access_token
+from app.database import SessionLocal, create_tables
+from app.main import app
+from app.models import Sim, SimStatus, User, Wallet
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    create_tables()
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Without the lifespan, so MQTT and the background jobs stay off
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(client, db):
+    """A user with 100 credits and three active SIMs"""
+    n = next(_ids)
+    user = User(email=f"user{n}@example.com", username=f"user{n}", hashed_password="x")
+    db.add(user)
+    db.flush()
+    db.add(Wallet(user_id=user.id, balance=Decimal("100")))
+    for i in range(3):
+        db.add(Sim(
+            iccid=f"8900{n:06d}{i}",
+            phone_number=f"+1555{n:06d}{i}",
+            status=SimStatus.ACTIVE,
+            is_active=True,
+            user_id=user.id,
+            messages_limit=150,
+            messages_used=0,
+            expiry_date=datetime.utcnow() + timedelta(days=30)
+        ))
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
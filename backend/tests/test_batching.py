@@ -0,0 +1,65 @@
+from collections import Counter
+
+from app.services.batching import DeficitRoundRobin, _Batch, parse_plan_weights, parse_priority_weights
+
+
+def _batch(tenant, size, weight=1):
+    batch = _Batch(edge=None, lane="normal", tenant=tenant, weight=weight, linger=0)
+    batch.messages = [{}] * size
+    return batch
+
+
+def _drain(drr, count):
+    return [drr.pop() for _ in range(count)]
+
+
+def test_tenants_take_turns_however_long_their_queues():
+    drr = DeficitRoundRobin(quantum=10)
+    for _ in range(50):
+        drr.push(1, 1, _batch(1, 10))
+    for _ in range(3):
+        drr.push(2, 1, _batch(2, 10))
+
+    served = [batch.tenant for batch in _drain(drr, 8)]
+    assert served == [1, 2, 1, 2, 1, 2, 1, 1]
+
+
+def test_messages_are_shared_by_weight_not_batch_count():
+    drr = DeficitRoundRobin(quantum=10)
+    for _ in range(100):
+        drr.push(1, 1, _batch(1, 10))
+        drr.push(2, 3, _batch(2, 5))
+
+    messages = Counter()
+    for batch in _drain(drr, 7 * 9):
+        messages[batch.tenant] += len(batch.messages)
+    # Nine full rounds; tenant 2 has three times the weight, in batches half the size
+    assert messages[2] == 3 * messages[1]
+
+
+def test_small_batches_carry_their_credit_over():
+    drr = DeficitRoundRobin(quantum=10)
+    drr.push(1, 1, _batch(1, 4))
+    drr.push(1, 1, _batch(1, 4))
+    drr.push(1, 1, _batch(1, 4))
+    drr.push(2, 1, _batch(2, 10))
+    assert [batch.tenant for batch in _drain(drr, 4)] == [1, 1, 2, 1]
+
+
+def test_drained_tenants_leave_the_ring():
+    drr = DeficitRoundRobin(quantum=10)
+    drr.push(1, 1, _batch(1, 1))
+    assert len(drr) == 1
+    assert drr.pop().tenant == 1
+    assert len(drr) == 0
+    assert drr.pop() is None
+
+    # A returning tenant starts without the credit it had left over
+    drr.push(1, 1, _batch(1, 10))
+    drr.push(2, 1, _batch(2, 10))
+    assert [batch.tenant for batch in _drain(drr, 2)] == [1, 2]
+
+
+def test_parse_weights():
+    assert parse_priority_weights("bulk=0, transactional=8") == {"transactional": 8, "normal": 1, "bulk": 1}
+    assert parse_plan_weights("free=1,premium=4") == {"free": 1, "premium": 4}
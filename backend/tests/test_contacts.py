@@ -0,0 +1,51 @@
+from array import array
+
+import pytest
+
+from app.services import contacts
+from app.services.contacts import format_number, from_blob, iter_chunks, normalize_number, pack_numbers, to_blob
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+1 (555) 010-0001", 15550100001),
+    ("0044 20 7946 0958", 442079460958),
+    ("+44.20.7946.0958", 442079460958),
+    ("+123456", None),  # too short
+    ("+1234567890123456", None),  # over 15 digits
+    ("+0123456789", None),  # no country code starts with 0
+    ("+1555abc0001", None),
+    ("", None),
+])
+def test_normalize_number(raw, expected):
+    assert normalize_number(raw) == expected
+
+
+def test_national_numbers_need_a_default_country_code():
+    assert normalize_number("020 7946 0958") is None
+    assert normalize_number("020 7946 0958", "44") == 442079460958
+    # International forms ignore the default
+    assert normalize_number("+1 555 010 0001", "44") == 15550100001
+
+
+def test_pack_numbers_sorts_deduplicates_and_counts(monkeypatch):
+    monkeypatch.setattr(contacts.settings, "CONTACT_DEFAULT_COUNTRY_CODE", "")
+    numbers, invalid, duplicates = pack_numbers([
+        "+15550100002", "+1 555 010 0001", "not a number", "001 555 010 0002", "5550100003",
+    ])
+    assert list(numbers) == [15550100001, 15550100002]
+    assert (invalid, duplicates) == (2, 1)
+    assert [format_number(number) for number in numbers] == ["+15550100001", "+15550100002"]
+
+
+def test_blob_round_trip_is_little_endian():
+    numbers = array("q", [1, 15550100001, 999999999999999])
+    blob = to_blob(numbers)
+    assert len(blob) == 24
+    assert blob[:8] == (1).to_bytes(8, "little")
+    assert from_blob(blob) == numbers
+    assert from_blob(b"") == array("q")
+
+
+def test_iter_chunks():
+    numbers = array("q", range(5))
+    assert [list(chunk) for chunk in iter_chunks(numbers, 2)] == [[0, 1], [2, 3], [4]]
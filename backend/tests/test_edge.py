@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+
+from app.services import edge
+from app.services.edge import CircuitBreaker, EdgeClient, EdgeEndpoint
+
+
+def _wait_out(breaker):
+    """Move the breaker's opening back by its reset timeout"""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def _client(monkeypatch, handler, names=("edge1", "edge2")):
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(edge.httpx, "AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs))
+    endpoints = [EdgeEndpoint(name=name, base_url=f"http://{name}") for name in names]
+    return EdgeClient(endpoints, api_key="key", timeout=1, failure_threshold=2, reset_timeout=30)
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow_request()
+
+    _wait_out(breaker)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # A failed trial re-opens the breaker for another reset_timeout
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    _wait_out(breaker)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_cancelled_trial_lets_the_next_one_through(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(60)
+
+    client = _client(monkeypatch, handler, names=("edge1",))
+    breaker = client.breakers["edge1"]
+    breaker.record_failure()
+    breaker.record_failure()
+    _wait_out(breaker)
+
+    async def cancel_trial():
+        task = asyncio.create_task(client.fetch_inventory())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_failing_edge_leaves_the_others_in_the_inventory(monkeypatch, caplog):
+    def handler(request):
+        if request.url.host == "edge2":
+            return httpx.Response(500)
+        sim_cards = [{"id": "8901", "phone_number": "+15550001", "status": "active"}]
+        if request.url.host == "edge3":
+            sim_cards.append({"id": "8903", "phone_number": "+15550003", "status": "active"})
+        return httpx.Response(200, json={"sim_cards": sim_cards}, headers={"ETag": f'"{request.url.host}"'})
+
+    client = _client(monkeypatch, handler, names=("edge1", "edge2", "edge3"))
+    with caplog.at_level(logging.WARNING, logger=edge.__name__):
+        inventory = asyncio.run(client.fetch_inventory())
+
+    assert inventory.healthy_edges == ["edge1", "edge3"]
+    assert list(inventory.failed_edges) == ["edge2"] and inventory.is_partial
+    assert [(sim["id"], sim["edge"]) for sim in inventory.sim_cards] == [("8901", "edge1"), ("8903", "edge3")]
+    assert inventory.etags == {"edge1": '"edge1"', "edge3": '"edge3"'}
+    assert client.breakers["edge2"].failures == 1
+    # The SIM both edge1 and edge3 report is kept once, and the collision is logged
+    assert "edge edge1" in caplog.text and "Edge edge3 reports SIM 8901" in caplog.text
+
+
+def test_open_breaker_skips_the_edge(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.host)
+        return httpx.Response(200, json={"sim_cards": []})
+
+    client = _client(monkeypatch, handler)
+    client.breakers["edge1"].record_failure()
+    client.breakers["edge1"].record_failure()
+    inventory = asyncio.run(client.fetch_inventory())
+    assert requests == ["edge2"]
+    assert "circuit open" in inventory.failed_edges["edge1"]
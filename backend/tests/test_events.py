@@ -0,0 +1,60 @@
+import asyncio
+
+from app.auth.utils import create_access_token
+from app.main import app
+from app.routers.events import _stream
+from app.services.events import encode_event, event_bus
+
+
+def _request(user_id):
+    token = create_access_token({"sub": str(user_id)})
+    return {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/events/stream", "raw_path": b"/api/events/stream", "root_path": "", "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {token}".encode()), (b"host", b"testserver")],
+        "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+    }
+
+
+def test_stream_delivers_events_and_unsubscribes_on_disconnect(user, monkeypatch):
+    monkeypatch.setattr(event_bus, "_loop", None)
+    frame = encode_event("sms.status", {"id": 1, "status": "delivered"})
+    sent = []
+
+    async def run():
+        event_bus.start()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            body = message.get("body", b"")
+            if body.startswith(b"retry"):
+                assert event_bus.stream_count == 1
+                event_bus.publish([(user.id + 1000, b"not for this user"), (user.id, frame)])
+            elif body.startswith(b"event:"):
+                disconnected.set()
+
+        await asyncio.wait_for(app(_request(user.id), receive, send), 5)
+
+    asyncio.run(run())
+    assert sent[0]["status"] == 200
+    assert dict(sent[0]["headers"])[b"content-type"].startswith(b"text/event-stream")
+    assert [message.get("body") for message in sent[1:3]] == [b"retry: 3000\n\n", frame]
+    assert event_bus.stream_count == 0
+
+
+def test_stream_that_never_starts_holds_no_queue():
+    stream = _stream(1)
+    assert event_bus.stream_count == 0
+
+    async def run():
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert event_bus.stream_count == 1
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert event_bus.stream_count == 0
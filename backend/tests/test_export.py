@@ -0,0 +1,72 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models import SMS, SMSDirection, SMSStatus
+from app.routers.sms import EXPORT_COLUMNS
+from app.services.export import export_rows, settings
+
+CREATED_AT = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def messages(user, db):
+    """Seven messages all created in the same second, so only the id orders them"""
+    sim = user.sims[0]
+    rows = [
+        SMS(
+            user_id=user.id, sim_id=sim.id, recipient_number=f"+1555000{i:04d}", sender_number=sim.phone_number,
+            content=f"message {i}", status=SMSStatus.SENT, direction=SMSDirection.OUTBOUND, created_at=CREATED_AT
+        )
+        for i in range(7)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def test_pages_split_rows_with_equal_timestamps_exactly_once(user, messages):
+    chunks = list(export_rows(EXPORT_COLUMNS, [SMS.user_id == user.id], "ndjson", compress=False, chunk_size=3))
+    # Pages of 3, 3 and 1 rows
+    assert [chunk.count(b"\n") for chunk in chunks] == [3, 3, 1]
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["id"] for row in rows] == messages
+    assert {row["created_at"] for row in rows} == {CREATED_AT.isoformat()}
+    assert rows[0]["status"] == "sent"
+
+
+def test_csv_export_through_the_endpoint(client, auth_headers, messages, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_ROWS", 2)
+    response = client.get("/api/sms/export", headers=auth_headers, params={"since": CREATED_AT.isoformat()})
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="sms.csv"'
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == [column.key for column in EXPORT_COLUMNS]
+    assert [int(row[0]) for row in rows[1:]] == messages
+
+
+def test_empty_export(client, auth_headers, messages):
+    params = {"until": CREATED_AT.isoformat()}
+    response = client.get("/api/sms/export", headers=auth_headers, params=params)
+    assert response.status_code == 200
+    assert response.text.strip() == ",".join(column.key for column in EXPORT_COLUMNS)
+
+    response = client.get("/api/sms/export", headers=auth_headers, params={**params, "format": "ndjson"})
+    assert response.status_code == 200
+    assert response.content == b""
+
+
+def test_gzip_body_holds_every_row_in_order(client, auth_headers, messages, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_ROWS", 3)
+    headers = {**auth_headers, "Accept-Encoding": "gzip"}
+    with client.stream("GET", "/api/sms/export", headers=headers, params={"format": "ndjson"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        body = b"".join(response.iter_raw())
+
+    rows = [json.loads(line) for line in gzip.decompress(body).splitlines()]
+    assert [row["id"] for row in rows] == messages
+    assert [row["content"] for row in rows] == [f"message {i}" for i in range(7)]
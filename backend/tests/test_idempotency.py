@@ -0,0 +1,117 @@
+import asyncio
+from datetime import timedelta
+
+from app.auth.utils import create_access_token
+from app.middleware.idempotency import IdempotencyMiddleware, IdempotencyStore
+from app.models import SMS, Wallet
+from app.services.batching import sms_batcher
+
+
+class Endpoint:
+    """An ASGI app that answers with the number of times it ran"""
+
+    def __init__(self, status=201):
+        self.status = status
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await receive()
+        await send({"type": "http.response.start", "status": self.status, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": str(self.calls).encode()})
+
+
+def _post(middleware, body=b"{}", key=b"k1", token=None, path="/api/sms/send"):
+    token = token or create_access_token({"sub": "1"})
+    scope = {
+        "type": "http", "method": "POST", "path": path,
+        "headers": [(b"authorization", f"Bearer {token}".encode()), (b"idempotency-key", key)],
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+
+def _middleware(endpoint):
+    return IdempotencyMiddleware(endpoint, store=IdempotencyStore(ttl=60))
+
+
+def test_retry_replays_the_stored_response():
+    endpoint = Endpoint()
+    middleware = _middleware(endpoint)
+    status, headers, body = _post(middleware)
+    assert (status, body) == (201, b"1")
+    assert b"idempotent-replayed" not in headers
+
+    status, headers, body = _post(middleware)
+    assert (status, body) == (201, b"1")
+    assert headers[b"idempotent-replayed"] == b"true"
+    assert endpoint.calls == 1
+
+    # A new key runs the endpoint again
+    assert _post(middleware, key=b"k2")[2] == b"2"
+
+
+def test_reused_key_with_a_different_body_is_rejected():
+    endpoint = Endpoint()
+    middleware = _middleware(endpoint)
+    _post(middleware, body=b'{"amount": 1}')
+    status, _, _ = _post(middleware, body=b'{"amount": 2}')
+    assert status == 422
+    assert endpoint.calls == 1
+
+
+def test_server_errors_are_not_stored():
+    endpoint = Endpoint(status=503)
+    middleware = _middleware(endpoint)
+    _post(middleware)
+    endpoint.status = 201
+    assert _post(middleware) == (201, {b"content-type": b"text/plain"}, b"2")
+
+
+def test_keys_are_scoped_to_the_user_not_the_token():
+    endpoint = Endpoint()
+    middleware = _middleware(endpoint)
+    _post(middleware, token=create_access_token({"sub": "1"}))
+    refreshed = create_access_token({"sub": "1"}, expires_delta=timedelta(hours=2))
+    assert _post(middleware, token=refreshed)[2] == b"1"
+    # Another user with the same key is a different request
+    assert _post(middleware, token=create_access_token({"sub": "2"}))[2] == b"2"
+    assert endpoint.calls == 2
+
+
+def test_other_routes_pass_through():
+    endpoint = Endpoint()
+    middleware = _middleware(endpoint)
+    _post(middleware, path="/api/sims/")
+    _post(middleware, path="/api/sims/")
+    assert endpoint.calls == 2
+
+
+def test_failure_after_commit_is_replayed_without_a_second_debit(client, auth_headers, user, db, monkeypatch):
+    def submit(*args, **kwargs):
+        raise RuntimeError("broker gone")
+
+    monkeypatch.setattr(sms_batcher, "submit", submit)
+    sims = [sim.id for sim in user.sims]
+    headers = {**auth_headers, "Idempotency-Key": "send-1"}
+    body = {"recipient_number": "+15550100001", "content": "hello", "sim_ids": sims}
+
+    first = client.post("/api/sms/send", headers=headers, json=body)
+    assert first.status_code == 200
+    assert {message["status"] for message in first.json()} == {"failed"}
+
+    retry = client.post("/api/sms/send", headers=headers, json=body)
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+
+    assert db.query(SMS).filter(SMS.user_id == user.id).count() == 3
+    assert db.query(Wallet).filter(Wallet.user_id == user.id).one().balance == 97
@@ -0,0 +1,66 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+
+from app.models import Lease
+from app.services.leader import LeaderElector
+
+_names = itertools.count(1)
+
+
+def _electors(count=2):
+    name = f"test-lease-{next(_names)}"
+    return [LeaderElector(name, ttl=30, renew_interval=10) for _ in range(count)]
+
+
+def test_one_holder_at_a_time(db):
+    first, second = _electors()
+    assert first._acquire()
+    assert not second._acquire()
+    # The holder renews, pushing the expiry forward
+    expires_at = db.get(Lease, first.name).expires_at
+    assert first._acquire()
+    db.expire_all()
+    lease = db.get(Lease, first.name)
+    assert lease.holder == first.holder
+    assert lease.expires_at >= expires_at
+
+
+def test_expired_lease_is_taken_over(db):
+    first, second = _electors()
+    assert first._acquire()
+    db.get(Lease, first.name).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert second._acquire()
+    assert not first._acquire()
+    db.expire_all()
+    assert db.get(Lease, first.name).holder == second.holder
+
+
+def test_release_hands_over_immediately():
+    first, second = _electors()
+    assert first._acquire()
+    # Releasing a lease someone else holds does nothing
+    second._release()
+    assert not second._acquire()
+    first._release()
+    assert second._acquire()
+
+
+def test_jobs_follow_leadership():
+    elector, = _electors(1)
+    calls = []
+
+    async def stop_async():
+        calls.append("stop async")
+
+    elector.add_job(lambda: calls.append("start"), stop_async)
+    elector.add_job(lambda: calls.append("start failing") or 1 / 0, lambda: calls.append("stop"))
+
+    asyncio.run(elector._become_leader())
+    assert elector.is_leader and elector.leader_since is not None
+    asyncio.run(elector._step_down())
+    assert not elector.is_leader and elector.status()["leader_since"] is None
+    # A failing job doesn't keep the others from starting, and jobs stop in reverse
+    assert calls == ["start", "start failing", "stop", "stop async"]
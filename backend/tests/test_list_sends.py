@@ -0,0 +1,79 @@
+import uuid
+
+from app.models import ListSend, ListSendStatus, SMS, SMSStatus, Sim
+from app.services.scheduler import scheduled_dispatcher
+from app.services.sms_encoding import decode_frame, encode_frame
+
+
+def _create_list(client, auth_headers, size):
+    numbers = [f"+4479{i:08d}" for i in range(size)]
+    response = client.post("/api/contact-lists/", headers=auth_headers, json={"name": "customers", "numbers": numbers})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_list_send_is_stored_as_one_job_and_expanded_in_chunks(client, auth_headers, user, db):
+    list_id = _create_list(client, auth_headers, 25)
+    sims = [sim.id for sim in user.sims]
+
+    response = client.post("/api/sms/send-list", headers=auth_headers, json={
+        "contact_list_id": list_id, "content": "hello", "sim_ids": sims
+    })
+    assert response.status_code == 200
+    result = response.json()
+    assert result["messages"] == 25 and result["total_cost"] == 25
+    # Nothing is written per number at request time
+    assert db.query(SMS).filter(SMS.user_id == user.id).count() == 0
+    assert client.delete(f"/api/contact-lists/{list_id}", headers=auth_headers).status_code == 409
+
+    assert scheduled_dispatcher._expand(10) == 10
+    job = db.query(ListSend).filter(ListSend.id == result["id"]).one()
+    assert job.position == 10 and job.status == ListSendStatus.SCHEDULED
+
+    while scheduled_dispatcher._expand(10):
+        pass
+    db.expire_all()
+    assert job.position == 25 and job.status == ListSendStatus.DONE
+
+    messages = db.query(SMS).filter(SMS.user_id == user.id).order_by(SMS.id).all()
+    assert len(messages) == 25
+    assert {message.status for message in messages} == {SMSStatus.SCHEDULED}
+    assert [message.recipient_number for message in messages[:2]] == ["+447900000000", "+447900000001"]
+    assert [message.sim_id for message in messages[:4]] == sims + sims[:1]
+    assert messages[3].message_id == str(uuid.uuid5(uuid.UUID(job.batch_id), "3"))
+    assert {message.transaction_id for message in messages} == {result["transaction_id"]}
+
+    shares = {sim.id: sim.messages_used for sim in db.query(Sim).filter(Sim.user_id == user.id)}
+    assert sorted(shares.values()) == [8, 8, 9]
+
+    assert client.delete(f"/api/contact-lists/{list_id}", headers=auth_headers).status_code == 204
+
+
+def test_list_send_over_balance_is_rejected(client, auth_headers, user, db):
+    list_id = _create_list(client, auth_headers, 101)
+    response = client.post("/api/sms/send-list", headers=auth_headers, json={
+        "contact_list_id": list_id, "content": "hello", "sim_ids": [sim.id for sim in user.sims]
+    })
+    assert response.status_code == 400
+    assert db.query(ListSend).filter(ListSend.user_id == user.id).count() == 0
+
+
+def test_expanded_messages_fit_binary_frames(client, auth_headers, user, db):
+    list_id = _create_list(client, auth_headers, 5)
+    response = client.post("/api/sms/send-list", headers=auth_headers, json={
+        "contact_list_id": list_id, "content": "hello", "sim_ids": [sim.id for sim in user.sims]
+    })
+    assert response.status_code == 200
+    while scheduled_dispatcher._expand(10):
+        pass
+
+    messages = db.query(SMS).filter(SMS.user_id == user.id).order_by(SMS.id).all()
+    payloads = [
+        {"message_id": sms.message_id, "number": sms.recipient_number, "sim_number": sms.sender_number, "message": sms.content}
+        for sms in messages
+    ]
+    assert len({payload["message_id"] for payload in payloads}) == 5
+    frame = decode_frame(encode_frame(str(uuid.uuid4()), "edge-1", payloads))
+    assert [(m["message_id"], m["number"], m["message"]) for m in frame["messages"]] == [
+        (payload["message_id"], payload["number"], payload["message"]) for payload in payloads
+    ]
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.config import get_settings
+from app.database import engine
+from app.models import SMS, SMSDirection, SMSStatus, Sim, Transaction, TransactionType
+from app.services.request_stats import NPlusOneDetected, QueryBudgetExceeded, query_budget
+
+settings = get_settings()
+
+
+@pytest.fixture
+def messages(user, db):
+    """Ten sent messages spread over the user's SIMs, each with its own transaction"""
+    sims = db.query(Sim).filter(Sim.user_id == user.id).all()
+    for i in range(10):
+        transaction = Transaction(user_id=user.id, wallet_id=user.wallet.id, amount=-1, type=TransactionType.DEBIT, description="SMS")
+        db.add(transaction)
+        db.flush()
+        db.add(SMS(
+            user_id=user.id,
+            sim_id=sims[i % len(sims)].id,
+            transaction_id=transaction.id,
+            recipient_number="+15551234567",
+            sender_number=sims[i % len(sims)].phone_number,
+            content="hi",
+            status=SMSStatus.SENT,
+            direction=SMSDirection.OUTBOUND
+        ))
+    db.commit()
+
+
+def test_sms_listing_stays_within_budget(client, auth_headers, messages):
+    # User, SMS page and one IN query per nested relationship, whatever the page size
+    with query_budget(6):
+        response = client.get("/api/sms/", headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+
+
+def test_sim_listing_stays_within_budget(client, auth_headers):
+    with query_budget(2):
+        response = client.get("/api/sims/", headers=auth_headers)
+    assert response.status_code == 200
+
+
+def test_query_budget_fails_on_lazy_loading(user, db, messages):
+    with pytest.raises(NPlusOneDetected):
+        with query_budget():
+            for sms in db.query(SMS).filter(SMS.user_id == user.id):
+                sms.transaction.amount
+
+
+def test_query_budget_fails_when_exceeded(db):
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(2):
+            for _ in range(3):
+                db.query(Sim).count()
+
+
+def test_strict_mode_rejects_requests_over_budget(client, auth_headers, messages, monkeypatch):
+    monkeypatch.setattr(settings, "SQL_STRICT", True)
+    monkeypatch.setattr(settings, "SQL_QUERY_BUDGET", 1)
+    response = client.get("/api/sms/", headers=auth_headers)
+    assert response.status_code == 500
+    assert "budget" in response.json()["detail"]
+
+    monkeypatch.setattr(settings, "SQL_QUERY_BUDGET", 50)
+    assert client.get("/api/sms/", headers=auth_headers).status_code == 200
+
+
+def test_failing_statements_leave_no_timing_behind():
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM no_such_table")
+        with query_budget() as stats:
+            conn.exec_driver_sql("SELECT 1")
+        # Nothing piles up on the pooled connection
+        assert isinstance(conn.info["query_started_at"], float)
+    assert stats.queries == 1
+    assert 0 <= stats.db_time < 1
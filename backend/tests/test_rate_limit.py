@@ -0,0 +1,85 @@
+import asyncio
+
+from app.auth.utils import create_access_token
+from app.middleware import rate_limit
+from app.middleware.rate_limit import MemoryRateLimitBackend, RateLimit, RateLimitMiddleware, parse_rate_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _hit(backend, key, limit):
+    return asyncio.run(backend.hit(key, limit))
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits("sms_send=5:20, listing=2.5 ,export=0.1:3")
+    assert limits["sms_send"] == RateLimit(rate=5, burst=20)
+    assert limits["listing"] == RateLimit(rate=2.5, burst=3)
+    assert limits["export"] == RateLimit(rate=0.1, burst=3)
+
+
+def test_zero_rate_leaves_the_group_unlimited():
+    assert parse_rate_limits("auth=0:10,default=0") == {}
+
+
+def test_bucket_allows_the_burst_then_refills_at_the_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    backend = MemoryRateLimitBackend()
+    limit = RateLimit(rate=2, burst=3)
+
+    assert [_hit(backend, "user:1", limit) for _ in range(3)] == [0, 0, 0]
+    assert _hit(backend, "user:1", limit) == 0.5
+    # Other keys have their own bucket
+    assert _hit(backend, "user:2", limit) == 0
+
+    clock.now += 0.5
+    assert _hit(backend, "user:1", limit) == 0
+    clock.now += 100
+    assert [_hit(backend, "user:1", limit) for _ in range(4)][-1] > 0
+
+
+def test_idle_buckets_are_forgotten_beyond_max_keys(monkeypatch):
+    monkeypatch.setattr(rate_limit.time, "monotonic", Clock())
+    backend = MemoryRateLimitBackend(max_keys=2)
+    limit = RateLimit(rate=1, burst=1)
+    _hit(backend, "a", limit)
+    _hit(backend, "b", limit)
+    _hit(backend, "c", limit)
+    assert list(backend._buckets) == ["b", "c"]
+    # A forgotten key starts again with a full bucket
+    assert _hit(backend, "a", limit) == 0
+
+
+def test_middleware_limits_per_user_and_sets_retry_after():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = RateLimitMiddleware(app, limits={"sms_send": RateLimit(rate=0.5, burst=1)}, backend=MemoryRateLimitBackend())
+
+    def request(user_id):
+        token = create_access_token({"sub": str(user_id)})
+        scope = {
+            "type": "http", "method": "POST", "path": "/api/sms/send",
+            "headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("127.0.0.1", 1),
+        }
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(middleware(scope, None, send))
+        return sent[0]
+
+    assert request(1)["status"] == 200
+    rejected = request(1)
+    assert rejected["status"] == 429
+    assert dict(rejected["headers"])[b"retry-after"] == b"2"
+    assert request(2)["status"] == 200
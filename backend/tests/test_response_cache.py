@@ -0,0 +1,64 @@
+import asyncio
+import sys
+
+from app.middleware import response_cache as response_cache_module
+from app.middleware.response_cache import ResponseCacheMiddleware
+
+
+class FakeCache:
+    def __init__(self):
+        self.entries = {}
+
+    def set(self, key, body):
+        self.entries[key] = body
+
+
+def _run(app, path="/"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def _endpoint(cache_key, chunks):
+    async def app(scope, receive, send):
+        if cache_key:
+            scope.setdefault("state", {})["response_cache_key"] = cache_key
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return app
+
+
+def test_cacheable_response_is_stored(monkeypatch):
+    cache = FakeCache()
+    monkeypatch.setattr(response_cache_module, "response_cache", cache)
+    _run(ResponseCacheMiddleware(_endpoint("etag-1", [b"[1,", b"2]"])))
+    assert cache.entries == {"etag-1": b"[1,2]"}
+
+
+def test_streams_are_not_buffered(monkeypatch):
+    cache = FakeCache()
+    monkeypatch.setattr(response_cache_module, "response_cache", cache)
+    held = []
+
+    async def stream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        chunk = b"data: " + b"x" * 64 + b"\n\n"
+        before = sys.getrefcount(chunk)
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        # Nothing between the stream and the client keeps the chunk
+        held.append(sys.getrefcount(chunk) - before)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    _run(ResponseCacheMiddleware(stream), "/api/events/stream")
+    assert held == [1]  # The one in the test's list of sent messages
+    assert cache.entries == {}
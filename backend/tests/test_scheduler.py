@@ -0,0 +1,51 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app.models import SMS, SMSDirection, SMSStatus, Sim, Transaction, TransactionType, Wallet
+from app.services.scheduler import scheduled_dispatcher
+
+
+def _add_sms(db, user, sim_id, status, **fields):
+    sms = SMS(
+        user_id=user.id,
+        sim_id=sim_id,
+        message_id=str(uuid.uuid4()),
+        recipient_number="+15551234567",
+        sender_number="+15550000000",
+        content="hi",
+        price=2,
+        status=status,
+        direction=SMSDirection.OUTBOUND,
+        **fields
+    )
+    db.add(sms)
+    db.commit()
+    return sms
+
+
+def test_stale_claims_are_scheduled_again(user, db):
+    sim = db.query(Sim).filter(Sim.user_id == user.id).first()
+    long_ago = datetime.utcnow() - timedelta(seconds=scheduled_dispatcher.claim_timeout + 60)
+    stale = _add_sms(db, user, sim.id, SMSStatus.PENDING, send_at=long_ago, claimed_at=long_ago)
+    fresh = _add_sms(db, user, sim.id, SMSStatus.PENDING, send_at=long_ago, claimed_at=datetime.utcnow())
+    live = _add_sms(db, user, sim.id, SMSStatus.PENDING)
+
+    assert scheduled_dispatcher.release_stale_claims() == 1
+    db.expire_all()
+    assert stale.status == SMSStatus.SCHEDULED and stale.claimed_at is None
+    assert fresh.status == SMSStatus.PENDING
+    assert live.status == SMSStatus.PENDING
+
+
+def test_claimed_messages_of_deleted_sims_fail_and_are_refunded(user, db):
+    sms = _add_sms(db, user, 999999, SMSStatus.SCHEDULED, send_at=datetime.utcnow() - timedelta(seconds=1))
+
+    claimed = scheduled_dispatcher._claim(1000)
+
+    assert sms.id not in {message["id"] for message in claimed}
+    db.expire_all()
+    assert sms.status == SMSStatus.FAILED
+    assert db.query(Wallet).filter(Wallet.user_id == user.id).one().balance == Decimal("102")
+    refund = db.query(Transaction).filter(Transaction.user_id == user.id).one()
+    assert refund.type == TransactionType.CREDIT and refund.amount == 2
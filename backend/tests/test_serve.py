@@ -0,0 +1,49 @@
+import pytest
+
+import serve
+from app.config import get_settings
+
+
+@pytest.fixture
+def started(monkeypatch):
+    calls = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **kwargs: calls.append(kwargs))
+    # main() hands its decisions to the workers through the environment
+    monkeypatch.setenv("AUTO_CREATE_TABLES", "false")
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    return calls
+
+
+def _share_backends(monkeypatch):
+    settings = get_settings()
+    for name in ("RATE_LIMIT_BACKEND", "IDEMPOTENCY_BACKEND", "VERSION_STORE_BACKEND"):
+        monkeypatch.setattr(settings, name, "redis://localhost:6379/0")
+
+
+def test_memory_backends_default_to_one_worker(started):
+    serve.main()
+    assert started[0]["workers"] == 1
+
+
+def test_several_workers_with_memory_backends_refuse_to_start(started, monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(SystemExit):
+        serve.main()
+    assert started == []
+
+
+def test_shared_backends_default_to_one_worker_per_cpu(started, monkeypatch):
+    _share_backends(monkeypatch)
+    monkeypatch.setattr(serve.os, "cpu_count", lambda: 6)
+    serve.main()
+    assert started[0]["workers"] == 6
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    serve.main()
+    assert started[1]["workers"] == 2
+
+
+def test_rate_limits_need_no_backend_when_disabled(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    assert serve.memory_backends(settings) == ["IDEMPOTENCY_BACKEND", "VERSION_STORE_BACKEND"]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from app.services.sim_health import SimHealthTracker, sim_health
+
+
+def _tracker(**overrides):
+    options = dict(
+        enabled=True, half_life=900, min_samples=3, threshold=0.5,
+        latency_target=60, probe_interval=60, persist_interval=30
+    )
+    options.update(overrides)
+    return SimHealthTracker(**options)
+
+
+class Relay:
+    """Stands in for the broker: every published message reaches every subscriber"""
+
+    def __init__(self):
+        self.handlers = []
+
+    def subscribe(self, topic, handler, shared=True):
+        self.handlers.append(handler)
+
+    def publish_nowait(self, topic, payload):
+        for handler in self.handlers:
+            handler(payload.encode())
+        return True
+
+
+def _fail(tracker, sim_id, times=4):
+    # One more than min_samples, since counts decay between reports
+    for _ in range(times):
+        tracker.record_delivery(sim_id, False, datetime.utcnow(), datetime.utcnow())
+
+
+def test_breaker_opens_below_threshold_and_sheds():
+    tracker = _tracker()
+    assert tracker.admit(1) is None
+    _fail(tracker, 1)
+    assert tracker.is_shed(1)
+    assert tracker.admit(1) == 0
+
+
+def test_probe_is_admitted_once_per_interval():
+    tracker = _tracker(probe_interval=0)
+    _fail(tracker, 1)
+    assert not tracker.is_shed(1)
+    assert tracker.admit(1) == 1
+
+
+def test_probe_delivered_on_another_worker_recovers_every_worker():
+    relay = Relay()
+    opener, other = _tracker(), _tracker()
+    opener.enable_relay(relay)
+    other.enable_relay(relay)
+
+    _fail(opener, 7)
+    assert opener.is_shed(7) and other.is_shed(7)
+
+    # The probe's report is consumed by the worker that didn't open the breaker
+    other.record_delivery(7, True, datetime.utcnow() + timedelta(seconds=1), datetime.utcnow())
+    assert not other.is_shed(7)
+    assert not opener.is_shed(7)
+    assert opener.admit(7) is None
+
+
+def test_rejected_send_keeps_the_probe(client, auth_headers, user, db, monkeypatch):
+    sims = [sim.id for sim in user.sims]
+    monkeypatch.setattr(sim_health, "min_samples", 3)
+    for sim_id in sims:
+        _fail(sim_health, sim_id)
+        # Due a probe
+        sim_health._stats[sim_id].last_probe_at -= sim_health.probe_interval
+    user.wallet.balance = 0
+    db.commit()
+
+    response = client.post("/api/sms/send", headers=auth_headers, json={
+        "recipient_number": "+15551234567", "content": "hi", "sim_ids": sims
+    })
+
+    assert response.status_code == 400
+    assert [sim_health.admit(sim_id) for sim_id in sims] == [1, 1, 1]
@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+from app.models import EdgeSim, Sim
+from app.routers.sims import settings
+from app.services.inventory_sync import inventory_synchronizer
+
+_numbers = itertools.count(1)
+EXPIRY = "2030-01-01T00:00:00"
+
+
+def _sim():
+    n = next(_numbers)
+    return {"iccid": f"8944{n:012d}", "phone_number": f"+4477{n:08d}", "expiry_date": EXPIRY}
+
+
+def test_rows_are_imported_or_rejected_one_by_one(client, auth_headers, user, db):
+    first, second = _sim(), _sim()
+    existing = user.sims[0]
+    rows = [
+        first,
+        {**_sim(), "iccid": first["iccid"]},  # repeats an earlier row's ICCID
+        {**_sim(), "phone_number": existing.phone_number},  # number already taken
+        {"iccid": "89440000", "phone_number": "+447700000000"},  # no expiry date
+        second,
+        {**second, "iccid": _sim()["iccid"]},  # repeats an earlier row's number
+    ]
+    response = client.post("/api/sims/bulk", headers=auth_headers, json=rows)
+    assert response.status_code == 200
+    result = response.json()
+
+    assert result["created"] == 2
+    assert [row["row"] for row in result["results"]] == list(range(6))
+    assert [row["status"] for row in result["results"]] == [
+        "created", "duplicate", "duplicate", "invalid", "created", "duplicate"
+    ]
+    assert "expiry_date" in result["results"][3]["error"]
+    created = {row["iccid"]: row["id"] for row in result["results"] if row["status"] == "created"}
+    stored = dict(db.query(Sim.iccid, Sim.id).filter(Sim.iccid.in_(created)))
+    assert stored == created
+    assert db.query(Sim).filter(Sim.user_id == user.id).count() == 5
+
+    # Importing the same rows again creates nothing
+    again = client.post("/api/sims/bulk", headers=auth_headers, json=[first, second]).json()
+    assert again["created"] == 0
+    assert {row["status"] for row in again["results"]} == {"duplicate"}
+
+
+def test_csv_import(client, auth_headers):
+    sims = [_sim(), _sim()]
+    body = "\ufefficcid,phone_number,expiry_date\n" + "".join(
+        f"{sim['iccid']},{sim['phone_number']},{sim['expiry_date']}\n" for sim in sims
+    )
+    response = client.post("/api/sims/bulk", headers={**auth_headers, "Content-Type": "text/csv"}, content=body.encode())
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert [row["iccid"] for row in response.json()["results"]] == [sim["iccid"] for sim in sims]
+
+
+def test_sims_outside_the_edge_inventory_are_unavailable(client, auth_headers, db, monkeypatch):
+    monkeypatch.setattr(settings, "EDGE_SYNC_ENABLED", True)
+    monkeypatch.setattr(inventory_synchronizer, "_synced", False)
+    offered, other = _sim(), _sim()
+    db.add(EdgeSim(edge="edge1", edge_sim_id=offered["iccid"], phone_number=offered["phone_number"], status="active"))
+    db.commit()
+
+    result = client.post("/api/sims/bulk", headers=auth_headers, json=[offered, other]).json()
+    assert [row["status"] for row in result["results"]] == ["created", "unavailable"]
+
+
+@pytest.mark.parametrize("body, status_code", [(b"{}", 400), (b"not json", 400)])
+def test_malformed_payloads_are_rejected(client, auth_headers, body, status_code):
+    response = client.post("/api/sims/bulk", headers={**auth_headers, "Content-Type": "application/json"}, content=body)
+    assert response.status_code == status_code
+
+
+def test_too_many_rows_are_rejected(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "SIM_IMPORT_MAX_ROWS", 2)
+    response = client.post("/api/sims/bulk", headers=auth_headers, json=[_sim(), _sim(), _sim()])
+    assert response.status_code == 413
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+from app.services.sms_encoding import (
+    GSM7, UCS2, decode_frame, decode_segments, encode_frame, segment_count, split_segments,
+)
+
+
+@pytest.mark.parametrize("text, encoding, count", [
+    ("", GSM7, 1),
+    ("a" * 160, GSM7, 1),
+    ("a" * 161, GSM7, 2),
+    ("a" * 306, GSM7, 2),
+    ("a" * 307, GSM7, 3),
+    ("€" * 80, GSM7, 1),
+    ("€" * 81, GSM7, 2),
+    ("ж" * 70, UCS2, 1),
+    ("ж" * 71, UCS2, 2),
+])
+def test_segment_count(text, encoding, count):
+    assert segment_count(text) == (encoding, count)
+
+
+def test_segments_never_split_escapes_or_surrogate_pairs():
+    # 152 septets then a two septet escape: the escape moves to the next segment
+    encoding, segments = split_segments("a" * 152 + "€" + "a" * 10)
+    assert encoding == GSM7
+    assert [len(segment) for segment in segments] == [152, 12]
+
+    encoding, segments = split_segments("a" * 66 + "😀" + "a" * 5)
+    assert encoding == UCS2
+    assert [len(segment) for segment in segments] == [132, 14]
+    assert decode_segments(encoding, segments) == "a" * 66 + "😀" + "a" * 5
+
+
+@pytest.mark.parametrize("text", ["Hello {world} ~ [1|2] €5\n", "Привет 😀", "x" * 500, ""])
+def test_segments_round_trip(text):
+    assert decode_segments(*split_segments(text)) == text
+
+
+def test_frame_round_trip():
+    batch_id = str(uuid.uuid4())
+    messages = [
+        {"message_id": str(uuid.uuid4()), "number": "+15550001", "sim_number": "+15559999", "message": "Hi €"},
+        {"message_id": str(uuid.uuid4()), "number": "+15550002", "message": "Привет " * 30},
+    ]
+    decoded = decode_frame(encode_frame(batch_id, "edge-1", messages))
+
+    assert decoded["batch_id"] == batch_id
+    assert decoded["edge"] == "edge-1"
+    assert [m["message_id"] for m in decoded["messages"]] == [m["message_id"] for m in messages]
+    assert [m["message"] for m in decoded["messages"]] == [m["message"] for m in messages]
+    assert [m["sim_number"] for m in decoded["messages"]] == ["+15559999", None]
+    assert [m["encoding"] for m in decoded["messages"]] == [GSM7, UCS2]
+    assert len(decoded["messages"][1]["segments"]) == 4
+
+
+def test_frame_without_edge_or_messages():
+    batch_id = str(uuid.uuid4())
+    assert decode_frame(encode_frame(batch_id, None, [])) == {"batch_id": batch_id, "edge": None, "messages": []}
+
+
+def test_truncated_or_unknown_frames_are_rejected():
+    frame = encode_frame(str(uuid.uuid4()), "edge-1", [
+        {"message_id": str(uuid.uuid4()), "number": "+15550001", "message": "Hi"},
+    ])
+    with pytest.raises(ValueError, match="Truncated"):
+        decode_frame(frame[:-1])
+    with pytest.raises(ValueError, match="version"):
+        decode_frame(b"\x02" + frame[1:])
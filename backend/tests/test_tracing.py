@@ -0,0 +1,36 @@
+import uuid
+
+from app.models import MessageTrace
+from app.services.tracing import MessageTracer, _write_traces
+from datetime import timedelta
+
+
+def _trace(db, message_id):
+    db.expire_all()
+    return db.query(MessageTrace).filter(MessageTrace.message_id == message_id).one()
+
+
+def test_late_report_does_not_move_the_trace_status_back(db):
+    message_id = str(uuid.uuid4())
+    _write_traces(db, {message_id: {"status": "delivered"}})
+    db.commit()
+    _write_traces(db, {message_id: {"status": "received"}})
+    db.commit()
+    assert _trace(db, message_id).status == "delivered"
+
+
+def test_delivered_replaces_failed(db):
+    message_id = str(uuid.uuid4())
+    _write_traces(db, {message_id: {"status": "failed"}})
+    db.commit()
+    _write_traces(db, {message_id: {"status": "delivered"}})
+    db.commit()
+    assert _trace(db, message_id).status == "delivered"
+
+
+def test_buffered_reports_keep_the_furthest_status():
+    tracer = MessageTracer(flush_interval=60, retention=timedelta(days=1))
+    tracer.record_status("m1", "delivered")
+    tracer.record_status("m1", "received")
+    assert tracer._pending["m1"]["status"] == "delivered"
+    assert "edge_received_at" in tracer._pending["m1"]